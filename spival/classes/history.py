@@ -1,16 +1,45 @@
 
-from IPython.display import display, HTML
+import datetime
+import hashlib
+import json
+import os
+import pickle
+import sys
+from tempfile import mkstemp
+
+TEST_CACHE_VERSION = 1
+
+#
+# Hashes of the kernel files by path, with the (size, modification time)
+# they were computed for.
+#
+KERNEL_HASHES = {}
+
+#
+# Function receiving the (kind, data) plot artifacts replayed from the test
+# cache, when it is None they are displayed in the notebook.
+#
+ARTIFACT_OUTPUT = None
 
 
 class TestHistory:
     """
     This object is intended to store the test history and results for
     later being displayed on a Jupyter Notebook
+
+    If a ``cache_path`` is provided, the tests run through ``cached`` store
+    their result and plots there, keyed by the test, its parameters and
+    the contents of the kernels it reads, and are not run again while these
+    do not change.
     """
 
-    def __init__(self):
+    def __init__(self, cache_path=None):
 
         self.tests = {}
+        self.cache_path = cache_path
+
+        if self.cache_path and not os.path.isdir(self.cache_path):
+            os.makedirs(self.cache_path)
 
         return
 
@@ -21,7 +50,8 @@ class TestHistory:
                             'description': description,
                             'level': level,
                             'threshold': threshold,
-                            'result': False
+                            'result': False,
+                            'cached': False
                            }
 
         # create hidden HTML Anchor
@@ -39,7 +69,76 @@ class TestHistory:
 
         return
 
+    def cached(self, tag, func, *args, kernels=None, **kwargs):
+        """
+        Return ``func(*args, **kwargs)``, from the test cache if the test
+        ``tag`` already ran with the same parameters and the same contents
+        of the ``kernels`` files. The plots shown by the function are
+        stored with the result and shown again when it is taken from the
+        cache. Results that are None (the test could not be computed) are
+        not cached, neither are the tests with a kernel without path (not
+        found), as the contents they read could not be keyed.
+        """
+        if not self.cache_path or any(not kernel for kernel in (kernels or [])):
+            return func(*args, **kwargs)
+
+        key = get_cache_key(tag, func, args, kwargs, kernels)
+        entry_file = os.path.join(self.cache_path, key + '.pkl')
+
+        entry = read_cache_entry(entry_file)
+        if entry is not None:
+            if tag in self.tests:
+                self.tests[tag]['cached'] = True
+            for kind, data in entry['artifacts']:
+                replay_artifact(kind, data)
+            return entry['result']
+
+        with ArtifactRecorder() as recorder:
+            result = func(*args, **kwargs)
+
+        if result is not None:
+            write_cache_entry(entry_file, {'version': TEST_CACHE_VERSION,
+                                           'tag': tag,
+                                           'created': datetime.datetime.now().strftime("%Y-%m-%dT%H:%M:%S"),
+                                           'result': result,
+                                           'artifacts': recorder.artifacts})
+
+        return result
+
+    def get_results(self):
+        """
+        Return the list of tests with their results, in definition order.
+        """
+        return [dict(self.tests[tag]) for tag in self.tests]
+
+    def write_json(self, json_file, extra=None):
+
+        results = {'tests': self.get_results()}
+        if extra:
+            results.update(extra)
+
+        with open(json_file, 'w') as f:
+            json.dump(results, f, indent=2, default=str)
+
+        return
+
+    def write_html(self, html_file, title=None):
+
+        with open(html_file, 'w') as f:
+            if title:
+                f.write(f"<h1>{title}</h1>\n")
+            f.write("<p>\n" + self.get_html() + "</p>\n")
+
+        return
+
     def show_tests(self, move_to_top=False):
+        from IPython.display import display, HTML
+
+        display(HTML(self.get_html(move_to_top)))
+
+        return
+
+    def get_html(self, move_to_top=False):
 
         html = "<div id='validation_results'>\n"
         html += "   <h1>Validation Results</h1>\n"
@@ -72,10 +171,11 @@ class TestHistory:
             else:
                 html += f"          <td></td>\n"
 
+            cached = " (cached)" if test.get('cached') else ""
             if test['result']:
-                html += f"          <td>OK!</td>\n"
+                html += f"          <td>OK!{cached}</td>\n"
             else:
-                html += f"          <td>FAIL!</td>\n"
+                html += f"          <td>FAIL!{cached}</td>\n"
 
             html += "       </tr>\n"
 
@@ -105,7 +205,177 @@ class TestHistory:
                     '</script>\n'
         """
 
-        display(HTML(html))
+        return html
+
+
+
+class ArtifactRecorder:
+    """
+    Record the plots shown while a test runs: Bokeh figures as standalone
+    HTML and Matplotlib figures as PNG. The figures are still shown.
+    """
+
+    def __init__(self):
+
+        self.artifacts = []
+        self.patched = []
+
+        return
+
+    def __enter__(self):
+
+        try:
+            import bokeh.io
+            import bokeh.plotting
+
+            originals = [bokeh.io.show, bokeh.plotting.show]
+            modules = [bokeh.io, bokeh.plotting]
+            modules += [module for module_name, module in list(sys.modules.items())
+                        if module_name.startswith('spiops') and getattr(module, 'show', None) in originals]
+            for module in modules:
+                self._patch(module, 'show', self._bokeh_recorder(module.show))
+        except ImportError:
+            pass
+
+        if 'matplotlib.pyplot' in sys.modules:
+            plt = sys.modules['matplotlib.pyplot']
+            self._patch(plt, 'show', self._matplotlib_recorder(plt.show))
 
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+
+        for module, attribute, original in reversed(self.patched):
+            setattr(module, attribute, original)
+        self.patched = []
+
+        return False
+
+    def _patch(self, module, attribute, replacement):
+
+        self.patched.append((module, attribute, getattr(module, attribute)))
+        setattr(module, attribute, replacement)
+
+    def _bokeh_recorder(self, show):
+
+        def recorder(obj, *args, **kwargs):
+            try:
+                from bokeh.embed import file_html
+                from bokeh.resources import CDN
+                self.artifacts.append(('html', file_html(obj, CDN)))
+            except Exception as ex:
+                print('Warning: Plot could not be stored in the test cache: ' + str(ex))
+            return show(obj, *args, **kwargs)
+
+        return recorder
+
+    def _matplotlib_recorder(self, show):
+
+        def recorder(*args, **kwargs):
+            import io
+            import matplotlib.pyplot as plt
+            for number in plt.get_fignums():
+                png = io.BytesIO()
+                plt.figure(number).savefig(png, format='png')
+                self.artifacts.append(('png', png.getvalue()))
+            return show(*args, **kwargs)
+
+        return recorder
+
+
+def get_kernel_files(kernels_path, pattern):
+    """
+    Return the sorted paths of the kernels of a kernel directory and its
+    former_versions matching the glob ``pattern``, to key the cache of the
+    tests that look up kernels by pattern.
+    """
+    import glob
+
+    return sorted(glob.glob(os.path.join(kernels_path, pattern)) +
+                  glob.glob(os.path.join(kernels_path, 'former_versions', pattern)))
+
+
+def get_kernel_hash(kernel):
+
+    if not kernel or not os.path.isfile(kernel):
+        return 'missing:' + str(kernel)
+
+    stat = os.stat(kernel)
+    signature = (stat.st_size, stat.st_mtime_ns)
+    cached = KERNEL_HASHES.get(kernel)
+    if cached is not None and cached[0] == signature:
+        return cached[1]
+
+    md5 = hashlib.md5()
+    with open(kernel, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            md5.update(chunk)
+
+    KERNEL_HASHES[kernel] = (signature, md5.hexdigest())
+
+    return KERNEL_HASHES[kernel][1]
+
+
+def get_cache_key(tag, func, args, kwargs, kernels=None):
+
+    function_name = getattr(func, '__module__', '') + '.' + getattr(func, '__qualname__', repr(func))
+    key = json.dumps([TEST_CACHE_VERSION,
+                      tag,
+                      function_name,
+                      repr(args),
+                      repr(sorted(kwargs.items())),
+                      [get_kernel_hash(kernel) for kernel in (kernels or [])]])
+
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+
+def read_cache_entry(entry_file):
+
+    try:
+        with open(entry_file, 'rb') as f:
+            entry = pickle.load(f)
+    except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError):
+        return None
+
+    if not isinstance(entry, dict) or entry.get('version') != TEST_CACHE_VERSION:
+        return None
+
+    return entry
+
+
+def write_cache_entry(entry_file, entry):
+
+    fh, tmp_path = mkstemp(dir=os.path.dirname(entry_file), suffix='.tmp')
+    try:
+        with os.fdopen(fh, 'wb') as f:
+            pickle.dump(entry, f)
+        os.replace(tmp_path, entry_file)
+    except Exception as ex:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        print('Warning: Test result could not be cached: ' + str(ex))
+
+    return
+
+
+def replay_artifact(kind, data):
+
+    if ARTIFACT_OUTPUT is not None:
+        ARTIFACT_OUTPUT(kind, data)
         return
 
+    try:
+        from IPython import get_ipython
+        from IPython.display import display, HTML, Image
+    except ImportError:
+        return
+
+    if get_ipython() is None:
+        return
+
+    if kind == 'html':
+        display(HTML(data))
+    elif kind == 'png':
+        display(Image(data=data))
+
+    return
@@ -0,0 +1,254 @@
+import bisect
+import fnmatch
+import json
+import os
+import re
+
+from spival.utils.files import get_date_from_filename, get_kernel_base_name
+
+FORMER_VERSIONS_DIR = 'former_versions'
+INVENTORY_CACHE_VERSION = 1
+
+
+class KernelInventory:
+    """
+    This object indexes the kernels of a SPICE Kernel Dataset directory
+    (``path``/``type`` and ``path``/``type``/former_versions) once per run,
+    in order to answer the queries of ``get_latest_kernel`` without globbing
+    and sorting the kernel directories on every call.
+
+    If a ``cache_file`` is provided the index is persisted, and later runs
+    only rescan the directories whose modification time has changed.
+    """
+
+    def __init__(self, path, date_formats=None, cache_file=None):
+
+        self.path = path
+        self.date_formats = date_formats if date_formats else []
+        self.cache_file = cache_file
+
+        # Kernel entries per directory relative to path, and sorted
+        # kernel names per (kernel type, former version) index
+        self.directories = {}
+        self.names = {}
+
+        if cache_file and os.path.isfile(cache_file):
+            self.load()
+
+        self.refresh()
+
+        return
+
+    def refresh(self):
+
+        directories = {}
+        for kernel_type, type_path in self._scan_type_directories():
+            for rel_dir, dir_path in [(kernel_type, type_path),
+                                      (kernel_type + '/' + FORMER_VERSIONS_DIR,
+                                       os.path.join(type_path, FORMER_VERSIONS_DIR))]:
+                try:
+                    mtime = os.stat(dir_path).st_mtime_ns
+                except OSError:
+                    continue
+
+                cached = self.directories.get(rel_dir)
+                if cached is not None and cached['mtime'] == mtime:
+                    directories[rel_dir] = cached
+                else:
+                    directories[rel_dir] = {'mtime': mtime,
+                                            'kernels': self._scan_kernels(kernel_type, rel_dir, dir_path)}
+
+        self.directories = directories
+        self._build_index()
+
+        if self.cache_file:
+            self.save()
+
+        return
+
+    def load(self):
+
+        try:
+            with open(self.cache_file, 'r') as f:
+                cache = json.load(f)
+        except (OSError, ValueError):
+            return
+
+        if cache.get('version') == INVENTORY_CACHE_VERSION \
+                and cache.get('path') == os.path.abspath(self.path) \
+                and cache.get('date_formats') == self.date_formats:
+            self.directories = cache['directories']
+
+        return
+
+    def save(self):
+
+        cache = {'version': INVENTORY_CACHE_VERSION,
+                 'path': os.path.abspath(self.path),
+                 'date_formats': self.date_formats,
+                 'directories': self.directories}
+
+        tmp_file = self.cache_file + '.' + str(os.getpid()) + '.tmp'
+        with open(tmp_file, 'w') as f:
+            json.dump(cache, f)
+        os.replace(tmp_file, self.cache_file)
+
+        return
+
+    def get_kernels(self, kernel_type, pattern, mkgen=False):
+        """
+        Return the sorted names of the kernels of ``kernel_type`` matching
+        the fnmatch ``pattern``, including former versions unless ``mkgen``.
+        """
+        kernels = self._match(self.names.get((kernel_type, False), []), pattern)
+        if not mkgen:
+            kernels += self._match(self.names.get((kernel_type, True), []), pattern)
+            kernels.sort()
+
+        return kernels
+
+    def get_latest_kernel(self, kernel_type, pattern, dates=False, excluded_kernels=False, mkgen=False):
+        """
+        Same behaviour as ``files.get_latest_kernel`` but resolved from the
+        index: the latest kernel of ``kernel_type`` matching ``pattern``, or
+        if ``dates`` is set, the latest version of every kernel base name.
+        """
+        if dates or excluded_kernels:
+            kernels = self.get_kernels(kernel_type, pattern, mkgen)
+
+            if excluded_kernels:
+                excluded_tokens = [excluded_kernel.split('*')[0] for excluded_kernel in excluded_kernels]
+                kernels = [kernel for kernel in kernels
+                           if not any(token in kernel for token in excluded_tokens)]
+
+            if not kernels:
+                self._warn_not_found(kernel_type, pattern)
+                return []
+
+            if dates:
+                return self._latest_versions(kernel_type, kernels)
+
+            return kernels[-1]
+
+        latest = self._last_match(self.names.get((kernel_type, False), []), pattern)
+        if not mkgen:
+            former = self._last_match(self.names.get((kernel_type, True), []), pattern)
+            if former is not None and (latest is None or former > latest):
+                latest = former
+
+        if latest is None:
+            self._warn_not_found(kernel_type, pattern)
+            return []
+
+        return latest
+
+    def get_entry(self, kernel_type, name):
+        """
+        Return the index entry of a kernel: type, base name, version, date
+        tokens, location and size.
+        """
+        for rel_dir in [kernel_type, kernel_type + '/' + FORMER_VERSIONS_DIR]:
+            if rel_dir in self.directories and name in self.directories[rel_dir]['kernels']:
+                return self.directories[rel_dir]['kernels'][name]
+
+        return None
+
+    def get_path(self, kernel_type, name):
+        entry = self.get_entry(kernel_type, name)
+        if entry is None:
+            return None
+
+        return os.path.join(self.path, entry['location'], name)
+
+    def _scan_type_directories(self):
+        type_directories = []
+        try:
+            with os.scandir(self.path) as it:
+                for dir_entry in it:
+                    if dir_entry.is_dir():
+                        type_directories.append((dir_entry.name, dir_entry.path))
+        except OSError:
+            pass
+
+        return type_directories
+
+    def _scan_kernels(self, kernel_type, rel_dir, dir_path):
+        kernels = {}
+        with os.scandir(dir_path) as it:
+            for dir_entry in it:
+                if dir_entry.name.startswith('.') or not dir_entry.is_file():
+                    continue
+
+                stat = dir_entry.stat()
+                name = dir_entry.name
+                base, version = get_kernel_base_name(name)
+                kernels[name] = {'name': name,
+                                 'type': kernel_type,
+                                 'base': base,
+                                 'version': version,
+                                 'dates': self._get_dates(name),
+                                 'location': rel_dir,
+                                 'former': rel_dir.endswith(FORMER_VERSIONS_DIR),
+                                 'size': stat.st_size,
+                                 'mtime': stat.st_mtime_ns}
+
+        return kernels
+
+    def _get_dates(self, name):
+        if not self.date_formats:
+            return re.findall(r'(?<!\d)(\d{8})(?!\d)', name)
+
+        try:
+            return [get_date_from_filename(name, self.date_formats).strftime('%Y-%m-%dT%H:%M:%S')]
+        except Exception:
+            return []
+
+    def _warn_not_found(self, kernel_type, pattern):
+        print("WARNING: No " + kernel_type + " kernel matching: " + pattern + " found at: "
+              + os.path.join(self.path, kernel_type))
+
+    def _build_index(self):
+        names = {}
+        for rel_dir in self.directories:
+            kernel_type = rel_dir.split('/')[0]
+            key = (kernel_type, rel_dir.endswith(FORMER_VERSIONS_DIR))
+            names.setdefault(key, []).extend(self.directories[rel_dir]['kernels'].keys())
+
+        for key in names:
+            names[key].sort()
+
+        self.names = names
+
+    def _latest_versions(self, kernel_type, kernels):
+        kernels_date = []
+        previous_base = None
+        for kernel in kernels:
+            entry = self.get_entry(kernel_type, kernel)
+            base = entry['base'] if entry is not None else get_kernel_base_name(kernel)[0]
+            if kernels_date and base == previous_base:
+                kernels_date.pop()
+
+            previous_base = base
+            kernels_date.append(kernel)
+
+        return kernels_date
+
+    @staticmethod
+    def _prefix_range(names, pattern):
+        # Only the names starting with the literal prefix of the pattern can match
+        prefix = re.split(r'[*?\[]', pattern, 1)[0]
+        lo = bisect.bisect_left(names, prefix)
+        hi = bisect.bisect_left(names, prefix + '\U0010ffff', lo)
+        return lo, hi
+
+    def _match(self, names, pattern):
+        lo, hi = self._prefix_range(names, pattern)
+        return [name for name in names[lo:hi] if fnmatch.fnmatchcase(name, pattern)]
+
+    def _last_match(self, names, pattern):
+        lo, hi = self._prefix_range(names, pattern)
+        for idx in range(hi - 1, lo - 1, -1):
+            if fnmatch.fnmatchcase(names[idx], pattern):
+                return names[idx]
+
+        return None
@@ -0,0 +1,88 @@
+from smtplib import SMTP, SMTPRecipientsRefused, SMTPServerDisconnected, SMTPConnectError, SMTPNotSupportedError
+
+
+class Mailer:
+    """
+    This object keeps a single SMTP connection open for all the e-mails of
+    a run. Every e-mail is delivered once to all its recipients, in a single
+    SMTP transaction, and the connection is re-established if the server
+    dropped it.
+
+    The connection is encrypted with STARTTLS, and fails if the server does
+    not offer it, unless ``starttls`` is False (e.g. a local test server).
+    """
+
+    def __init__(self, server, port=25, sender='esa_spice@esa.int', retries=1, timeout=60, starttls=True):
+
+        self.server = server
+        self.port = port
+        self.sender = sender
+        self.retries = retries
+        self.timeout = timeout
+        self.starttls = starttls
+        self.conn = None
+
+        return
+
+    def __enter__(self):
+
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+
+        self.close()
+
+        return False
+
+    def connect(self):
+
+        self.close()
+
+        conn = SMTP(self.server, self.port, timeout=self.timeout)
+        conn.set_debuglevel(False)
+        conn.ehlo()
+
+        if self.starttls:
+            if not conn.has_extn('starttls'):
+                conn.close()
+                raise SMTPNotSupportedError("STARTTLS not offered by the SMTP server: " + str(self.server))
+            conn.starttls()
+            conn.ehlo()
+
+        self.conn = conn
+
+        return
+
+    def send(self, recipients, message):
+        """
+        Send ``message`` (a string with headers and body) to all the valid
+        ``recipients``. Returns the recipients refused by the server.
+        """
+        recipients = [recipient.strip() for recipient in recipients if '@' in recipient]
+        if not recipients:
+            return {}
+
+        for attempt in range(self.retries + 1):
+            try:
+                if self.conn is None:
+                    self.connect()
+                return self.conn.sendmail(self.sender, recipients, message)
+            except SMTPRecipientsRefused as exc:
+                print("Send mail failed; all recipients refused: {}".format(str(exc.recipients)))
+                return exc.recipients
+            except (SMTPServerDisconnected, SMTPConnectError, ConnectionError) as exc:
+                self.conn = None
+                if attempt == self.retries:
+                    raise
+                print("Send mail failed; {}, reconnecting".format(str(exc)))
+
+    def close(self):
+
+        if self.conn is not None:
+            try:
+                self.conn.quit()
+            except Exception:
+                pass
+            self.conn = None
+
+        return
@@ -0,0 +1,200 @@
+import json
+import os
+
+from spival.utils.utils import write_atomic
+
+RELEASE_NOTES_DIR = os.path.join('misc', 'release_notes')
+RELEASE_HISTORY_CACHE_VERSION = 1
+
+#
+# Parsed release notes by absolute path, with the (size, modification time)
+# they were parsed for, shared by the release history index and the checks
+# of the release notes files so that every file is read once per run.
+#
+RELEASE_NOTES_RECORDS = {}
+
+
+def get_text_section(lines, section_name):
+    """
+    Same behaviour as ``files.get_section_text_from_kernel_comments`` on
+    the lines of an already read file.
+    """
+    for idx in range(1, len(lines)):
+        if is_underline(lines[idx]) and lines[idx - 1].startswith(section_name):
+            end = idx + 1
+            while end < len(lines) and not is_underline(lines[end]):
+                end += 1
+            return ''.join(line + '\n' for line in lines[idx + 1:end - 1])
+
+    return ''
+
+
+def is_underline(line):
+    return line.startswith('----') or line.startswith('====')
+
+
+def get_release_history(text):
+    """
+    Return the versions listed in the text of a 'Release History' section,
+    as dicts with the 'version' and its 'date'.
+    """
+    history = []
+    indentation = -1
+    for line in text.splitlines():
+        if indentation < 0:
+            if len(line.strip()) > 0:
+                indentation = len(line) - len(line.lstrip())
+
+        if indentation >= 0:
+            if len(line) - len(line.lstrip()) == indentation:
+                tokens = line.strip().split(" ")
+                if len(tokens) == 4:
+                    if tokens[3].startswith("v") and len(tokens[3].split(".")) == 3:
+                        history.append({'version': tokens[3], 'date': ' '.join(tokens[:3])})
+
+    return history
+
+
+def parse_release_notes_file(path):
+    """
+    Parse a release notes file.
+
+    :return: dict
+       The 'first_line' and the 'version' it ends with, whether the
+       '(<version>)' text is found in the file ('has_version_text'), the
+       'notes' section, '' if not found, and the 'history' of versions of
+       the release history section, None if not found.
+    """
+    with open(path, 'r', errors='replace') as f:
+        text = f.read()
+
+    lines = text.splitlines()
+    first_line = lines[0] if lines else ''
+    version = first_line.split()[-1] if first_line.split() else ''
+
+    history_text = get_text_section(lines, "Appendix: Release History")
+    if not len(history_text):
+        history_text = get_text_section(lines, "Release History")
+
+    return {'first_line': first_line,
+            'version': version,
+            'has_version_text': "(" + version.replace("v", "") + ")" in text,
+            'notes': get_text_section(lines, "Notes"),
+            'history': get_release_history(history_text) if len(history_text) else None}
+
+
+def get_release_notes_record(path):
+    """
+    Return the parsed release notes of a file, parsing it only if it is not
+    known for its current size and modification time.
+    """
+    key = os.path.abspath(path)
+    stat = os.stat(key)
+
+    record = RELEASE_NOTES_RECORDS.get(key)
+    if record is None or (record['size'], record['mtime']) != (stat.st_size, stat.st_mtime_ns):
+        record = parse_release_notes_file(key)
+        record['size'] = stat.st_size
+        record['mtime'] = stat.st_mtime_ns
+        RELEASE_NOTES_RECORDS[key] = record
+
+    return record
+
+
+class ReleaseHistory:
+    """
+    This object indexes the release history of a SPICE Kernel Dataset: the
+    ``version`` file, the meta-kernels of ``path``/mk and every release
+    notes file of ``path``/misc/release_notes parsed once into a record, so
+    that their consistency is checked in memory.
+
+    If a ``cache_file`` is provided the records are persisted, and later
+    runs only parse the release notes files that have changed.
+    """
+
+    def __init__(self, path, cache_file=None):
+
+        self.path = path
+        self.cache_file = cache_file
+        self.release_notes_dir = os.path.join(path, RELEASE_NOTES_DIR)
+
+        # Contents of the version file, None if not found, meta-kernel names
+        # and release notes records by file name
+        self.version = None
+        self.mks = []
+        self.release_notes = {}
+
+        if cache_file and os.path.isfile(cache_file):
+            self.load()
+
+        self.refresh()
+
+        return
+
+    def refresh(self):
+
+        version_file = os.path.join(self.path, 'version')
+        self.version = None
+        if os.path.isfile(version_file):
+            with open(version_file, 'r') as f:
+                self.version = f.read().strip()
+
+        self.mks = sorted(self._scan_files(os.path.join(self.path, 'mk'), '.tm'))
+
+        self.release_notes = {}
+        for name in sorted(self._scan_files(self.release_notes_dir)):
+            self.release_notes[name] = get_release_notes_record(os.path.join(self.release_notes_dir, name))
+
+        if self.cache_file:
+            self.save()
+
+        return
+
+    def load(self):
+
+        try:
+            with open(self.cache_file, 'r') as f:
+                cache = json.load(f)
+        except (OSError, ValueError):
+            return
+
+        if cache.get('version') == RELEASE_HISTORY_CACHE_VERSION \
+                and cache.get('path') == os.path.abspath(self.path):
+            for name, record in cache['release_notes'].items():
+                RELEASE_NOTES_RECORDS.setdefault(os.path.abspath(os.path.join(self.release_notes_dir, name)), record)
+
+        return
+
+    def save(self):
+
+        cache = {'version': RELEASE_HISTORY_CACHE_VERSION,
+                 'path': os.path.abspath(self.path),
+                 'release_notes': self.release_notes}
+
+        write_atomic(self.cache_file, json.dumps(cache))
+
+        return
+
+    def get_current(self):
+        """
+        Return the names of the current release notes files, *_skd_current.txt.
+        """
+        return [name for name in self.release_notes if name.endswith('_skd_current.txt')]
+
+    def get_path(self, name):
+        return os.path.join(self.release_notes_dir, name)
+
+    @staticmethod
+    def _scan_files(dir_path, extension=None):
+        names = []
+        try:
+            with os.scandir(dir_path) as it:
+                for dir_entry in it:
+                    if not dir_entry.name.startswith('.') and dir_entry.is_file() \
+                            and (extension is None
+                                 or os.path.splitext(dir_entry.name)[1].lower() == extension):
+                        names.append(dir_entry.name)
+        except OSError:
+            pass
+
+        return names
@@ -1,27 +1,265 @@
 #!/usr/bin/env python3
 
 import os
-import json
+import sys
 import textwrap
-import traceback
-import glob
 
 from argparse import ArgumentParser, RawDescriptionHelpFormatter
 
-from spival.core.skd import check, validate
-from spival.core.skd import write_ExoMars2016
-from spival.core.skd import write_BepiColombo
-from spival.core.skd import write_JUICE
-from spival.core.skd import write_MarsExpress
-from spival.core.skd import write_SOLO
-from spival.utils import frames
-from spival.utils import coverage
-from spival.utils import utils
-from spival.utils import email
+#
+# The dependencies of every action (SPICE, spiops, GitPython, numpy, ...) are
+# imported in the branch of the action, so that e.g. displaying the version
+# or validating a single file does not pay for the imports of the others.
+#
+
+
+def merge_reports(argv):
+
+    parser = ArgumentParser(prog='spival merge-reports',
+                            description='Combine the partial reports of a sharded validation '
+                                        '(spival -val ... --shard I/N) into the final report.')
+    parser.add_argument('reports',
+                        help='Partial report files of the shards',
+                        nargs='+')
+    parser.add_argument('-o', '--output',
+                        help='JSON summary file of the merged validation',
+                        default=None)
+    args = parser.parse_args(argv)
+
+    from spival.utils.skd_val_logger import merge_partial_reports
+    summary = merge_partial_reports(args.reports, args.output)
+
+    return 0 if summary['valid'] else 1
+
+
+def manifest(argv):
+
+    parser = ArgumentParser(prog='spival manifest',
+                            description='Write the checksum manifest of all the files of an SKD, reusing the '
+                                        'digests of the previous manifest for the files that did not change.')
+    parser.add_argument('skd_path',
+                        help='Root directory of the SKD')
+    parser.add_argument('-o', '--output',
+                        help='Manifest file, read first if it exists to reuse its digests',
+                        default='spival_manifest.json')
+    parser.add_argument('-a', '--algorithm',
+                        help='Checksum algorithm, MD5 as required by PDS or BLAKE2',
+                        choices=['md5', 'blake2b'],
+                        default='md5')
+    parser.add_argument('-cs', '--checksums',
+                        help='Also write the checksums in md5sum format (<digest>  <path>) to this file',
+                        default=None)
+    parser.add_argument('-j', '--jobs',
+                        help='Number of files hashed concurrently',
+                        type=int,
+                        default=None)
+    args = parser.parse_args(argv)
+
+    from spival.utils.manifest import MANIFEST_WORKERS, build_manifest, write_manifest, write_checksums
+
+    exclude = [args.output] + ([args.checksums] if args.checksums else [])
+    skd_manifest = build_manifest(args.skd_path, args.algorithm, previous=args.output,
+                                  workers=args.jobs or MANIFEST_WORKERS, exclude=exclude)
+    write_manifest(skd_manifest, args.output)
+    if args.checksums:
+        write_checksums(skd_manifest, args.checksums)
+
+    print("Info: Manifest of " + str(len(skd_manifest['files'])) + " files written to: " + args.output)
+
+    return 0
+
+
+def archive_lint(argv):
+
+    parser = ArgumentParser(prog='spival archive-lint',
+                            description='Lint the files of a PDS3 SPICE archive: KPL headers, line lengths, '
+                                        'non ASCII characters and label keywords defined in ONLABELS.TXT.')
+    parser.add_argument('archive_path',
+                        help='Root directory of the archive')
+    parser.add_argument('-t', '--template',
+                        help='Label template of the kernels, whose keywords are also checked',
+                        default=None)
+    parser.add_argument('-j', '--jobs',
+                        help='Number of worker processes, all the CPUs by default',
+                        type=int,
+                        default=None)
+    args = parser.parse_args(argv)
+
+    from spival.utils.archive_lint import lint_archive
+
+    return 0 if lint_archive(args.archive_path, template=args.template, processes=args.jobs) else 1
+
+
+def line_endings(argv):
+
+    parser = ArgumentParser(prog='spival line-endings',
+                            description='Normalize the line endings of the products of an archive: CRLF for the '
+                                        'labels and LF for the meta-kernels. Only the files that differ are '
+                                        'rewritten.')
+    parser.add_argument('archive_path',
+                        help='Root directory of the archive')
+    parser.add_argument('-n', '--dry_run',
+                        help='Only report the files that would be rewritten',
+                        action='store_true')
+    parser.add_argument('-j', '--jobs',
+                        help='Number of worker processes, all the CPUs by default',
+                        type=int,
+                        default=None)
+    args = parser.parse_args(argv)
+
+    from spival.utils.line_endings import normalize_line_endings
+
+    normalize_line_endings(args.archive_path, dry_run=args.dry_run, processes=args.jobs)
+
+    return 0
+
+
+def pool_snapshot(argv):
+
+    parser = ArgumentParser(prog='spival pool-snapshot',
+                            description='Write the kernels and the kernel pool variables of a meta-kernel, with all '
+                                        'their values, to a snapshot file, without loading the kernels in SPICE.')
+    parser.add_argument('metakernel',
+                        help='Meta-kernel, its kernels are looked up relative to its directory')
+    parser.add_argument('-o', '--output',
+                        help='Snapshot file, <metakernel>.npz in the current directory by default',
+                        default=None)
+    args = parser.parse_args(argv)
+
+    from spival.utils.pool_snapshot import build_pool_snapshot, write_pool_snapshot
+
+    output = args.output or os.path.splitext(os.path.basename(args.metakernel))[0] + '.npz'
+    snapshot = build_pool_snapshot(args.metakernel)
+    write_pool_snapshot(snapshot, output)
+
+    print("Info: Snapshot of " + str(len(snapshot['kernels'])) + " kernels and " + str(len(snapshot['variables'])) +
+          " variables written to: " + output)
+
+    return 0
+
+
+def pool_diff(argv):
+
+    parser = ArgumentParser(prog='spival pool-diff',
+                            description='Compare the kernels and the kernel pool of two meta-kernels or pool '
+                                        'snapshots (spival pool-snapshot), e.g. of two SKD versions.')
+    parser.add_argument('snapshot_a',
+                        help='Snapshot file or meta-kernel')
+    parser.add_argument('snapshot_b',
+                        help='Snapshot file or meta-kernel')
+    args = parser.parse_args(argv)
+
+    from spival.utils.pool_snapshot import load_pool_snapshot, diff_pool_snapshots, write_pool_diff
+
+    snapshot_a = load_pool_snapshot(args.snapshot_a)
+    snapshot_b = load_pool_snapshot(args.snapshot_b)
+    diff = diff_pool_snapshots(snapshot_a, snapshot_b)
+    write_pool_diff(diff, snapshot_a, snapshot_b)
+
+    return 1 if any(diff.values()) else 0
+
+
+def skd_diff(argv):
+
+    parser = ArgumentParser(prog='spival skd-diff',
+                            description='Report the changes of an SKD between two versions from its git history: '
+                                        'kernels added, removed and modified, kernels added, removed or superseded '
+                                        'in every MK, and kernels moved to former_versions.')
+    parser.add_argument('repo_path',
+                        help='Git repository of the SKD, the current directory by default',
+                        nargs='?',
+                        default='.')
+    parser.add_argument('--from',
+                        help='SKD version (e.g. v420, the latest tag starting with it) or git reference',
+                        dest='from_version',
+                        required=True)
+    parser.add_argument('--to',
+                        help='SKD version or git reference, HEAD by default',
+                        dest='to_version',
+                        default='HEAD')
+    parser.add_argument('-f', '--format',
+                        help='Report format',
+                        choices=['text', 'json'],
+                        default='text')
+    parser.add_argument('-o', '--output',
+                        help='Report file, the standard output by default',
+                        default=None)
+    args = parser.parse_args(argv)
+
+    from spival.utils.skd_diff import build_skd_diff, write_skd_diff
+
+    write_skd_diff(build_skd_diff(args.repo_path, args.from_version, args.to_version), args.format, args.output)
+
+    return 0
+
+
+def skd_version(argv):
+
+    parser = ArgumentParser(prog='spival skd-version',
+                            description='Check the consistency of the version of an SKD: the version file, the '
+                                        'versioned meta-kernels and the release notes of its release history.')
+    parser.add_argument('skd_path',
+                        help='Root directory of the SKD, with the version file')
+    parser.add_argument('-c', '--cache',
+                        help='File to keep the parsed release notes between runs',
+                        default=None)
+    args = parser.parse_args(argv)
+
+    from spival.core.skd_validator import has_valid_skd_version
+    from spival.utils.skd_val_logger import write_file_report
+
+    is_valid = has_valid_skd_version(args.skd_path, cache_file=args.cache)
+    write_file_report(args.skd_path)
+
+    return 0 if is_valid else 1
+
+
+def mk_analysis(argv):
+
+    parser = ArgumentParser(prog='spival mk-analysis',
+                            description='Report the bytes, segments and estimated load time of meta-kernels, the '
+                                        'kernels shadowed by the kernels loaded after them, that could be dropped, '
+                                        'and the coverage gaps of every object, from the DAF descriptors of the '
+                                        'kernels.')
+    parser.add_argument('metakernels',
+                        help='Meta-kernels to analyze',
+                        nargs='+')
+    parser.add_argument('-f', '--format',
+                        help='Report format',
+                        choices=['text', 'json'],
+                        default='text')
+    args = parser.parse_args(argv)
+
+    from spival.utils.mk_analysis import analyze_mk, write_mk_analysis
+
+    for mk in args.metakernels:
+        write_mk_analysis(analyze_mk(mk), args.format)
+
+    return 0
+
+
+#
+# Commands given as first argument, e.g.: spival merge-reports shard_*.json
+#
+COMMANDS = {'merge-reports': merge_reports,
+            'manifest': manifest,
+            'archive-lint': archive_lint,
+            'line-endings': line_endings,
+            'pool-snapshot': pool_snapshot,
+            'pool-diff': pool_diff,
+            'skd-diff': skd_diff,
+            'skd-version': skd_version,
+            'mk-analysis': mk_analysis}
 
 
 def main(config=False, debug=False, log=False, mission=False):
 
+    if len(sys.argv) > 1 and sys.argv[1] in COMMANDS:
+        status = COMMANDS[sys.argv[1]](sys.argv[2:])
+        if status:
+            sys.exit(status)
+        return
+
     execution_dir = os.getcwd()
 
     with open(os.path.dirname(__file__) + '/config/version', 'r') as f:
@@ -59,6 +297,33 @@ def main(config=False, debug=False, log=False, mission=False):
                         help='Validates a file or directory. Could be set multiple times for validate several files. '
                              'e.g: -val file1 -val directory1',
                         action='append')
+    parser.add_argument('-sh', '--shard',
+                        help='Validate only the shard I of N of the files and write a partial report, '
+                             'e.g: -val archive --shard 1/4. Use "spival merge-reports" to combine them',
+                        default=None)
+    parser.add_argument('-sb', '--shard_by',
+                        help='Partition of the files in shards: by hash of their relative path or '
+                             'balanced by file size',
+                        choices=['hash', 'size'],
+                        default='hash')
+    parser.add_argument('-pr', '--partial_report',
+                        help='Partial report file of the shard, spival_shard_<I>_of_<N>.json by default',
+                        default=None)
+    parser.add_argument('-ml', '--max_logs',
+                        help='Maximum number of messages kept per validated file, the rest are only counted',
+                        type=int,
+                        default=None)
+    parser.add_argument('-ql', '--quiet_logs',
+                        help='Do not print the messages while validating, only the reports',
+                        action='store_true')
+    parser.add_argument('-mf', '--manifest',
+                        help='Checksum manifest written by "spival manifest", to report the kernels with the same '
+                             'contents reusing the digests of the files that did not change',
+                        default=None)
+    parser.add_argument('-amk', '--analyze_mks',
+                        help='Report the kernels of the validated meta-kernels shadowed by the kernels loaded '
+                             'after them',
+                        action='store_true')
     parser.add_argument('-ch', '--check',
                         help='Quick check on the current directory',
                         action='store_true')
@@ -87,14 +352,32 @@ def main(config=False, debug=False, log=False, mission=False):
                         help='Report certain messages of the "--frames" execution',
                         action='store_true')
     parser.add_argument('-cf', '--config',
-                        help='Configuration to run full pipeline for a project',
-                        default='stdout')
+                        help='Configuration to run full pipeline for a project. Could be set multiple times, or '
+                             'point to a directory of configurations, to run several projects concurrently. '
+                             'e.g: -cf juice.json -cf bepicolombo.json',
+                        action='append')
+    parser.add_argument('-j', '--jobs',
+                        help='Maximum number of project pipelines running at the same time',
+                        type=int,
+                        default=None)
+    parser.add_argument('-ld', '--log_dir',
+                        help='Directory for the per-project logs when several projects are run',
+                        default=None)
+    parser.add_argument('-hl', '--headless',
+                        help='Run the project tests directly, without Jupyter, writing the results to JSON and HTML',
+                        action='store_true')
+    parser.add_argument('-pl', '--plots',
+                        help='Save the plots of the tests when running headless',
+                        action='store_true')
     parser.add_argument('-pp', '--postprocessing',
                         help='Runs post-processing actions over exported Jupyter Notebooks to HTML',
                         default='stdout')
     parser.add_argument('-em', '--email',
                         help='Send email with Tests Results',
                         action='store_true')
+    parser.add_argument('-dg', '--digest',
+                        help='Send a single email with the Tests Results of all the post-processed files',
+                        action='store_true')
     args = parser.parse_args()
 
     if args.version:
@@ -108,10 +391,12 @@ def main(config=False, debug=False, log=False, mission=False):
     if not args.time: time = False
 
     if args.frames:
+        from spival.utils import frames
         frames.check(mk, time, args.report_frames)
         return
 
     if args.coverage:
+        from spival.utils import coverage
         if args.target_frame != 'stdout':
             target_frame = args.target_frame
             print(type(target_frame))
@@ -121,6 +406,7 @@ def main(config=False, debug=False, log=False, mission=False):
         return
 
     if args.gaps != 'stdout':
+        from spival.utils import coverage
         if args.target_frame != 'stdout':
             target_frame = args.target_frame
         else:
@@ -129,59 +415,60 @@ def main(config=False, debug=False, log=False, mission=False):
         return
 
     if args.check:
+        from spival.core.skd import check
         return check()
 
     if args.validate is not None:
-        return validate(args.validate)
+        from spival.core.skd import validate
+        if args.max_logs is not None:
+            from spival.utils.skd_val_logger import set_max_logs_per_file
+            set_max_logs_per_file(args.max_logs)
+        if args.quiet_logs:
+            from spival.utils.skd_val_logger import set_echo_logs
+            set_echo_logs(False)
+        return validate(args.validate, shard=args.shard, shard_by=args.shard_by,
+                        partial_report=args.partial_report, manifest=args.manifest,
+                        analyze_mks=args.analyze_mks)
 
-    if args.config != 'stdout':
+    if args.config is not None:
         config = args.config
+    elif config:
+        config = [config]
 
     if args.postprocessing != 'stdout':
-        html_files = glob.glob(args.postprocessing)
-        for html_file in html_files:
-            results = utils.post_process_html(html_file)
-            if args.email:
-                email.send_status_email(config, results)
+        from spival.utils.post_processing import post_process_html_files
+        from spival.utils import email
+        processed = post_process_html_files(args.postprocessing)
+        if args.email:
+            config_file = config[0] if config else config
+            if args.digest:
+                email.send_digest_email(config_file, [(html_file, results)
+                                                      for html_file, results in processed if results])
+            else:
+                for html_file, results in processed:
+                    email.send_status_email(config_file, results)
         return
 
     #
-    # We load the configuration
+    # We run the pipeline of each configuration
     #
-    try:
-        if os.path.isabs(config):
-            config_file = config
-        else:
-            config_file = os.path.join(os.getcwd(), config)
-
-        with open(config) as f:
-            try:
-                config = json.load(f)
-                root_dir = os.path.dirname(__file__)
-                config['root_dir'] = root_dir
-                mission = config['mission']
-            except:
-                error_message = str(traceback.format_exc())
-                print("Error: The SPIVAL JSON configuration file has syntactical errors.")
-                print(error_message)
-                raise
-
-            if mission.lower() == 'exomars2016':
-                write_ExoMars2016(config, config_file)
-            if mission.lower() == 'bepicolombo':
-                write_BepiColombo(config, config_file)
-            if mission.lower() == 'juice':
-                write_JUICE(config, config_file)
-            if mission.lower() == 'mars_express':
-                write_MarsExpress(config, config_file)
-            if mission.lower() == 'solar-orbiter':
-                write_SOLO(config, config_file)
-
-    except:
+    if not config:
         #
         # This needs to be completed by a validation of the JSON file
         #
         print('Info: The SPIVAL configuration file has not been provided.')
-        raise
+        return
+
+    from spival.core.pipeline import run_pipelines
+
+    overrides = {}
+    if args.headless:
+        overrides['headless'] = True
+    if args.plots:
+        overrides['headless_plots'] = True
+
+    status = run_pipelines(config, processes=args.jobs, log_dir=args.log_dir, overrides=overrides)
+    if status:
+        sys.exit(status)
 
     return
@@ -0,0 +1,430 @@
+#!/usr/bin/env python3
+
+import ast
+import datetime
+import html
+import json
+import os
+import sys
+import time
+import traceback
+
+from spival.classes import history as test_history_module
+from spival.classes.history import TestHistory
+
+#
+# Headless execution of the mission notebooks: the code cells of a rendered
+# notebook are executed in order in a single namespace, without a Jupyter
+# kernel, nbconvert or HTML post-processing. The TestHistory results are
+# written directly to JSON and HTML.
+#
+# Cells that only produce plots (coverage timelines and the plots of the
+# missions without a TestHistory) are skipped unless plots are requested.
+#
+PLOT_ONLY_CALLS = ['ck_coverage_timeline', 'spk_coverage_timeline', 'Plot']
+SKIPPED_CALLS = ['show_tests']
+
+
+def get_test_suite(notebook):
+    """
+    Derive the declarative test list of a notebook: the tests defined with
+    ``add_test`` and the code steps, each with the test tags it sets with
+    ``set_test_result`` and the title of the markdown section it belongs to.
+
+    :param notebook: dict
+       Notebook as loaded from the .ipynb JSON file.
+    :return: dict
+       With keys ``title``, ``tests`` and ``steps``.
+    """
+    suite = {'title': '', 'tests': [], 'steps': []}
+    section = ''
+
+    for index, cell in enumerate(notebook['cells']):
+        source = ''.join(cell['source'])
+
+        if cell['cell_type'] == 'markdown':
+            if not suite['title']:
+                suite['title'] = source
+            for line in source.splitlines():
+                if line.startswith('#'):
+                    section = line.lstrip('#').strip()
+                    break
+            continue
+
+        if cell['cell_type'] != 'code':
+            continue
+
+        source = _strip_magics(source)
+        calls = _get_calls(source)
+
+        suite['tests'].extend(args[0] for name, args in calls if name == 'add_test' and args)
+        tags = [args[0] for name, args in calls if name == 'set_test_result' and args]
+        names = [name for name, args in calls]
+
+        suite['steps'].append({'index': index,
+                               'section': section,
+                               'source': source,
+                               'tags': tags,
+                               'plot_only': not tags and any(name in PLOT_ONLY_CALLS for name in names),
+                               'skip': any(name in SKIPPED_CALLS for name in names)})
+
+    return suite
+
+
+def run_notebook(notebook_file, output_dir, name=None, plots=False, reuse_kernels=True):
+    """
+    Execute a rendered mission notebook without Jupyter and write the
+    results to ``output_dir``:
+
+       <name>.html           report with the validation results and the
+                             outcome of every step
+       <name>_results.html   validation results only, as produced by the
+                             HTML post-processing for the status email
+       <name>_results.json   validation results and step outcomes
+
+    :param plots: bool
+       If True the plot-only steps are executed and the Bokeh and Matplotlib
+       figures are saved under <name>_plots, otherwise figures are dropped.
+    :param reuse_kernels: bool
+       If True the meta-kernel is not unloaded and reloaded between steps
+       that load the same meta-kernel.
+    :return: dict
+       Results written to the JSON file.
+    """
+    with open(notebook_file, 'r') as f:
+        notebook = json.load(f)
+
+    if name is None:
+        name = os.path.splitext(os.path.basename(notebook_file))[0]
+
+    if not os.path.isdir(output_dir):
+        os.makedirs(output_dir)
+
+    plots_dir = os.path.join(output_dir, name + '_plots') if plots else None
+
+    suite = get_test_suite(notebook)
+    namespace = {'__name__': '__spival_headless__'}
+    steps = []
+
+    print('Info: Running ' + notebook_file + ' headless, ' + str(len(suite['steps'])) + ' steps')
+    run_start = time.perf_counter()
+
+    with PlotCapture(plots_dir) as plot_capture, KernelPoolReuse(reuse_kernels):
+        for step in suite['steps']:
+
+            result = {'index': step['index'],
+                      'section': step['section'],
+                      'tags': step['tags'],
+                      'status': 'SKIPPED',
+                      'elapsed': 0.0,
+                      'error': None,
+                      'plots': []}
+            steps.append(result)
+
+            if step['skip'] or (step['plot_only'] and not plots):
+                continue
+
+            plot_capture.prefix = step['tags'][0] if step['tags'] else 'cell' + str(step['index'])
+
+            start = time.perf_counter()
+            try:
+                code = compile(step['source'], '<' + name + ' cell ' + str(step['index']) + '>', 'exec')
+                exec(code, namespace)
+                result['status'] = 'DONE'
+            except Exception:
+                result['status'] = 'ERROR'
+                result['error'] = traceback.format_exc()
+                print('Error: ' + name + ' cell ' + str(step['index']) + ' ' + str(step['tags']) + ' failed:')
+                print(result['error'])
+
+            result['elapsed'] = time.perf_counter() - start
+            result['plots'] = plot_capture.pop_files()
+
+    history = None
+    for value in namespace.values():
+        if isinstance(value, TestHistory):
+            history = value
+            break
+    if history is None:
+        history = TestHistory()
+
+    results = {'name': name,
+               'notebook': notebook_file,
+               'execution_time': datetime.datetime.now().strftime("%Y-%m-%dT%H:%M:%S"),
+               'elapsed': time.perf_counter() - run_start,
+               'steps': steps}
+
+    history.write_json(os.path.join(output_dir, name + '_results.json'), extra=results)
+    history.write_html(os.path.join(output_dir, name + '_results.html'), title=name)
+    write_report(os.path.join(output_dir, name + '.html'), suite, history, steps, output_dir)
+
+    results['tests'] = history.get_results()
+
+    return results
+
+
+def write_report(html_file, suite, history, steps, output_dir):
+
+    with open(html_file, 'w') as f:
+        f.write("<!DOCTYPE html>\n<html>\n<head>\n<meta charset='utf-8'>\n")
+        f.write("<title>" + html.escape(os.path.splitext(os.path.basename(html_file))[0]) + "</title>\n")
+        f.write("</head>\n<body>\n")
+
+        f.write(_markdown_to_html(suite['title']))
+        f.write("<p>\n" + history.get_html() + "</p>\n")
+
+        f.write("<h2>Steps</h2>\n")
+        f.write("<table style='text-align:left;'>\n")
+        f.write("   <tr><th>Cell</th><th>Section</th><th>Tests</th><th>Status</th><th>Time [s]</th><th>Plots</th></tr>\n")
+        for step in steps:
+            css_style = "color:red;" if step['status'] == 'ERROR' else ""
+            links = ' '.join("<a href='{}'>{}</a>".format(
+                html.escape(os.path.relpath(plot, output_dir)), html.escape(os.path.basename(plot)))
+                for plot in step['plots'])
+            f.write(f"   <tr style='{css_style}'><td>{step['index']}</td><td>{html.escape(step['section'])}</td>"
+                    f"<td>{', '.join(step['tags'])}</td><td>{step['status']}</td>"
+                    f"<td>{step['elapsed']:.1f}</td><td>{links}</td></tr>\n")
+        f.write("</table>\n")
+
+        for step in steps:
+            if step['error']:
+                f.write("<h3>Cell " + str(step['index']) + " - " + html.escape(step['section']) + "</h3>\n")
+                f.write("<pre>" + html.escape(step['error']) + "</pre>\n")
+
+        f.write("</body>\n</html>\n")
+
+    return
+
+
+class PlotCapture:
+    """
+    Replace the Bokeh and Matplotlib ``show`` functions while the notebook
+    steps run, so that figures are saved to ``plots_dir`` (or dropped if it
+    is None) instead of being sent to a notebook frontend.
+    """
+
+    def __init__(self, plots_dir=None):
+
+        self.plots_dir = plots_dir
+        self.prefix = 'plot'
+        self.files = []
+        self.count = 0
+        self.patched = []
+
+        return
+
+    def __enter__(self):
+
+        if self.plots_dir and not os.path.isdir(self.plots_dir):
+            os.makedirs(self.plots_dir)
+
+        # Plots of the tests taken from the TestHistory cache
+        self._patch(test_history_module, 'ARTIFACT_OUTPUT', self._write_artifact)
+
+        try:
+            import matplotlib
+            matplotlib.use('Agg')
+            import matplotlib.pyplot as plt
+            self._patch(plt, 'show', self._show_matplotlib)
+        except ImportError:
+            pass
+
+        try:
+            import bokeh.io
+            import bokeh.plotting
+            original = bokeh.io.show
+            self._patch(bokeh.io, 'show', self._show_bokeh)
+            self._patch(bokeh.plotting, 'show', self._show_bokeh)
+
+            # Modules that already imported the function by name
+            for module_name, module in list(sys.modules.items()):
+                if module_name.startswith('spiops') and getattr(module, 'show', None) is original:
+                    self._patch(module, 'show', self._show_bokeh)
+        except ImportError:
+            pass
+
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+
+        for module, attribute, original in reversed(self.patched):
+            setattr(module, attribute, original)
+        self.patched = []
+
+        return False
+
+    def pop_files(self):
+
+        files = self.files
+        self.files = []
+
+        return files
+
+    def _patch(self, module, attribute, replacement):
+
+        self.patched.append((module, attribute, getattr(module, attribute)))
+        setattr(module, attribute, replacement)
+
+    def _next_file(self, extension):
+
+        self.count += 1
+        plot_file = os.path.join(self.plots_dir, self.prefix + '_' + str(self.count) + extension)
+        self.files.append(plot_file)
+
+        return plot_file
+
+    def _show_bokeh(self, obj, *args, **kwargs):
+
+        if self.plots_dir:
+            from bokeh.io import save
+            from bokeh.resources import CDN
+            save(obj, filename=self._next_file('.html'), resources=CDN, title=self.prefix)
+
+    def _write_artifact(self, kind, data):
+
+        if self.plots_dir:
+            if kind == 'html':
+                with open(self._next_file('.html'), 'w') as f:
+                    f.write(data)
+            elif kind == 'png':
+                with open(self._next_file('.png'), 'wb') as f:
+                    f.write(data)
+
+    def _show_matplotlib(self, *args, **kwargs):
+
+        import matplotlib.pyplot as plt
+        if self.plots_dir:
+            for number in plt.get_fignums():
+                plt.figure(number).savefig(self._next_file('.png'))
+        plt.close('all')
+
+
+class KernelPoolReuse:
+    """
+    The notebook steps load the meta-kernel and clear the kernel pool at
+    the end of every step. While this context is active, clearing the pool
+    is deferred until something else is loaded, and loading again the
+    meta-kernel that is still in the pool is skipped, so that the
+    meta-kernel is only loaded once for consecutive steps using it.
+    """
+
+    def __init__(self, enabled=True):
+
+        self.enabled = enabled
+        self.patched = []
+        self.loaded = None
+        self.clear_pending = False
+
+        return
+
+    def __enter__(self):
+
+        if not self.enabled:
+            return self
+
+        try:
+            import spiceypy
+            from spiops import spiops
+        except ImportError:
+            return self
+
+        self.spiceypy = spiceypy
+        self.kclear = spiceypy.kclear
+        self.furnsh = spiceypy.furnsh
+        self.load = spiops.load
+
+        self._patch(spiceypy, 'kclear', self._kclear)
+        self._patch(spiceypy, 'furnsh', self._furnsh)
+        self._patch(spiops, 'load', self._load)
+
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+
+        for module, attribute, original in reversed(self.patched):
+            setattr(module, attribute, original)
+        self.patched = []
+
+        if self.clear_pending:
+            self.kclear()
+            self.clear_pending = False
+
+        return False
+
+    def _patch(self, module, attribute, replacement):
+
+        self.patched.append((module, attribute, getattr(module, attribute)))
+        setattr(module, attribute, replacement)
+
+    def _flush(self):
+
+        if self.clear_pending:
+            self.kclear()
+            self.clear_pending = False
+        self.loaded = None
+
+    def _kclear(self):
+
+        self.clear_pending = True
+
+    def _furnsh(self, *args, **kwargs):
+
+        self._flush()
+        return self.furnsh(*args, **kwargs)
+
+    def _load(self, mk, *args, **kwargs):
+
+        if self.clear_pending and isinstance(mk, str) and self.loaded is not None \
+                and self.loaded[0] == mk and self.loaded[1] == self.spiceypy.ktotal('ALL'):
+            self.clear_pending = False
+            return None
+
+        self._flush()
+        result = self.load(mk, *args, **kwargs)
+        if isinstance(mk, str):
+            self.loaded = (mk, self.spiceypy.ktotal('ALL'))
+
+        return result
+
+
+def _get_calls(source):
+    #
+    # Name and literal arguments of every call in the source of a cell, the
+    # placeholders of the templates are already replaced at this point.
+    #
+    try:
+        tree = ast.parse(source)
+    except SyntaxError:
+        return []
+
+    calls = []
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Call):
+            if isinstance(node.func, ast.Attribute):
+                name = node.func.attr
+            elif isinstance(node.func, ast.Name):
+                name = node.func.id
+            else:
+                continue
+            args = [arg.value for arg in node.args if isinstance(arg, ast.Constant)]
+            calls.append((name, args))
+
+    return calls
+
+
+def _strip_magics(source):
+    # IPython magics and shell escapes are meaningless outside a kernel
+    return '\n'.join(line for line in source.splitlines() if not line.lstrip().startswith(('%', '!')))
+
+
+def _markdown_to_html(text):
+
+    lines = []
+    for line in text.splitlines():
+        if line.startswith('#'):
+            level = min(len(line) - len(line.lstrip('#')), 6)
+            lines.append('<h{0}>{1}</h{0}>'.format(level, line.lstrip('#').strip()))
+        elif line.strip():
+            lines.append('<p>' + line + '</p>')
+
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+
+import datetime
+import glob
+import json
+import multiprocessing
+import os
+import sys
+import traceback
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+
+MISSION_PIPELINES = {'exomars2016': 'write_ExoMars2016',
+                     'bepicolombo': 'write_BepiColombo',
+                     'juice': 'write_JUICE',
+                     'mars_express': 'write_MarsExpress',
+                     'solar-orbiter': 'write_SOLO'}
+
+
+def get_config_files(config_paths):
+    """
+    Expand the --config arguments: files are kept as they are and for
+    directories all the JSON files in them are taken, in name order.
+    """
+    config_files = []
+    for config_path in config_paths:
+        if os.path.isdir(config_path):
+            config_files.extend(sorted(glob.glob(os.path.join(config_path, '*.json'))))
+        else:
+            config_files.append(config_path)
+
+    return config_files
+
+
+def load_config(config_file):
+
+    if not os.path.isabs(config_file):
+        config_file = os.path.join(os.getcwd(), config_file)
+
+    with open(config_file) as f:
+        try:
+            config = json.load(f)
+            config['root_dir'] = os.path.dirname(os.path.dirname(__file__))
+            config['mission']
+        except:
+            error_message = str(traceback.format_exc())
+            print("Error: The SPIVAL JSON configuration file has syntactical errors.")
+            print(error_message)
+            raise
+
+    return config, config_file
+
+
+def run_pipeline(config_file, update_index=True, overrides=None):
+    """
+    Run the pipeline of the mission of a configuration file. If
+    ``update_index`` is False the HTML status index is not updated, this is
+    left to the caller when several missions are run. The ``overrides``
+    entries, e.g. from command line options, replace the ones of the file.
+    """
+    config, config_file = load_config(config_file)
+    if overrides:
+        config.update(overrides)
+    config['update_index'] = update_index
+
+    mission = config['mission'].lower()
+    if mission in MISSION_PIPELINES:
+        from spival.core import skd
+        getattr(skd, MISSION_PIPELINES[mission])(config, config_file)
+    else:
+        print('Warning: No pipeline defined for mission: ' + config['mission'])
+
+    return config
+
+
+def run_pipelines(config_paths, processes=None, log_dir=None, overrides=None):
+    """
+    Run the pipelines of several missions concurrently. Every mission runs
+    in its own process, because the SPICE kernel pool is global to the
+    process, and writes its output to its own log file. The HTML status
+    index is updated once after all the missions have finished.
+
+    :return: int
+       0 if all the pipelines succeeded, 1 otherwise.
+    """
+    config_files = get_config_files(config_paths)
+    if not config_files:
+        raise Exception('No configuration files found at: ' + str(config_paths))
+
+    if len(config_files) == 1:
+        run_pipeline(config_files[0], overrides=overrides)
+        return 0
+
+    if log_dir is None:
+        log_dir = os.getcwd()
+    if not os.path.isdir(log_dir):
+        os.makedirs(log_dir)
+
+    if processes is None:
+        processes = min(len(config_files), os.cpu_count() or 1)
+
+    timestamp = datetime.datetime.now().strftime("%Y%m%dT%H%M%S")
+    jobs = {}
+    for idx, config_file in enumerate(config_files, 1):
+        jobs[config_file] = get_log_file(log_dir, config_file, timestamp, idx, jobs.values())
+
+    failed = False
+    index_configs = {}
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=processes, mp_context=context) as executor:
+        futures = {executor.submit(_run_pipeline_process, config_file, log_file, overrides): config_file
+                   for config_file, log_file in jobs.items()}
+
+        for future in as_completed(futures):
+            config_file = futures[future]
+            try:
+                config = future.result()
+                if config['mission'].lower() in MISSION_PIPELINES:
+                    index_configs[config['index_path']] = config
+                print('Info: Pipeline finished for ' + config_file + ', log: ' + jobs[config_file])
+            except Exception as ex:
+                failed = True
+                print('Error: Pipeline failed for ' + config_file + ': ' + str(ex) + ', log: ' + jobs[config_file])
+
+    # Update the HTMLs, once per status index
+    if index_configs:
+        from spival.core.skd import update_html
+        for config in index_configs.values():
+            update_html(config)
+
+    return 1 if failed else 0
+
+
+def get_log_file(log_dir, config_file, timestamp, idx, log_files):
+    """
+    Return the log file of a pipeline, named after its configuration file,
+    and also after its index if another configuration file of the same name
+    already has it, so that the concurrent pipelines never share a log.
+    """
+    name = os.path.splitext(os.path.basename(config_file))[0]
+    log_file = os.path.join(log_dir, 'spival_' + name + '_' + timestamp + '.log')
+    while log_file in log_files:
+        name += '_' + str(idx)
+        log_file = os.path.join(log_dir, 'spival_' + name + '_' + timestamp + '.log')
+
+    return log_file
+
+
+def _run_pipeline_process(config_file, log_file, overrides=None):
+    #
+    # Redirect the process output at file descriptor level, so the output of
+    # the NAIF utilities and of the SPICE library also goes to the log.
+    #
+    with open(log_file, 'w') as log:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os.dup2(log.fileno(), 1)
+        os.dup2(log.fileno(), 2)
+
+        try:
+            config = run_pipeline(config_file, update_index=False, overrides=overrides)
+        except Exception:
+            traceback.print_exc()
+            raise
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+
+    return {'mission': config['mission'],
+            'index_path': config['index_path'],
+            'root_dir': config['root_dir']}
@@ -0,0 +1,95 @@
+import hashlib
+import os
+
+from spival.utils.files import get_text_and_data_from_kernel, get_naif_ids_from_text, \
+    get_frames_definitions_from_text
+from spival.utils.skd_utils import FOUND_NAIF_IDS, register_frames, is_fk_file, is_ik_file
+
+#
+# Sharding of the validation of a large file set (e.g. full archives of
+# several missions) across several machines: every shard walks the same
+# paths, keeps its share of the files, deterministically, and writes a
+# partial report that is merged afterwards with ``spival merge-reports``.
+#
+SHARD_BY = ['hash', 'size']
+
+
+def parse_shard(shard):
+    """
+    Parse a shard specification ``I/N``, with I from 1 to N.
+
+    :return: tuple
+       The (I, N) shard index and number of shards.
+    """
+    try:
+        index, shards = [int(value) for value in shard.split('/')]
+    except ValueError:
+        raise Exception("Wrong shard specification, expected I/N e.g.: 1/4, got: " + str(shard))
+
+    if shards < 1 or not 1 <= index <= shards:
+        raise Exception("Wrong shard specification, I shall be between 1 and N, got: " + str(shard))
+
+    return index, shards
+
+
+def get_shard_files(files, relative_paths, index, shards, by='hash'):
+    """
+    Return the files of the shard ``index`` of ``shards``, in the order of
+    ``files``. The partition only depends on the relative paths of the files
+    (to the validated paths) and not on where the archive is mounted:
+
+       hash   the shard of a file is given by the MD5 of its relative path.
+       size   the files, from the largest, are assigned to the shard with
+              less bytes so far, ties are broken by relative path.
+    """
+    if by not in SHARD_BY:
+        raise Exception("Wrong shard partition: " + str(by) + ", expected one of: " + str(SHARD_BY))
+
+    if by == 'hash':
+        return [file for file, relative_path in zip(files, relative_paths)
+                if int(hashlib.md5(relative_path.encode('utf-8')).hexdigest(), 16) % shards == index - 1]
+
+    sizes = []
+    for file, relative_path in zip(files, relative_paths):
+        sizes.append((os.path.getsize(file) if os.path.isfile(file) else 0, relative_path, file))
+
+    loads = [0] * shards
+    shard_files = set()
+    for size, relative_path, file in sorted(sizes, key=lambda item: (-item[0], item[1])):
+        shard = loads.index(min(loads))
+        loads[shard] += size
+        if shard == index - 1:
+            shard_files.add(file)
+
+    return [file for file in files if file in shard_files]
+
+
+def build_registries(files):
+    """
+    Cheap pre-pass over the text FKs and IKs of the whole file set to
+    register the NAIF IDs, frame IDs, frame names and CK IDs they define, so that
+    every shard checks the cross-file references against the same registries
+    regardless of which shard validates the defining kernel. Errors are not
+    reported here, they are reported by the shard validating the file.
+    """
+    for file in files:
+        if os.path.isdir(file) or not (is_fk_file(file) or is_ik_file(file)):
+            continue
+
+        try:
+            data_text, comments = get_text_and_data_from_kernel(file)
+        except Exception:
+            continue
+
+        try:
+            FOUND_NAIF_IDS.extend(get_naif_ids_from_text(data_text))
+        except Exception:
+            pass
+
+        if is_fk_file(file):
+            try:
+                register_frames(get_frames_definitions_from_text(data_text))
+            except Exception:
+                continue
+
+    return
@@ -3,17 +3,16 @@
 import glob
 import math
 import os
+import re
 import datetime
-import shutil
 import traceback
 
-import git
-
-from spiops import spiops
-from spiops.utils.utils import get_latest_kernel, get_sc, get_frame
+from spival.classes.inventory import KernelInventory
+from spival.core.headless import run_notebook
 from spival.core.skd_validator import validate_files
 from spival.utils.skd_val_logger import write_final_report
-from spival.utils.utils import fill_template
+from spival.utils.status_index import update_status_index
+from spival.utils.utils import render_template, write_atomic
 
 
 def prepare_replacements(config, config_file):
@@ -34,10 +33,62 @@ def prepare_replacements(config, config_file):
     now = datetime.datetime.now()
     replacements['current_time'] = now.strftime("%Y-%m-%dT%H:%M:%S")
 
+    # Directory of the TestHistory result cache, disabled if empty
+    replacements['test_cache_path'] = config.get('test_cache_path', '')
+
     return replacements
 
 
+#
+# Replacements with the kernels read by the cached tests, and their type.
+#
+KERNEL_REPLACEMENTS = {'predicted_ck': 'ck',
+                       'measured_ck': 'ck',
+                       'commanded_ck': 'ck',
+                       'crema_ck': 'ck',
+                       'reconstructed_spk': 'spk'}
+
+
+def set_kernel_paths(replacements, inventories):
+    """
+    Add a ``<kernel>_path`` replacement with the full path of every kernel
+    in KERNEL_REPLACEMENTS, looked up in order in the ``inventories``. The
+    paths key the TestHistory result cache of the notebooks.
+    """
+    for key, kernel_type in KERNEL_REPLACEMENTS.items():
+        kernel_path = ''
+        if replacements.get(key):
+            for inventory in inventories:
+                if inventory is not None:
+                    kernel_path = inventory.get_path(kernel_type, replacements[key]) or ''
+                    if kernel_path:
+                        break
+
+        replacements[key + '_path'] = kernel_path
+
+    return replacements
+
+
+def get_inventory(config, path_key):
+    """
+    Build the kernel inventory of the ``path_key`` directory of the
+    configuration (skd_path or staging_path), None if it is not defined. If
+    ``inventory_cache_dir`` is configured the inventory is persisted there.
+    """
+    if path_key not in config:
+        return None
+
+    cache_file = None
+    if 'inventory_cache_dir' in config:
+        cache_file = os.path.join(config['inventory_cache_dir'],
+                                  config['mission'].lower() + '_' + path_key + '_inventory.json')
+
+    return KernelInventory(config[path_key], cache_file=cache_file)
+
+
 def set_measured_dates(replacements, ck_path, config, frame=None):
+    from spiops import spiops
+    from spiops.utils.utils import get_sc, get_frame
 
     if frame is None:
         sc = get_sc(ck_path)
@@ -97,6 +148,7 @@ def set_measured_dates(replacements, ck_path, config, frame=None):
 
 
 def get_dates_from_tags(config, replacements):
+    import git
 
     repo = git.Repo(config['skd_path'][:-7])
     tags = repo.tags
@@ -121,6 +173,38 @@ def get_dates_from_tags(config, replacements):
 
     return replacements
 
+def get_github_replacements(replacements, config):
+    """
+    Return a copy of the replacements for the GitHub notebook: the SKD and
+    meta-kernel of the GitHub repository, and neither the TestHistory cache
+    directory nor the kernel paths that key it, which are local.
+    """
+    github_replacements = dict(replacements)
+    github_replacements['metakernel'] = config['github_skd_path'] + '/mk/' + config['mk']
+    github_replacements['skd_path'] = config['github_skd_path']
+    github_replacements['test_cache_path'] = ''
+    for key in KERNEL_REPLACEMENTS:
+        github_replacements[key + '_path'] = ''
+
+    return github_replacements
+
+
+def check_local_paths(notebook, replacements, config):
+    """
+    Raise an exception if the rendered ``notebook`` contains any of the
+    absolute local directories of the configuration or kernel paths.
+    """
+    local_paths = [config[key] for key in ['skd_path', 'staging_path', 'test_cache_path', 'inventory_cache_dir']
+                   if config.get(key)]
+    local_paths += [replacements[key + '_path'] for key in KERNEL_REPLACEMENTS if replacements.get(key + '_path')]
+
+    found = sorted(set(path for path in local_paths if os.path.isabs(path) and path in notebook))
+    if found:
+        raise Exception("GitHub notebook with local paths: " + ", ".join(found))
+
+    return
+
+
 def create_notebooks(mission, replacements, config):
 
     if "ipynb" in config:
@@ -133,107 +217,130 @@ def create_notebooks(mission, replacements, config):
     #
     output = mission + '_' + replacements['skd_version'] + '.ipynb'
     replacements['skd_path'] = config['skd_path']
-    fill_template(template, output, replacements)
-    shutil.move(output, os.path.join(config['notebooks_path'], output))
+    notebook_file = os.path.join(config['notebooks_path'], output)
+    write_atomic(notebook_file, render_template(template, replacements))
 
     #
-    # Notebook for the GitHub Laboratory
+    # Notebook for the GitHub Laboratory, rendered from the same compiled
+    # template without the local paths and with the test cache disabled
     #
     output = 'index.ipynb'
-    replacements['metakernel'] = config['github_skd_path'] + '/mk/' + config['mk']
-    replacements['skd_path'] = config['github_skd_path']
-    fill_template(template, output, replacements)
-    shutil.move(output, os.path.join(config['notebooks_path'], output))
+    github_replacements = get_github_replacements(replacements, config)
+    github_notebook = render_template(template, github_replacements)
+    check_local_paths(github_notebook, replacements, config)
+    write_atomic(os.path.join(config['notebooks_path'], output), github_notebook)
+
+    #
+    # Run the tests directly instead of leaving the execution and HTML
+    # export of the notebook to Jenkins
+    #
+    if config.get('headless', False):
+        run_notebook(notebook_file, config['index_path'],
+                     name=os.path.splitext(os.path.basename(notebook_file))[0],
+                     plots=config.get('headless_plots', False))
 
 
 def write_ExoMars2016(config, config_file):
+    from spiops import spiops
 
     replacements = prepare_replacements(config, config_file)
     spiops.load(replacements['metakernel'])
+    skd_inventory = get_inventory(config, 'skd_path')
 
     # We obtain the predicted and the measured CKs
-    replacements['predicted_ck'] = get_latest_kernel('ck', config['skd_path'], 'em16_tgo_sc_fsp_*_s????????_v??.bc')
-    replacements['measured_ck'] = get_latest_kernel('ck', config['skd_path'], 'em16_tgo_sc_ssm_*_s????????_v??.bc')
+    replacements['predicted_ck'] = skd_inventory.get_latest_kernel('ck', 'em16_tgo_sc_fsp_*_s????????_v??.bc')
+    replacements['measured_ck'] = skd_inventory.get_latest_kernel('ck', 'em16_tgo_sc_ssm_*_s????????_v??.bc')
 
     replacements = set_measured_dates(replacements, replacements['measured_ck'], config)
 
     replacements = get_dates_from_tags(config, replacements)
 
+    replacements = set_kernel_paths(replacements, [skd_inventory])
+
     create_notebooks('ExoMars2016', replacements, config)
 
     # Update the HTMLs
-    update_html(config)
+    if config.get('update_index', True):
+        update_html(config)
 
     return
 
 
 def write_BepiColombo(config, config_file):
+    from spiops import spiops
 
     replacements = prepare_replacements(config, config_file)
     spiops.load(replacements['metakernel'])
+    skd_inventory = get_inventory(config, 'skd_path')
 
     #
     # We obtain the predicted and the measured CKs
     #
-    replacements['predicted_ck'] = get_latest_kernel('ck', config['skd_path'], 'bc_mpo_sc_fcp_00*.bc')
-    replacements['commanded_ck'] = get_latest_kernel('ck', config['skd_path'], 'bc_mpo_sc_scc_*_s????????_v??.bc')
-    replacements['measured_ck'] = get_latest_kernel('ck', config['skd_path'], 'bc_mpo_sc_scm_*_s????????_v??.bc')
-    replacements['reconstructed_spk'] = get_latest_kernel('spk', config['skd_path'], 'bc_mpo_fcp_0*_v??.bsp')
+    replacements['predicted_ck'] = skd_inventory.get_latest_kernel('ck', 'bc_mpo_sc_fcp_00*.bc')
+    replacements['commanded_ck'] = skd_inventory.get_latest_kernel('ck', 'bc_mpo_sc_scc_*_s????????_v??.bc')
+    replacements['measured_ck'] = skd_inventory.get_latest_kernel('ck', 'bc_mpo_sc_scm_*_s????????_v??.bc')
+    replacements['reconstructed_spk'] = skd_inventory.get_latest_kernel('spk', 'bc_mpo_fcp_0*_v??.bsp')
 
     replacements = set_measured_dates(replacements, replacements['measured_ck'], config)
 
     replacements = get_dates_from_tags(config, replacements)
 
+    replacements = set_kernel_paths(replacements, [skd_inventory])
+
     create_notebooks('BEPICOLOMBO', replacements, config)
 
     # Update the HTMLs
-    update_html(config)
+    if config.get('update_index', True):
+        update_html(config)
 
     return
 
 
 def write_JUICE(config, config_file):
+    from spiops import spiops
 
     replacements = prepare_replacements(config, config_file)
     spiops.load(replacements['metakernel'])
+    skd_inventory = get_inventory(config, 'skd_path')
+    staging_inventory = get_inventory(config, 'staging_path')
     predicted_ck, crema_ck, measured_ck, commanded_ck, reconstructed_spk = '', '', '', '', ''
 
     #
     # We obtain the predicted and the measured CKs
     #
     if 'staging_path' in config:
-        predicted_ck = get_latest_kernel('ck', config['staging_path'], config['predicted_ck'])
+        predicted_ck = staging_inventory.get_latest_kernel('ck', config['predicted_ck'])
     if predicted_ck:
         replacements['predicted_ck'] = predicted_ck
     else:
-        replacements['predicted_ck'] = get_latest_kernel('ck', config['skd_path'], config['predicted_ck'])
+        replacements['predicted_ck'] = skd_inventory.get_latest_kernel('ck', config['predicted_ck'])
 
     ck_path = None
     frame = None
 
     if 'crema_ck' in config:
         if 'staging_path' in config:
-            crema_ck = get_latest_kernel('ck', config['staging_path'], config['crema_ck'])
+            crema_ck = staging_inventory.get_latest_kernel('ck', config['crema_ck'])
         if crema_ck:
             replacements['crema_ck'] = crema_ck
         else:
-            replacements['crema_ck'] = get_latest_kernel('ck', config['skd_path'], config['crema_ck'])
+            replacements['crema_ck'] = skd_inventory.get_latest_kernel('ck', config['crema_ck'])
         ck_path = replacements['crema_ck']
         frame = 'JUICE_SPACECRAFT_PLAN'
 
     if 'measured_ck' in config:
         if 'staging_path' in config:
-            measured_ck = get_latest_kernel('ck', config['staging_path'], config['measured_ck'])
+            measured_ck = staging_inventory.get_latest_kernel('ck', config['measured_ck'])
         if measured_ck:
             replacements['measured_ck'] = measured_ck
         else:
-            replacements['measured_ck'] = get_latest_kernel('ck', config['skd_path'], config['measured_ck'])
+            replacements['measured_ck'] = skd_inventory.get_latest_kernel('ck', config['measured_ck'])
         ck_path = replacements['measured_ck']
         frame = 'JUICE_SPACECRAFT_MEAS'
 
     if 'commanded_ck' in config:
         if 'staging_path' in config:
-            commanded_ck = get_latest_kernel('ck', config['staging_path'], config['commanded_ck'])
+            commanded_ck = staging_inventory.get_latest_kernel('ck', config['commanded_ck'])
         if commanded_ck:
             replacements['commanded_ck'] = commanded_ck
         else:
@@ -241,11 +348,11 @@ def write_JUICE(config, config_file):
         frame = 'JUICE_SPACECRAFT_MEAS'
 
     if 'staging_path' in config:
-        reconstructed_spk = get_latest_kernel('spk', config['staging_path'], config['reconstructed_spk'])
+        reconstructed_spk = staging_inventory.get_latest_kernel('spk', config['reconstructed_spk'])
     if reconstructed_spk:
         replacements['reconstructed_spk'] = reconstructed_spk
     else:
-        replacements['reconstructed_spk'] = get_latest_kernel('spk', config['skd_path'], config['reconstructed_spk'])
+        replacements['reconstructed_spk'] = skd_inventory.get_latest_kernel('spk', config['reconstructed_spk'])
 
     replacements['man_path'] = ""
     if "man_path" in config:
@@ -257,15 +364,19 @@ def write_JUICE(config, config_file):
 
     replacements = set_measured_dates(replacements, ck_path, config, frame)
 
+    replacements = set_kernel_paths(replacements, [staging_inventory, skd_inventory])
+
     create_notebooks('JUICE', replacements, config)
 
     # Update the HTMLs
-    update_html(config)
+    if config.get('update_index', True):
+        update_html(config)
 
     return
 
 
 def write_MarsExpress(config, config_file):
+    from spiops import spiops
 
     replacements = prepare_replacements(config, config_file)
     spiops.load(replacements['metakernel'])
@@ -278,29 +389,35 @@ def write_MarsExpress(config, config_file):
     create_notebooks('MARS-EXPRESS', replacements, config)
 
     # Update the HTMLs
-    update_html(config)
+    if config.get('update_index', True):
+        update_html(config)
 
     return
 
 
 def write_SOLO(config, config_file):
+    from spiops import spiops
 
     replacements = prepare_replacements(config, config_file)
     spiops.load(replacements['metakernel'])
+    skd_inventory = get_inventory(config, 'skd_path')
 
     # We obtain the predicted and the measured CKs
-    replacements['predicted_ck'] = get_latest_kernel('ck', config['skd_path'], config['predicted_ck'])
-    replacements['measured_ck'] = get_latest_kernel('ck', config['skd_path'], config['measured_ck'])
+    replacements['predicted_ck'] = skd_inventory.get_latest_kernel('ck', config['predicted_ck'])
+    replacements['measured_ck'] = skd_inventory.get_latest_kernel('ck', config['measured_ck'])
     ck_path = replacements['measured_ck']
 
-    replacements['reconstructed_spk'] = get_latest_kernel('spk', config['skd_path'], config['reconstructed_spk'])
+    replacements['reconstructed_spk'] = skd_inventory.get_latest_kernel('spk', config['reconstructed_spk'])
 
     replacements = set_measured_dates(replacements, ck_path, config)
 
+    replacements = set_kernel_paths(replacements, [skd_inventory])
+
     create_notebooks('SOLO', replacements, config)
 
     # Update the HTMLs
-    update_html(config)
+    if config.get('update_index', True):
+        update_html(config)
 
     return
 
@@ -330,6 +447,7 @@ def write_SOLO(config, config_file):
 
 
 def check(dir_path=False):
+    from spiops import spiops
 
     if dir_path:
         cwd = dir_path
@@ -357,9 +475,29 @@ def check(dir_path=False):
     return
 
 
-def validate(path_arr=None):
+def get_glob_root(pattern):
+    """
+    Return the directory of the literal part of a glob pattern, before its
+    first wildcard, that the matched files are relative to.
+    """
+    literal = re.split(r'[*?\[]', pattern, maxsplit=1)[0]
+    return os.path.dirname(literal) or '.'
+
+
+def validate(path_arr=None, shard=None, shard_by='hash', partial_report=None, manifest=None, analyze_mks=False):
+    """
+    Validate the files of ``path_arr``. With ``shard``, e.g. '2/8', only the
+    files of that shard are validated and the logs and counters are written
+    to ``partial_report`` (by default spival_shard_<I>_of_<N>.json), to be
+    combined with ``spival merge-reports``. With a checksum ``manifest``
+    (``spival manifest``) the kernels with the same contents are reported,
+    reusing the digests of the files that did not change. With
+    ``analyze_mks`` the kernels of the MKs shadowed by the kernels loaded
+    after them are reported (``spival mk-analysis``).
+    """
     try:
         files = []
+        relative_paths = []
         if path_arr is None:
             path_arr = []
 
@@ -368,7 +506,10 @@ def validate(path_arr=None):
             if "*" in path or "?" in path:
                 if os.path.sep not in path:
                     path = "**/" + path
-                files.extend(list(glob.iglob(path, recursive=True)))
+                matched = list(glob.iglob(path, recursive=True))
+                root = get_glob_root(path)
+                files.extend(matched)
+                relative_paths.extend(os.path.relpath(file, root) for file in matched)
                 continue
 
             if not os.path.exists(path):
@@ -376,18 +517,47 @@ def validate(path_arr=None):
 
             if os.path.isfile(path):
                 files.append(path)
+                relative_paths.append(os.path.basename(path))
 
             elif os.path.isdir(path):
-                files.extend(list(glob.iglob(path + '/**/*', recursive=True)))
+                walked = list(glob.iglob(path + '/**/*', recursive=True))
+                files.extend(walked)
+                relative_paths.extend(os.path.relpath(file, path) for file in walked)
 
         if not(len(files)):
             print("Not any file found matching: " + str(path_arr))
             return 0
 
-        all_files_are_valid = validate_files(files)
+        if shard is not None:
+            from spival.core.shards import parse_shard, get_shard_files, build_registries
+            from spival.utils.skd_val_logger import write_partial_report
+
+            shard_index, shards = parse_shard(shard)
+
+            # The cross-file registries are built from the whole file set
+            build_registries(files)
+
+            files = get_shard_files(files, relative_paths, shard_index, shards, shard_by)
+            print("Info: Validating shard " + str(shard_index) + "/" + str(shards) +
+                  " with " + str(len(files)) + " files.")
+
+        if manifest is not None:
+            from spival.utils.manifest import load_manifest
+            if os.path.exists(manifest):
+                load_manifest(manifest)
+            else:
+                print("Warning: Manifest not found, all the files will be hashed: " + str(manifest))
+
+        all_files_are_valid = validate_files(files, check_duplicates=manifest is not None, analyze_mks=analyze_mks)
 
         write_final_report(path_arr, len(files))
 
+        if shard is not None:
+            if partial_report is None:
+                partial_report = "spival_shard_{}_of_{}.json".format(shard_index, shards)
+            write_partial_report(partial_report, path_arr, len(files), shard_index, shards,
+                                 all_files_are_valid)
+
         if all_files_are_valid:
             print("")
             print("=============================================================")
@@ -420,67 +590,6 @@ def validate(path_arr=None):
 
 def update_html(config):
 
-    cwd = os.getcwd()
-    os.chdir(config['index_path'])
-    em16_in_dir = list(reversed(glob.glob('ExoMars2016_*.html')))
-    bc_in_dir = list(reversed(glob.glob('BEPICOLOMBO_*.html')))
-    juice_in_dir = list(reversed(glob.glob('JUICE_*.html')))
-    mex_in_dir = list(reversed(glob.glob('MARS-EXPRESS_*.html')))
-    solo_in_dir = list(reversed(glob.glob('SOLO_*.html')))
-    adcsng_in_dir = list(reversed(glob.glob('adcsng_v*.html')))
-    root_dir = config['root_dir']
-
-    source = os.listdir(root_dir+'/images/')
-    for files in source:
-        shutil.copy(root_dir+'/images/' + files, config['index_path'])
-
-    shutil.copy(root_dir+'/templates/index.html', config['index_path'])
-    shutil.copy(root_dir+'/templates/spival.html', config['index_path'])
-
-    with open('index_former.html', 'w+') as f:
-        with open(root_dir+'/templates/index_former.html', 'r') as template:
-            for line in template:
-                if '{ExoMars2016}' in line:
-                    if em16_in_dir:
-                        for html in em16_in_dir:
-                            f.write('<p><a href="http://spice.esac.esa.int/status/{}">{}</a></p>'
-                                    .format(html, html.split('.')[0]))
-                elif '{BepiColombo}' in line:
-                    if bc_in_dir:
-                        for html in bc_in_dir:
-                            f.write('<p><a href="http://spice.esac.esa.int/status/{}">{}</a></p>'
-                                    .format(html, html.split('.')[0]))
-                elif '{JUICE}' in line:
-                    if juice_in_dir:
-                        for html in juice_in_dir:
-                            f.write('<p><a href="http://spice.esac.esa.int/status/{}">{}</a></p>'
-                                    .format(html, html.split('.')[0]))
-                elif '{Mars-Express}' in line:
-                    if mex_in_dir:
-                        for html in mex_in_dir:
-                            f.write('<p><a href="http://spice.esac.esa.int/status/{}">{}</a></p>'
-                                    .format(html, html.split('.')[0]))
-                elif '{Solar-Orbiter}' in line:
-                    if solo_in_dir:
-                        for html in solo_in_dir:
-                            f.write('<p><a href="http://spice.esac.esa.int/status/{}">{}</a></p>'
-                                    .format(html, html.split('.')[0]))
-                else:
-                    f.write(line)
-
-    with open('index_adcsng_former.html', 'w+') as f:
-        with open(root_dir + '/templates/index_adcsng_former.html', 'r') as template:
-            for line in template:
-                if '{adcsng}' in line:
-                    if adcsng_in_dir:
-                        for html in adcsng_in_dir:
-                            f.write(
-                                '<p><a href="http://spice.esac.esa.int/status/{}">{}</a></p>'.format(
-                                    html, html))
-                else:
-                    f.write(line)
-
-    os.chdir(cwd)
+    update_status_index(config['index_path'], config['root_dir'])
 
     return
-
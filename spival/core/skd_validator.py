@@ -1,12 +1,14 @@
 import fnmatch
-import glob
 import os
 
 from spival.utils.skd_constants import *
-from spival.utils.files import exceeds_line_lengths, has_badchars, is_empty_file, files_are_equal, is_valid_pds_filename
+from spival.utils.files import exceeds_line_lengths, has_badchars, is_empty_file, files_are_equal, is_valid_pds_filename, \
+    commnt_read_all
 from spival.utils.skd_utils import KERNEL_EXTENSIONS, is_valid_kernel, has_valid_contact_section, get_skd_version, \
-    is_versioned_mk, get_versions_history_from_release_notes_file, check_release_notes_version
-from spival.utils.skd_val_logger import log_error, log_info, write_file_report
+    is_versioned_mk, check_release_notes_version
+from spival.utils.orbnum import is_valid_orbnum_file
+from spival.utils.geometry import check_geometry
+from spival.utils.skd_val_logger import log_error, log_info, log_warn, write_file_report
 
 
 def is_valid_doc_file(file_path):
@@ -66,10 +68,70 @@ def is_kernel_file(file_path):
     return False
 
 
-def validate_files(files):
+def check_duplicated_kernels(files):
+    """
+    Warn about the kernels with the same contents as others, the MKs aside
+    since the unversioned MKs are copies of the versioned ones.
+    """
+    from spival.utils.manifest import get_file_digests, get_duplicated_files
+
+    kernel_files = [filename for filename in files
+                    if is_kernel_file(filename) and str(os.path.splitext(filename)[1]).lower() != ".tm"]
+
+    for duplicated_files in get_duplicated_files(get_file_digests(kernel_files)):
+        for filename in duplicated_files:
+            copies = [os.path.basename(copy) for copy in duplicated_files if copy != filename]
+            log_warn("DUPLICATED_FILE", "Same contents as: {}", filename, ", ".join(copies))
+
+    return
+
+
+def check_mk_analysis(files):
+    """
+    Report the size, segments and estimated load time of the MKs, and warn
+    about their kernels shadowed by the kernels loaded after them.
+    """
+    from spival.utils.mk_analysis import analyze_mk
+
+    for filename in files:
+        if not is_kernel_file(filename) or str(os.path.splitext(filename)[1]).lower() != ".tm":
+            continue
+
+        try:
+            analysis = analyze_mk(filename)
+        except Exception as ex:
+            log_warn("MK_ANALYSIS", "MK not analyzed, exception: {}", filename, str(ex))
+            continue
+
+        log_info("MK_ANALYSIS", "{} kernels, {} bytes, {} segments, estimated load time: {:.3f} s", filename,
+                 len(analysis['kernels']), analysis['bytes'], analysis['segments'], analysis['load_time'])
+        for kernel in analysis['shadowed']:
+            log_warn("MK_ANALYSIS", "Kernel {} is shadowed by the kernels loaded after it and could be dropped",
+                     filename, kernel)
+
+    return
+
+
+def validate_files(files, check_duplicates=False, analyze_mks=False):
 
     all_files_are_valid = True
 
+    # Read the comments of all the binary kernels at once, concurrently
+    commnt_read_all([filename for filename in files
+                     if is_kernel_file(filename)
+                     and str(os.path.splitext(filename)[1]).lower() in KERNEL_BINARY_EXTENSIONS])
+
+    if check_duplicates:
+        check_duplicated_kernels(files)
+
+    if analyze_mks:
+        check_mk_analysis(files)
+
+    # Check the TK frames and FOVs of all the FKs and IKs at once
+    invalid_geometry = check_geometry([filename for filename in files
+                                       if is_kernel_file(filename)
+                                       and str(os.path.splitext(filename)[1]).lower() in (".tf", ".ti")])
+
     # Check contents file by file
     for filename in files:
 
@@ -100,6 +162,16 @@ def validate_files(files):
                         is_valid_file = False
                         log_error("INVALID_KERNEL_FILE", "Invalid kernel file.", filename)
 
+                    elif filename in invalid_geometry:
+                        is_valid_file = False
+                        log_error("INVALID_KERNEL_FILE", "Invalid kernel file.", filename)
+
+                elif extension in ORBNUM_EXTENSIONS:
+
+                    if not is_valid_orbnum_file(filename):
+                        is_valid_file = False
+                        log_error("INVALID_ORBNUM_FILE", "Invalid orbit number file.", filename)
+
                 if is_valid_file:
                     log_info("VALID_FILE", "File is valid.", filename)
 
@@ -115,98 +187,123 @@ def validate_files(files):
     return all_files_are_valid
 
 
-def has_valid_skd_version(skd_path):
+def get_release_notes_version_number(version):
+    """
+    Return the number of an SKD version of the version file (v123) or of the
+    release notes (v1.2.3), None if it is wrongly formatted.
+    """
+    try:
+        return int(version.replace("v", "").replace(".", ""))
+    except ValueError:
+        return None
+
+
+def has_valid_skd_version(skd_path, cache_file=None):
+    """
+    Check the consistency of the version of an SKD: the version file, the
+    versioned MKs, the current release notes and the release notes of every
+    version of its release history. The release notes are parsed once by
+    the release history index, with the records kept in ``cache_file`` if
+    given, and all the inconsistencies are reported.
+    """
+    from spival.classes.release_history import ReleaseHistory
+
+    release_history = ReleaseHistory(skd_path, cache_file=cache_file)
+    is_valid = True
+
     try:
         # Get skd version from version file
         skd_version = get_skd_version(skd_path)
     except Exception as ex:
         log_error("SKD_VERSION", "Error obtaining SKD Version: " + str(ex), skd_path)
-        return False
+        skd_version = None
+        is_valid = False
 
     # Check that all MKs have the correct SKD version
     # note that the MK validity is done by is_valid_metakernel()
-    all_mk_files = list(glob.iglob(skd_path + '/**/*.tm', recursive=True))
-    all_mk_files += list(glob.iglob(skd_path + '/**/*.TM', recursive=True))
-    mk_files = [mk.replace(skd_path + "/", "") for mk in all_mk_files if is_versioned_mk(mk)]
-
-    mks_has_valid_versions = True
-    for mk_file in mk_files:
-        mk_filename = os.path.basename(mk_file)
-        if skd_version not in str(os.path.splitext(mk_filename)[0]).lower():
-            log_error("SKD_VERSION", "MK file: '" + str(mk_file) + "' has not the expected SKD version: " + skd_version,
-                      skd_path)
-            mks_has_valid_versions = False
+    if skd_version is not None:
+        for mk_filename in release_history.mks:
+            if is_versioned_mk(mk_filename) and skd_version not in str(os.path.splitext(mk_filename)[0]).lower():
+                log_error("SKD_VERSION", "MK file: 'mk/" + mk_filename + "' has not the expected SKD version: " +
+                          skd_version, skd_path)
+                is_valid = False
 
     # Check that all the release notes files are named properly,
     # note that the release notes files validity is done by is_valid_doc_file()
-    release_notes_dir = os.path.join(skd_path, "misc/release_notes")
-    if not os.path.exists(release_notes_dir) or not os.path.isdir(release_notes_dir):
+    release_notes_dir = release_history.release_notes_dir
+    if not os.path.isdir(release_notes_dir):
         log_error("SKD_VERSION", "Release notes path doesn\'t exist or is not a directory: " + str(release_notes_dir),
                   skd_path)
         return False
 
-    skd_current_path = list(glob.iglob(release_notes_dir + '/*_skd_current.txt', recursive=False))
-    if len(skd_current_path) == 0:
+    current_files = release_history.get_current()
+    if len(current_files) == 0:
         log_error("SKD_VERSION", "Current release notes file not found at path: " + str(release_notes_dir), skd_path)
         return False
-    elif len(skd_current_path) > 1:
+    elif len(current_files) > 1:
         log_error("SKD_VERSION", "More than one files matches *_skd_current.txt in release notes path: " +
                   str(release_notes_dir), skd_path)
-        return False
+        is_valid = False
 
-    # Check that latest release notes exists and is equal to current, note this is a workaround
-    # to commented section below that actually checks all release notes and looks for unexpected files
-    skd_current_path = skd_current_path[0]
-    skd_current_filename = os.path.basename(skd_current_path)
-    version_int = int(skd_version.replace("v", ""))
-    rel_note_filename = skd_current_filename.replace("current", "{:03d}".format(version_int))
-    rel_note_filepath = os.path.join(release_notes_dir, rel_note_filename)
-    release_notes_files = [skd_current_filename ]
-    all_release_notes_found = True
-    if not os.path.exists(rel_note_filepath):
-        log_error("SKD_VERSION", "Release notes file: " + rel_note_filename + " not found at path: "
-                  + str(release_notes_dir), skd_path)
-        all_release_notes_found = False
-    else:
-        release_notes_files.append(rel_note_filename)
-
-        # Check tha current release notes files is aligned with latest release notes file
-        if not files_are_equal(rel_note_filepath, skd_current_path):
-            log_error("SKD_VERSION", "Release notes file: " + rel_note_filename + " is not equal to: "
-                      + str(skd_current_filename), skd_path)
-            all_release_notes_found = False
+    skd_current_filename = current_files[0]
+    skd_current = release_history.release_notes[skd_current_filename]
+    release_notes_files = set(current_files)
+
+    # Check that the current release notes are the ones of the SKD version
+    # and equal to its release notes file
+    if skd_version is not None:
+        version_int = get_release_notes_version_number(skd_version)
+        if get_release_notes_version_number(skd_current['version']) != version_int:
+            log_error("SKD_VERSION", "Current release notes version: " + skd_current['version'] +
+                      " doesn't match the SKD version: " + skd_version, skd_path)
+            is_valid = False
+
+        rel_note_filename = skd_current_filename.replace("current", "{:03d}".format(version_int))
+        if rel_note_filename not in release_history.release_notes:
+            log_error("SKD_VERSION", "Release notes file: " + rel_note_filename + " not found at path: "
+                      + str(release_notes_dir), skd_path)
+            is_valid = False
+        else:
+            release_notes_files.add(rel_note_filename)
+
+            # Check tha current release notes files is aligned with latest release notes file
+            if not files_are_equal(release_history.get_path(rel_note_filename),
+                                   release_history.get_path(skd_current_filename)):
+                log_error("SKD_VERSION", "Release notes file: " + rel_note_filename + " is not equal to: "
+                          + str(skd_current_filename), skd_path)
+                is_valid = False
 
     # Check that all release notes exists
-    versions = get_versions_history_from_release_notes_file(skd_current_path)
-    for version in versions:
-        try:
-            version_int = int(version.replace("v", "").replace(".", ""))
-        except:
-            log_error("SKD_VERSION", "Wrong version " + version + " retrieved from: "
-                      + skd_current_path + " Release History section", skd_path)
-            all_release_notes_found = False
+    history = skd_current['history']
+    if history is None:
+        log_error("WRONG_RELEASE_NOTES", "No 'Release History' section found in kernel: " +
+                  release_history.get_path(skd_current_filename), skd_path)
+        history = []
+        is_valid = False
+
+    for entry in history:
+        version_int = get_release_notes_version_number(entry['version'])
+        if version_int is None:
+            log_error("SKD_VERSION", "Wrong version " + entry['version'] + " retrieved from: "
+                      + skd_current_filename + " Release History section", skd_path)
+            is_valid = False
             continue
 
         rel_note_filename = skd_current_filename.replace("current", "{:03d}".format(version_int))
-        rel_note_filepath = os.path.join(release_notes_dir, rel_note_filename)
-        if not os.path.exists(rel_note_filepath):
-            log_error("SKD_VERSION", "Release notes file: " + rel_note_filename + " not found at path: " +
-                      str(release_notes_dir), skd_path)
-            all_release_notes_found = False
+        if rel_note_filename not in release_history.release_notes:
+            log_error("SKD_VERSION", "Release notes file: " + rel_note_filename + " of " + entry['version'] +
+                      " (" + entry['date'] + ") not found at path: " + str(release_notes_dir), skd_path)
+            is_valid = False
         else:
-            release_notes_files.append(rel_note_filename)
+            release_notes_files.add(rel_note_filename)
 
     # Check that in the release_notes directory that are no unexpected files
-    all_files = list(glob.iglob(release_notes_dir + '/*', recursive=True))
-    unexpected_files = [file
-                        for file in all_files
-                        if os.path.basename(file) not in release_notes_files]
-
-    for unexpected_file in unexpected_files:
-        log_error("SKD_VERSION",  "Unexpected file: " + os.path.basename(unexpected_file) + " found at path: " +
-                  str(release_notes_dir) + "\n       Or the corresponding version of " +
-                  os.path.basename(unexpected_file) + " is not present at " + skd_current_filename
-                  + " Release History section", skd_path)
-        all_release_notes_found = False
-
-    return mks_has_valid_versions and all_release_notes_found
+    for filename in release_history.release_notes:
+        if filename not in release_notes_files:
+            log_error("SKD_VERSION",  "Unexpected file: " + filename + " found at path: " +
+                      str(release_notes_dir) + "\n       Or the corresponding version of " +
+                      filename + " is not present at " + skd_current_filename
+                      + " Release History section", skd_path)
+            is_valid = False
+
+    return is_valid
@@ -0,0 +1,55 @@
+"""
+Check of the CK segment validation of a CK whose instrument is neither
+defined at the validated frame kernels nor in the kernel pool: the
+instrument is resolved with SPICE, and reported as unknown instead of
+failing the validation.
+
+   python ck_segments_check.py
+"""
+import os
+import sys
+import tempfile
+
+import numpy as np
+import spiceypy
+
+from spival.utils.segments import check_ck_segments
+from spival.utils.skd_val_logger import get_logs
+
+UNREGISTERED_INSTRUMENT = -999123
+
+
+def write_ck(ck_path, instrument):
+    """
+    Write a single segment type 3 CK of ``instrument`` with a constant
+    attitude with respect to J2000.
+    """
+    sclkdp = np.linspace(0.0, 1.0e6, 11)
+    quats = np.tile([1.0, 0.0, 0.0, 0.0], (len(sclkdp), 1))
+    avvs = np.zeros((len(sclkdp), 3))
+
+    handle = spiceypy.ckopn(ck_path, 'SPIVAL CHECK', 0)
+    try:
+        spiceypy.ckw03(handle, sclkdp[0], sclkdp[-1], instrument, 'J2000', True, 'SPIVAL CHECK',
+                       len(sclkdp), sclkdp, quats, avvs, 1, sclkdp[:1])
+    finally:
+        spiceypy.ckcls(handle)
+
+
+if __name__ == '__main__':
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        ck_path = os.path.join(tmp_dir, 'spival_check_v01.bc')
+        write_ck(ck_path, UNREGISTERED_INSTRUMENT)
+
+        is_valid = check_ck_segments(ck_path)
+        logs = get_logs(ck_path)
+
+    for log in logs:
+        print('      ' + ' - '.join(log))
+
+    is_reported = any('Unknown object ID: ' + str(UNREGISTERED_INSTRUMENT) in log[2] for log in logs)
+    print('CK with unregistered instrument: ' + ('VALID' if is_valid else 'INVALID') +
+          (', instrument reported as unknown' if is_reported else ', instrument NOT reported'))
+
+    sys.exit(0 if is_valid and is_reported else 1)
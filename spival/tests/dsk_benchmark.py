@@ -0,0 +1,117 @@
+"""
+Throughput benchmark of the DSK validation: writes synthetic type 2 DSKs
+of a tessellated sphere of increasing size, validates them and reports
+the throughput and the peak of memory allocated by the validation, which
+shall not grow with the size of the file.
+
+   python dsk_benchmark.py [max_plates]
+"""
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import spiceypy
+
+from spival.utils.dsk import is_valid_dsk_kernel
+from spival.utils.skd_val_logger import get_logs
+
+MAX_PLATES = 4000000
+RADIUS = 10.0
+
+
+def get_sphere(n_plates):
+    """
+    Return the vertices and the plates (1-based vertex indices) of a sphere
+    tessellated in latitude and longitude with about ``n_plates`` plates.
+    """
+    n_lon = max(int(np.sqrt(n_plates / 2.0)), 4)
+    n_lat = max(n_plates // (2 * n_lon), 2)
+
+    lat = np.linspace(-np.pi / 2, np.pi / 2, n_lat + 1)[1:-1]
+    lon = np.linspace(0.0, 2 * np.pi, n_lon, endpoint=False)
+    lat, lon = np.meshgrid(lat, lon, indexing='ij')
+    rings = np.stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)], axis=-1).reshape(-1, 3)
+    vertices = RADIUS * np.vstack([[0.0, 0.0, -1.0], rings, [0.0, 0.0, 1.0]])
+
+    n_rings = n_lat - 1
+    ring = np.arange(n_lon)
+    following = (ring + 1) % n_lon
+
+    plates = [np.stack([np.zeros(n_lon, dtype=int), 1 + following, 1 + ring], axis=1)]
+    for idx in range(n_rings - 1):
+        lower, upper = 1 + idx * n_lon, 1 + (idx + 1) * n_lon
+        plates.append(np.stack([lower + ring, lower + following, upper + following], axis=1))
+        plates.append(np.stack([lower + ring, upper + following, upper + ring], axis=1))
+    top, last = len(vertices) - 1, 1 + (n_rings - 1) * n_lon
+    plates.append(np.stack([np.full(n_lon, top), last + ring, last + following], axis=1))
+
+    return vertices, np.vstack(plates) + 1
+
+
+def write_dsk(dsk_path, vertices, plates):
+    """
+    Write a single segment type 2 DSK of Mars latitudinal coordinates, with
+    the spatial index built by SPICE.
+    """
+    n_vertices, n_plates = len(vertices), len(plates)
+
+    # Workspace and spatial index sizes for the plates of the sphere
+    worksz = 20 * n_plates + 100000
+    voxpsz = 2 * n_plates + 100000
+    voxlsz = 20 * n_plates + 100000
+    spxisz = 100007 + voxpsz + voxlsz + 2 * n_vertices + 3 * n_plates + 1
+
+    spaixd, spaixi = spiceypy.dskmi2(vertices, plates, 5.0, 4, worksz, voxpsz, voxlsz, True, spxisz)
+
+    corpar = np.zeros(10)
+    min_radius, max_radius = spiceypy.dskrb2(vertices, plates, 1, corpar)
+
+    handle = spiceypy.dskopn(dsk_path, 'SPIVAL BENCHMARK', 0)
+    try:
+        spiceypy.dskw02(handle, 499, 1, 1, 'IAU_MARS', 1, corpar, -np.pi, np.pi, -np.pi / 2, np.pi / 2,
+                        min_radius, max_radius, -1.0e10, 1.0e10, vertices, plates, spaixd, spaixi)
+    finally:
+        spiceypy.dskcls(handle, True)
+
+
+def benchmark(dsk_path, n_plates):
+
+    # SPICE does not overwrite the DSK of the previous size
+    if os.path.exists(dsk_path):
+        os.remove(dsk_path)
+
+    vertices, plates = get_sphere(n_plates)
+    write_dsk(dsk_path, vertices, plates)
+    size_mb = os.path.getsize(dsk_path) / 1.0e6
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    is_valid = is_valid_dsk_kernel(dsk_path)
+    elapsed = time.perf_counter() - start
+    peak_mb = tracemalloc.get_traced_memory()[1] / 1.0e6
+    tracemalloc.stop()
+
+    print('{:>10} plates {:8.1f} MB {:8.2f} s {:8.1f} MB/s  peak memory {:6.1f} MB  {}'.format(
+        len(plates), size_mb, elapsed, size_mb / elapsed, peak_mb, 'VALID' if is_valid else 'INVALID'))
+    if not is_valid:
+        for log in get_logs(dsk_path):
+            print('      ' + ' - '.join(log))
+
+    return is_valid
+
+
+if __name__ == '__main__':
+
+    max_plates = int(sys.argv[1]) if len(sys.argv) > 1 else MAX_PLATES
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        n_plates = 10000
+        while n_plates <= max_plates:
+            results.append(benchmark(os.path.join(tmp_dir, 'spival_benchmark_v01.bds'), n_plates))
+            n_plates *= 4
+
+    sys.exit(0 if all(results) else 1)
@@ -0,0 +1,102 @@
+"""
+Startup benchmark of the SPIVAL command line: measures with
+``python -X importtime`` the time spent importing modules for the
+``-v`` and ``-val <text kernel>`` actions and fails if it exceeds the
+budget.
+
+   python startup_benchmark.py [budget_ms]
+"""
+import os
+import subprocess
+import sys
+import tempfile
+
+BUDGET_MS = 300
+RUNS = 3
+
+TEXT_KERNEL = """KPL/FK
+
+   Startup benchmark frame kernel.
+
+\\begindata
+
+   FRAME_SPIVAL_BENCHMARK     = -999000
+   FRAME_-999000_NAME         = 'SPIVAL_BENCHMARK'
+   FRAME_-999000_CLASS        = 4
+   FRAME_-999000_CLASS_ID     = -999000
+   FRAME_-999000_CENTER       = 399
+   TKFRAME_-999000_RELATIVE   = 'J2000'
+   TKFRAME_-999000_SPEC       = 'ANGLES'
+   TKFRAME_-999000_UNITS      = 'DEGREES'
+   TKFRAME_-999000_AXES       = ( 3, 2, 1 )
+   TKFRAME_-999000_ANGLES     = ( 0.0, 0.0, 0.0 )
+
+\\begintext
+"""
+
+
+def get_import_times(args):
+    """
+    Run the SPIVAL command line with ``args`` and return the cumulative
+    import times in microseconds of the top level imports, by module.
+    """
+    code = 'import sys; sys.argv = ["spival"] + sys.argv[1:]; ' \
+           'from spival.command_line import main; main()'
+    process = subprocess.run([sys.executable, '-X', 'importtime', '-c', code] + args,
+                             stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+
+    import_times = {}
+    for line in process.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_time, cumulative, module = line[len('import time:'):].split('|')
+        # Nested imports are indented below their parent
+        if not module.startswith('  '):
+            name = module.strip()
+            import_times[name] = import_times.get(name, 0) + int(cumulative)
+
+    return import_times
+
+
+def get_baseline():
+    # Modules imported by the interpreter itself at startup
+    process = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'pass'],
+                             stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    return set(line.split('|')[-1].strip() for line in process.stderr.splitlines()
+               if line.startswith('import time:'))
+
+
+def benchmark(name, args, baseline, budget_ms):
+
+    best = None
+    for run in range(RUNS):
+        import_times = {module: time for module, time in get_import_times(args).items()
+                        if module not in baseline}
+        total = sum(import_times.values()) / 1000.0
+        if best is None or total < best[0]:
+            best = (total, import_times)
+
+    total, import_times = best
+    status = 'OK' if total <= budget_ms else 'OVER BUDGET'
+    print('{:<24} {:8.1f} ms  (budget {} ms) {}'.format(name, total, budget_ms, status))
+    for module, time in sorted(import_times.items(), key=lambda item: -item[1])[:5]:
+        print('      {:<40} {:8.1f} ms'.format(module, time / 1000.0))
+
+    return total <= budget_ms
+
+
+if __name__ == '__main__':
+
+    budget_ms = int(sys.argv[1]) if len(sys.argv) > 1 else BUDGET_MS
+
+    baseline = get_baseline()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        text_kernel = os.path.join(tmp_dir, 'spival_benchmark_v01.tf')
+        with open(text_kernel, 'w') as f:
+            f.write(TEXT_KERNEL)
+
+        results = [benchmark('spival -v', ['-v'], baseline, budget_ms),
+                   benchmark('spival -val <text kernel>', ['-val', text_kernel], baseline, budget_ms)]
+
+    sys.exit(0 if all(results) else 1)
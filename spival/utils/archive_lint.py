@@ -0,0 +1,161 @@
+import os
+
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from spival.utils.skd_val_logger import log_error, log_warn, write_file_report, write_final_report
+
+#
+# Lint of PDS3 SPICE archives. The archive is walked once and every file is
+# read once, by a pool of worker processes; the checks of a file run on its
+# bytes with NumPy (non ASCII characters and line lengths at once for the
+# whole file) and return their findings, that are logged by the parent
+# process with the standard logger.
+#
+ARCHIVE_LINT_CHECKS = ['first_line', 'line_length', 'non_ascii', 'label_keywords']
+
+# Files without text checks, and text kernels that start with KPL/<type>
+ARCHIVE_BINARY_EXTENSIONS = ('.BSP', '.BC', '.BDS', '.BPC', '.BES', '.ORB', '.TAB', '.DS_STORE')
+ARCHIVE_KPL_EXTENSIONS = ('.TF', '.TI', '.TLS', '.TSC', '.TPC')
+ARCHIVE_LABEL_EXTENSIONS = ('.LBL',)
+
+# Characters per line, without the line terminator
+ARCHIVE_MAX_LINE_LENGTH = 78
+
+ONLABELS_PATH = os.path.join('DOCUMENT', 'ONLABELS.TXT')
+ONLABELS_DEFINITIONS = 'Definition of Keywords/Values for SPICE Kernels'
+
+LOG_FUNCTIONS = {'Error': log_error, 'Warning': log_warn}
+
+
+def get_onlabels_keywords(onlabels_path):
+    """
+    Return the set of keywords defined in the definitions section of the
+    ONLABELS.TXT of an archive.
+    """
+    keywords = set()
+    inside_definitions = False
+    with open(onlabels_path, 'r', errors='replace') as f:
+        for line in f:
+            if ONLABELS_DEFINITIONS in line:
+                inside_definitions = True
+            if inside_definitions and line[:3] == '   ' and not line[:10] == '          ' and len(line) > 10:
+                keywords.add(line.strip().split(' ')[0])
+
+    return keywords
+
+
+def lint_file(path, checks=ARCHIVE_LINT_CHECKS, keywords=None, is_label=None):
+    """
+    Run the checks on the contents of a file.
+
+    :return: list
+       The findings, as (level, log type, message template, args) tuples.
+    """
+    name = os.path.basename(path).upper()
+    if name.endswith(ARCHIVE_BINARY_EXTENSIONS):
+        return []
+
+    with open(path, 'rb') as f:
+        content = f.read()
+
+    data = np.frombuffer(content, dtype=np.uint8)
+    newlines = np.flatnonzero(data == 10)
+    findings = []
+
+    if 'first_line' in checks and name.endswith(ARCHIVE_KPL_EXTENSIONS):
+        first_line = content[:newlines[0]] if len(newlines) else content
+        if b'KPL' not in first_line:
+            findings.append(('Error', 'WRONG_KERNEL_HEADER', "First line: '{}' is not a KPL header",
+                             (first_line.decode('ascii', errors='replace').strip(),)))
+
+    if 'line_length' in checks:
+        starts = np.concatenate([[0], newlines + 1])
+        ends = np.concatenate([newlines, [len(data)]])
+        lengths = ends - starts
+        has_cr = (lengths > 0) & (data[np.maximum(ends - 1, 0)] == 13) if len(data) else lengths > 0
+        lengths = lengths - has_cr
+        for idx in np.flatnonzero(lengths > ARCHIVE_MAX_LINE_LENGTH):
+            findings.append(('Error', 'EXCEEDS_LINE_LENGTH', "Line of {} characters, more than {} on line: {}",
+                             (int(lengths[idx]), ARCHIVE_MAX_LINE_LENGTH, int(idx) + 1)))
+
+    if 'non_ascii' in checks:
+        bad = np.flatnonzero(((data < 32) | (data > 126)) & (data != 10) & (data != 13))
+        if len(bad):
+            line_indexes = np.searchsorted(newlines, bad)
+            for line_idx in np.unique(line_indexes):
+                start = int(newlines[line_idx - 1]) + 1 if line_idx else 0
+                end = int(newlines[line_idx]) if line_idx < len(newlines) else len(data)
+                line = content[start:end].decode('utf-8', errors='replace')
+                characters = sorted(set(char for char in line if not ' ' <= char <= '~' and char != '\r'))
+                findings.append(('Error', 'BAD_CHAR', "Non ASCII characters: {} on line: {}",
+                                 (' '.join(repr(char) for char in characters), int(line_idx) + 1)))
+
+    if 'label_keywords' in checks and keywords is not None \
+            and (is_label if is_label is not None else name.endswith(ARCHIVE_LABEL_EXTENSIONS)):
+        missing = []
+        for line_nr, line in enumerate(content.decode('ascii', errors='replace').splitlines(), 1):
+            if '=' in line:
+                keyword = line.split('=')[0].replace(' ', '')
+                if keyword not in keywords and keyword not in missing:
+                    missing.append(keyword)
+                    findings.append(('Warning', 'LABEL_KEYWORDS', "Keyword {} not defined in ONLABELS.TXT on "
+                                     "line: {}", (keyword, line_nr)))
+
+    return findings
+
+
+def lint_file_task(task):
+    path, checks, keywords, is_label = task
+    try:
+        return lint_file(path, checks, keywords, is_label)
+    except Exception as ex:
+        return [('Error', 'INVALID_DOC_FILE', "Reading file: {}", (str(ex),))]
+
+
+def lint_archive(archive_path, template=None, checks=ARCHIVE_LINT_CHECKS, processes=None):
+    """
+    Lint all the files of a PDS3 archive and, if given, the label template
+    of the kernels, against the keywords of its DOCUMENT/ONLABELS.TXT.
+
+    :return: bool
+       True if no errors were found.
+    """
+    if not os.path.isdir(archive_path):
+        raise Exception("Archive path is not a directory: " + str(archive_path))
+
+    keywords = None
+    if 'label_keywords' in checks:
+        onlabels_path = os.path.join(archive_path, ONLABELS_PATH)
+        if os.path.exists(onlabels_path):
+            keywords = get_onlabels_keywords(onlabels_path)
+        else:
+            log_warn("LABEL_KEYWORDS", "Label keywords not checked, ONLABELS.TXT not found", onlabels_path)
+
+    files = []
+    for root, dirs, names in os.walk(archive_path):
+        dirs.sort()
+        files.extend(os.path.join(root, name) for name in sorted(names))
+
+    tasks = [(path, checks, keywords, None) for path in files]
+    if template is not None:
+        tasks.append((template, ['label_keywords'], keywords, True))
+
+    if len(tasks) < 2 or processes == 1:
+        results = [lint_file_task(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            results = list(executor.map(lint_file_task, tasks, chunksize=max(len(tasks) // 64, 1)))
+
+    is_valid = True
+    for (path, task_checks, task_keywords, is_label), findings in zip(tasks, results):
+        for level, l_type, message, args in findings:
+            LOG_FUNCTIONS[level](l_type, message, path, *args)
+            if level == 'Error':
+                is_valid = False
+        write_file_report(path)
+
+    write_final_report([archive_path], len(files))
+
+    return is_valid
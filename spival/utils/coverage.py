@@ -1,45 +1,35 @@
 import os
-import io
-import spiceypy
-import numpy as np
+import re
 
-import gnuplotlib as gp
-import more_itertools as mit
-import matplotlib.pyplot as plt
-
-
-import subprocess
-
-from io import StringIO
-import sys
+from spival.utils.runner import run_command
 
 
 
 def gaps(object_frame, target_frame='J2000', minimum_duration='',
          mk='', lsk='', sclk='', fk='', ck=''):
+    import numpy as np
+    import spiceypy
+    import gnuplotlib as gp
 
     if mk:
-        kernels = mk
+        kernels = [mk]
         kernel = mk.split(os.sep)[-1]
         spiceypy.furnsh(mk)
     else:
-        kernels = f'{lsk} {sclk} {fk} {ck}'
+        kernels = [lsk, sclk, fk, ck]
         kernel = ck.split(os.sep)[-1]
         spiceypy.furnsh(lsk)
 
-    if minimum_duration:
-        minimum_duration = "| grep -v ' 0:0[0123]:'"
-
-    command = f"frmdiff -k {kernels} -t dumpg -f1 {target_frame} -t1 {object_frame} -f YYYY-MM-DDTHR:MN:SC ::UTC  {minimum_duration}"
-    print(command)
-    command_line_process = subprocess.Popen(command, shell=True,
-                                            stdout=subprocess.PIPE,
-                                            stderr=subprocess.STDOUT)
-
-    process_output, _ = command_line_process.communicate()
+    command = ['frmdiff', '-k'] + kernels + ['-t', 'dumpg', '-f1', target_frame, '-t1', object_frame,
+                                             '-f', 'YYYY-MM-DDTHR:MN:SC', '::UTC']
+    print(" ".join(command))
+    process_output = run_command(command)["stdout"]
 
     frmdiff_output = process_output.decode("utf-8")
     frmdiff_output = frmdiff_output.split('\n')
+    if minimum_duration:
+        # Gaps shorter than 4 minutes are not reported
+        frmdiff_output = [line for line in frmdiff_output if not re.search(' 0:0[0123]:', line)]
     gap_durations = []
     for line in frmdiff_output:
         if "#    from" in line and 'TDB seconds' in line:
@@ -0,0 +1,175 @@
+import mmap
+import os
+import struct
+
+import numpy as np
+
+#
+# Reader of the segment summaries of DAF files (binary SPKs, CKs and PCKs)
+# that walks the summary and name records of the memory mapped file, so
+# that the segment descriptors can be checked without loading the kernel in
+# the SPICE kernel pool. Only the summary records are read, regardless of
+# the size of the segments data.
+#
+#    Record 1 (file record): IDWORD, ND, NI, IFNAME, FWARD, BWARD, FREE,
+#                            LOCFMT, ...
+#    Summary records:        NEXT, PREV, NSUM, NSUM summaries of ND
+#                            doubles and NI integers (packed in doubles)
+#
+DAF_RECORD_SIZE = 1024
+DAF_WORD_SIZE = 8
+
+DAF_BYTE_ORDERS = {'LTL-IEEE': '<', 'BIG-IEEE': '>'}
+
+
+def read_daf_summaries(daf_path):
+    """
+    Read the file record and the segment summaries of a DAF.
+
+    :return: dict
+       The 'idword', 'nd', 'ni', internal file name 'ifname', binary format
+       'locfmt', number of 'words' of the file and the 'summaries', a list
+       of (doubles, integers) tuples in the order of the file.
+    """
+    with open(daf_path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size < DAF_RECORD_SIZE:
+            raise Exception("File shorter than a DAF file record: " + daf_path)
+
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            daf = read_daf_file_record(data, size, daf_path)
+
+            nd, ni = daf['nd'], daf['ni']
+            summary_format = daf['byte_order'] + str(nd) + 'd' + str(ni) + 'i'
+            summary_bytes = struct.calcsize(summary_format)
+
+            summaries = []
+            for offset, n_summaries in iter_summary_records(data, daf, size, daf_path):
+                for idx in range(n_summaries):
+                    start = offset + 24 + idx * daf['summary_size'] * DAF_WORD_SIZE
+                    values = struct.unpack(summary_format, data[start:start + summary_bytes])
+                    summaries.append((values[:nd], values[nd:]))
+
+    daf['summaries'] = summaries
+
+    return daf
+
+
+def read_daf_descriptors(daf_path):
+    """
+    Read the file record, the segment descriptors and the segment names of
+    a DAF as NumPy arrays, a block per summary record, so that files with
+    many segments are read in a time proportional to the number of summary
+    records.
+
+    :return: dict
+       The same entries as ``read_daf_summaries`` but, instead of the
+       summaries, the 'doubles' (segments x ND) and 'integers' (segments x
+       NI) arrays of the descriptors and the 'names' of the segments.
+    """
+    with open(daf_path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size < DAF_RECORD_SIZE:
+            raise Exception("File shorter than a DAF file record: " + daf_path)
+
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            daf = read_daf_file_record(data, size, daf_path)
+
+            nd, ni, byte_order = daf['nd'], daf['ni'], daf['byte_order']
+            summary_dtype = np.dtype({'names': ['doubles', 'integers'],
+                                      'formats': [(byte_order + 'f8', (nd,)), (byte_order + 'i4', (ni,))],
+                                      'offsets': [0, nd * DAF_WORD_SIZE],
+                                      'itemsize': daf['summary_size'] * DAF_WORD_SIZE})
+            name_dtype = np.dtype('S' + str(daf['summary_size'] * DAF_WORD_SIZE))
+
+            blocks = []
+            names = []
+            for offset, n_summaries in iter_summary_records(data, daf, size, daf_path):
+                blocks.append(np.frombuffer(data, summary_dtype, count=n_summaries, offset=offset + 24).copy())
+                if offset + DAF_RECORD_SIZE + n_summaries * name_dtype.itemsize <= size:
+                    names.append(np.frombuffer(data, name_dtype, count=n_summaries,
+                                               offset=offset + DAF_RECORD_SIZE).copy())
+
+    summaries = np.concatenate(blocks) if blocks else np.zeros(0, dtype=summary_dtype)
+
+    daf['doubles'] = summaries['doubles'].reshape(-1, nd)
+    daf['integers'] = summaries['integers'].reshape(-1, ni)
+    daf['names'] = [name.decode('ascii', errors='replace').strip() for name in np.concatenate(names)] \
+        if names else []
+
+    return daf
+
+
+def read_daf_file_record(data, size, daf_path=''):
+
+    idword = data[0:8].decode('ascii', errors='replace')
+    if not idword.startswith('DAF/') and not idword.startswith('NAIF/DAF'):
+        raise Exception("Not a DAF file, ID word: '" + idword.strip() + "' of: " + daf_path)
+
+    locfmt = data[88:96].decode('ascii', errors='replace')
+    byte_order = DAF_BYTE_ORDERS.get(locfmt)
+    if byte_order is None:
+        # Files older than the LOCFMT entry, guess the order from ND
+        byte_order = '<' if 0 < struct.unpack('<i', data[8:12])[0] < 125 else '>'
+        locfmt = 'LTL-IEEE' if byte_order == '<' else 'BIG-IEEE'
+
+    nd, ni = struct.unpack(byte_order + '2i', data[8:16])
+    ifname = data[16:76].decode('ascii', errors='replace').strip()
+    fward, bward, free = struct.unpack(byte_order + '3i', data[76:88])
+
+    if not 0 < nd <= 124 or not 2 <= ni <= 250:
+        raise Exception("Wrong number of double (ND: " + str(nd) + ") or integer (NI: " + str(ni) +
+                        ") components of the summaries of: " + daf_path)
+
+    return {'idword': idword,
+            'nd': nd,
+            'ni': ni,
+            'ifname': ifname,
+            'locfmt': locfmt,
+            'byte_order': byte_order,
+            'fward': fward,
+            'free': free,
+            'summary_size': nd + (ni + 1) // 2,
+            'words': size // DAF_WORD_SIZE}
+
+
+def iter_summary_records(data, daf, size, daf_path=''):
+    """
+    Walk the doubly linked list of summary records of a DAF, yielding the
+    byte offset and the number of summaries of every record.
+    """
+    byte_order = daf['byte_order']
+    max_summaries = (DAF_RECORD_SIZE // DAF_WORD_SIZE - 3) // daf['summary_size']
+
+    visited = set()
+    record = daf['fward']
+    while record > 0:
+        if record in visited or record * DAF_RECORD_SIZE > size:
+            raise Exception("Wrong summary record: " + str(record) + " in the summary list of: " + daf_path)
+        visited.add(record)
+
+        offset = (record - 1) * DAF_RECORD_SIZE
+        next_record, previous_record, n_summaries = struct.unpack(byte_order + '3d', data[offset:offset + 24])
+        if not 0 <= n_summaries <= max_summaries:
+            raise Exception("Wrong number of summaries: " + str(n_summaries) + " in record: " + str(record) +
+                            " of: " + daf_path)
+
+        yield offset, int(n_summaries)
+
+        record = int(next_record)
+
+    return
+
+
+def get_intervals_union(intervals):
+    """
+    Return the union of a list of (start, end) intervals, sorted.
+    """
+    union = []
+    for start, end in sorted(intervals):
+        if union and start <= union[-1][1]:
+            union[-1][1] = max(union[-1][1], end)
+        else:
+            union.append([start, end])
+
+    return [tuple(interval) for interval in union]
@@ -0,0 +1,196 @@
+import mmap
+import os
+import struct
+
+import numpy as np
+
+#
+# Reader of DAS files (DSKs) over a memory map. The directory records are
+# walked once to map the logical addresses of every data type to the byte
+# offsets of their clusters of records, and the data is then read as NumPy
+# views of the mapped file, so that the memory used does not depend on the
+# size of the file.
+#
+#    Record 1 (file record): IDWORD, IFNAME, NRESVR, NRESVC, NCOMR, NCOMC,
+#                            FORMAT, ...
+#    Reserved and comment records
+#    Directory records:      BACKWARD, FORWARD, logical address ranges of
+#                            the character, double and integer data, type
+#                            of the first cluster and the signed number of
+#                            records of every cluster, followed by the
+#                            clusters of data records.
+#
+DAS_RECORD_SIZE = 1024
+
+DAS_BYTE_ORDERS = {'LTL-IEEE': '<', 'BIG-IEEE': '>'}
+
+# Data types by their DAS code: (name, NumPy type, words per record)
+DAS_DATA_TYPES = {1: ('char', 'S1', 1024),
+                  2: ('dp', 'f8', 128),
+                  3: ('int', 'i4', 256)}
+
+# The type of a cluster is the next (positive count) or the previous
+# (negative count) of the type of the previous cluster, in cyclic order.
+DAS_NEXT_TYPE = {1: 2, 2: 3, 3: 1}
+DAS_PREVIOUS_TYPE = {1: 3, 2: 1, 3: 2}
+
+
+def open_das(das_path):
+    """
+    Open a DAS file as a read only memory map.
+
+    :return: tuple
+       The file object and the memory map, to be closed by the caller.
+    """
+    f = open(das_path, 'rb')
+    size = os.fstat(f.fileno()).st_size
+    if size < DAS_RECORD_SIZE:
+        f.close()
+        raise Exception("File shorter than a DAS file record: " + das_path)
+
+    return f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def read_das_file_record(data, das_path=''):
+
+    idword = data[0:8].decode('ascii', errors='replace')
+    if not idword.startswith('DAS/'):
+        raise Exception("Not a DAS file, ID word: '" + idword.strip() + "' of: " + das_path)
+
+    locfmt = data[84:92].decode('ascii', errors='replace')
+    byte_order = DAS_BYTE_ORDERS.get(locfmt)
+    if byte_order is None:
+        raise Exception("Unsupported binary file format: '" + locfmt.strip() + "' of: " + das_path)
+
+    nresvr, nresvc, ncomr, ncomc = struct.unpack(byte_order + '4i', data[68:84])
+
+    return {'idword': idword,
+            'ifname': data[8:68].decode('ascii', errors='replace').strip(),
+            'nresvr': nresvr,
+            'ncomr': ncomr,
+            'locfmt': locfmt,
+            'byte_order': byte_order}
+
+
+def read_das_clusters(data, das_path=''):
+    """
+    Read the file record and walk the directory records of a DAS.
+
+    :return: dict
+       The entries of the file record, the 'clusters' of every data type,
+       as (first logical address, byte offset, number of addresses)
+       tuples, and the 'last' logical address of every data type.
+    """
+    das = read_das_file_record(data, das_path)
+    byte_order = das['byte_order']
+    size = len(data)
+
+    clusters = {name: [] for name, dtype, per_record in DAS_DATA_TYPES.values()}
+    last = {name: 0 for name in clusters}
+    next_address = {name: 1 for name in clusters}
+
+    visited = set()
+    record = das['nresvr'] + das['ncomr'] + 2
+    while record > 0:
+        if record in visited or record * DAS_RECORD_SIZE > size:
+            raise Exception("Wrong directory record: " + str(record) + " of: " + das_path)
+        visited.add(record)
+
+        directory = np.frombuffer(data, byte_order + 'i4', DAS_RECORD_SIZE // 4, (record - 1) * DAS_RECORD_SIZE)
+        for code, (name, dtype, per_record) in DAS_DATA_TYPES.items():
+            last[name] = max(last[name], int(directory[2 * code + 1]))
+
+        data_type = int(directory[8])
+        data_record = record + 1
+        for idx, count in enumerate(directory[9:]):
+            count = int(count)
+            if not count:
+                break
+            if idx:
+                data_type = DAS_NEXT_TYPE[data_type] if count > 0 else DAS_PREVIOUS_TYPE[data_type]
+            if data_type not in DAS_DATA_TYPES:
+                raise Exception("Wrong cluster type: " + str(data_type) + " in directory record: " +
+                                str(record) + " of: " + das_path)
+
+            name, dtype, per_record = DAS_DATA_TYPES[data_type]
+            n_records = abs(count)
+            if (data_record + n_records - 1) * DAS_RECORD_SIZE > size:
+                raise Exception("Cluster of " + str(n_records) + " records at record: " + str(data_record) +
+                                " beyond the end of: " + das_path)
+
+            clusters[name].append((next_address[name], (data_record - 1) * DAS_RECORD_SIZE, n_records * per_record))
+            next_address[name] += n_records * per_record
+            data_record += n_records
+
+        record = int(directory[1])
+
+    for name in clusters:
+        if last[name] >= next_address[name]:
+            raise Exception("The " + name + " data ends at address: " + str(last[name]) +
+                            " beyond the clusters of: " + das_path)
+
+    das['clusters'] = clusters
+    das['last'] = last
+
+    return das
+
+
+def get_das_views(data, das, name):
+    """
+    Return the clusters of a data type as NumPy views of the memory map.
+
+    :return: tuple
+       The array of the first logical address of every cluster and the
+       list of views. The views shall be released before closing the map.
+    """
+    dtype = das['byte_order'] + {values[0]: values[1] for values in DAS_DATA_TYPES.values()}[name]
+    firsts = np.array([first for first, offset, count in das['clusters'][name]], dtype=np.int64)
+    views = [np.frombuffer(data, dtype, count, offset) for first, offset, count in das['clusters'][name]]
+
+    return firsts, views
+
+
+def read_das_range(cluster_views, first, count):
+    """
+    Read ``count`` values from the logical address ``first``. The values of
+    a single cluster are returned as a view, without copying them.
+    """
+    firsts, views = cluster_views
+    idx = int(np.searchsorted(firsts, first, side='right')) - 1
+    if idx < 0:
+        raise Exception("Wrong DAS address: " + str(first))
+
+    start = first - int(firsts[idx])
+    if start + count <= len(views[idx]):
+        return views[idx][start:start + count]
+
+    return gather_das_values(cluster_views, np.arange(first, first + count, dtype=np.int64))
+
+
+def gather_das_values(cluster_views, addresses):
+    """
+    Read the values of an array of logical addresses, spread over any
+    number of clusters.
+    """
+    firsts, views = cluster_views
+    if not len(addresses):
+        return np.empty(0, dtype=views[0].dtype if views else np.float64)
+
+    # All the addresses are usually in the same cluster
+    low, high = np.searchsorted(firsts, [addresses.min(), addresses.max()], side='right') - 1
+    if low == high >= 0 and addresses.max() - firsts[low] < len(views[low]):
+        return views[low][addresses - firsts[low]]
+
+    cluster_indexes = np.searchsorted(firsts, addresses, side='right') - 1
+    if cluster_indexes.min() < 0:
+        raise Exception("Wrong DAS address: " + str(addresses.min()))
+
+    values = np.empty(len(addresses), dtype=views[0].dtype)
+    for idx in np.unique(cluster_indexes):
+        mask = cluster_indexes == idx
+        positions = addresses[mask] - firsts[idx]
+        if positions.max() >= len(views[idx]):
+            raise Exception("Wrong DAS address: " + str(addresses[mask].max()))
+        values[mask] = views[idx][positions]
+
+    return values
@@ -0,0 +1,358 @@
+import numpy as np
+
+from spival.utils.das import open_das, read_das_clusters, get_das_views, read_das_range, gather_das_values
+from spival.utils.skd_val_logger import log_error, log_info, log_warn
+
+#
+# Validation of the segments of DSKs. The segments are walked through the
+# DLA segment list of the DAS, and the plates and vertices of type 2
+# segments are streamed from the memory mapped file in chunks of plates,
+# so that shape models of hundreds of MB are checked with a memory that
+# does not depend on the size of the file.
+#
+# DLA segment descriptor (integers): backward and forward pointers, base
+# and size of the integer, double and character data of the segment.
+#
+DLA_BEGIN_POINTER = 2
+DLA_NULL_POINTER = -1
+DLA_DESCRIPTOR_SIZE = 8
+
+# DSK descriptor: first 24 doubles of the segment
+DSK_DESCRIPTOR_SIZE = 24
+DSK_SURFACE, DSK_CENTER, DSK_CLASS, DSK_TYPE, DSK_FRAME, DSK_COORD_SYS = range(6)
+DSK_BOUNDS = 16
+DSK_START, DSK_END = 22, 23
+
+DSK_DATA_CLASSES = [1, 2]
+DSK_COORD_SYSTEMS = {1: 'LATITUDINAL', 2: 'CYLINDRICAL', 3: 'RECTANGULAR', 4: 'PLANETODETIC'}
+
+# Type 2 integer data: number of vertices, plates and voxels, voxel grid
+# extents, coarse voxel scale, sizes of the voxel-plate pointers, the
+# voxel-plate list and the vertex-plate list; followed by the plates, the
+# voxel-plate pointers and list, the vertex-plate pointers and list, and
+# the coarse grid pointers.
+DSK02_HEADER_SIZE = 10
+DSK02_MAX_COARSE_VOXELS = 100000
+
+# Type 2 double data after the DSK descriptor: vertex bounds, voxel grid
+# origin, voxel size and vertices.
+DSK02_VERTEX_BOUNDS = DSK_DESCRIPTOR_SIZE
+DSK02_VOXEL_ORIGIN = DSK02_VERTEX_BOUNDS + 6
+DSK02_VOXEL_SIZE = DSK02_VOXEL_ORIGIN + 3
+DSK02_VERTICES = DSK02_VOXEL_SIZE + 1
+
+# Plates streamed at once, and plates reported by kind of error
+DSK_CHUNK_PLATES = 65536
+DSK_REPORTED_PLATES = 10
+
+# Relative tolerance of the vertex bounds
+DSK_BOUNDS_TOLERANCE = 1.0e-9
+
+
+def is_valid_dsk_kernel(dsk_path, chunk_plates=DSK_CHUNK_PLATES):
+
+    try:
+        f, data = open_das(dsk_path)
+    except Exception as ex:
+        log_error("DSK_SEGMENTS", "Reading DAS of: " + dsk_path + " , exception: " + str(ex), dsk_path)
+        return False
+
+    try:
+        # The views of the map are released before it is closed
+        return check_dsk_segments(data, dsk_path, chunk_plates)
+    except Exception as ex:
+        log_error("DSK_SEGMENTS", "Checking segments of: " + dsk_path + " , exception: " + str(ex), dsk_path)
+        return False
+    finally:
+        data.close()
+        f.close()
+
+
+def check_dsk_segments(data, dsk_path, chunk_plates=DSK_CHUNK_PLATES):
+
+    das = read_das_clusters(data, dsk_path)
+    if not das['idword'].startswith('DAS/DSK'):
+        log_error("DSK_SEGMENTS", "Not a DSK DAS, ID word: '{}'", dsk_path, das['idword'].strip())
+        return False
+
+    int_views = get_das_views(data, das, 'int')
+    dp_views = get_das_views(data, das, 'dp')
+
+    is_valid = True
+    n_segments = 0
+    for descriptor in iter_dla_descriptors(int_views, das, dsk_path):
+        n_segments += 1
+        if not check_dsk_segment(descriptor, n_segments, int_views, dp_views, das, dsk_path, chunk_plates):
+            is_valid = False
+
+    if not n_segments:
+        log_error("DSK_SEGMENTS", "DSK without segments", dsk_path)
+        return False
+
+    return is_valid
+
+
+def iter_dla_descriptors(int_views, das, dsk_path=''):
+    """
+    Walk the DLA segment list, yielding the descriptor of every segment as
+    a dict.
+    """
+    visited = set()
+    pointer = int(read_das_range(int_views, DLA_BEGIN_POINTER, 1)[0])
+    while pointer != DLA_NULL_POINTER:
+        if pointer in visited or not 0 < pointer <= das['last']['int'] - DLA_DESCRIPTOR_SIZE + 1:
+            raise Exception("Wrong DLA segment pointer: " + str(pointer) + " of: " + dsk_path)
+        visited.add(pointer)
+
+        values = [int(value) for value in read_das_range(int_views, pointer, DLA_DESCRIPTOR_SIZE)]
+        yield dict(zip(['backward', 'forward', 'int_base', 'int_size', 'dp_base', 'dp_size', 'char_base',
+                        'char_size'], values))
+
+        pointer = values[1]
+
+    return
+
+
+def check_dsk_segment(descriptor, segment, int_views, dp_views, das, dsk_path, chunk_plates=DSK_CHUNK_PLATES):
+
+    from spival.utils.skd_utils import is_naif_id, is_frame_id
+
+    if descriptor['int_base'] + descriptor['int_size'] > das['last']['int'] \
+            or descriptor['dp_base'] + descriptor['dp_size'] > das['last']['dp'] \
+            or descriptor['dp_size'] < DSK_DESCRIPTOR_SIZE:
+        log_error("DSK_SEGMENTS", "Segment {} data out of the file: {}", dsk_path, segment, descriptor)
+        return False
+
+    dsk_descriptor = np.array(read_das_range(dp_views, descriptor['dp_base'] + 1, DSK_DESCRIPTOR_SIZE))
+
+    is_valid = True
+
+    codes = dsk_descriptor[:DSK_COORD_SYS + 1]
+    if np.any(codes != np.round(codes)):
+        log_error("DSK_SEGMENTS", "Segment {} with non integer surface, center, class, type, frame or "
+                  "coordinate system codes: {}", dsk_path, segment, codes.tolist())
+        return False
+
+    surface, center, data_class, data_type, frame, coord_sys = [int(code) for code in codes]
+
+    if not is_naif_id(center):
+        log_warn("DSK_SEGMENTS", "Segment {} center ID: {} is not any of the defined NAIF IDs or the SPICE "
+                 "built-in body IDs", dsk_path, segment, center)
+
+    if not is_frame_id(frame):
+        log_warn("DSK_SEGMENTS", "Segment {} frame ID: {} is not any of the defined frame IDs or the SPICE "
+                 "built-in frame IDs", dsk_path, segment, frame)
+
+    if data_class not in DSK_DATA_CLASSES:
+        log_error("DSK_SEGMENTS", "Segment {} with wrong data class: {}", dsk_path, segment, data_class)
+        is_valid = False
+
+    if coord_sys not in DSK_COORD_SYSTEMS:
+        log_error("DSK_SEGMENTS", "Segment {} with wrong coordinate system: {}", dsk_path, segment, coord_sys)
+        is_valid = False
+
+    bounds = dsk_descriptor[DSK_BOUNDS:DSK_BOUNDS + 6].reshape(3, 2)
+    if np.any(bounds[:, 1] < bounds[:, 0]):
+        log_error("DSK_SEGMENTS", "Segment {} with coordinate bounds maximum below minimum: {}", dsk_path,
+                  segment, bounds.tolist())
+        is_valid = False
+
+    if dsk_descriptor[DSK_END] < dsk_descriptor[DSK_START]:
+        log_error("DSK_SEGMENTS", "Segment {} ends before it starts", dsk_path, segment)
+        is_valid = False
+
+    if data_type != 2:
+        log_info("DSK_SEGMENTS", "Segment {} of surface {} of type {} not checked, only type 2 is supported",
+                 dsk_path, segment, surface, data_type)
+        return is_valid
+
+    if not check_dsk02_segment(descriptor, segment, coord_sys, bounds, int_views, dp_views, dsk_path,
+                               chunk_plates):
+        is_valid = False
+
+    return is_valid
+
+
+def check_dsk02_segment(descriptor, segment, coord_sys, bounds, int_views, dp_views, dsk_path,
+                        chunk_plates=DSK_CHUNK_PLATES):
+    """
+    Check the sizes and the spatial index of a type 2 segment and stream
+    its plates and vertices: plate vertex indices, degenerate plates and
+    vertices within the vertex and coordinate bounds.
+    """
+    int_base, dp_base = descriptor['int_base'], descriptor['dp_base']
+    if descriptor['int_size'] < DSK02_HEADER_SIZE or descriptor['dp_size'] < DSK02_VERTICES:
+        log_error("DSK_SEGMENTS", "Type 2 segment {} too small: {}", dsk_path, segment, descriptor)
+        return False
+
+    header = [int(value) for value in read_das_range(int_views, int_base + 1, DSK02_HEADER_SIZE)]
+    n_vertices, n_plates, n_voxels = header[0:3]
+    extents = header[3:6]
+    coarse_scale, voxel_pointers, voxel_plates, vertex_plates = header[6:10]
+
+    spatial = np.array(read_das_range(dp_views, dp_base + DSK02_VERTEX_BOUNDS + 1, 10))
+    vertex_bounds = spatial[0:6].reshape(3, 2)
+    voxel_origin = spatial[6:9]
+    voxel_size = spatial[9]
+
+    is_valid = True
+
+    if n_vertices < 3 or n_plates < 1:
+        log_error("DSK_SEGMENTS", "Type 2 segment {} with {} vertices and {} plates", dsk_path, segment,
+                  n_vertices, n_plates)
+        return False
+
+    #
+    # Spatial index: the voxel grid shall contain the vertex bounds.
+    #
+    if min(extents) < 1 or coarse_scale < 1 or n_voxels != extents[0] * extents[1] * extents[2] \
+            or any(extent % coarse_scale for extent in extents) \
+            or n_voxels // coarse_scale ** 3 > DSK02_MAX_COARSE_VOXELS:
+        log_error("DSK_SEGMENTS", "Type 2 segment {} with wrong voxel grid: {} voxels, extents: {}, coarse "
+                  "scale: {}", dsk_path, segment, n_voxels, extents, coarse_scale)
+        return False
+
+    if not voxel_size > 0:
+        log_error("DSK_SEGMENTS", "Type 2 segment {} with voxel size: {}", dsk_path, segment, voxel_size)
+        return False
+
+    if np.any(vertex_bounds[:, 1] < vertex_bounds[:, 0]):
+        log_error("DSK_SEGMENTS", "Type 2 segment {} with vertex bounds maximum below minimum: {}", dsk_path,
+                  segment, vertex_bounds.tolist())
+        is_valid = False
+
+    grid_end = voxel_origin + np.array(extents) * voxel_size
+    tolerance = DSK_BOUNDS_TOLERANCE * max(np.abs(vertex_bounds).max(), voxel_size)
+    if np.any(vertex_bounds[:, 0] < voxel_origin - tolerance) or np.any(vertex_bounds[:, 1] > grid_end + tolerance):
+        log_error("DSK_SEGMENTS", "Type 2 segment {} voxel grid from {} to {} does not contain the vertex bounds: "
+                  "{}", dsk_path, segment, voxel_origin.tolist(), grid_end.tolist(), vertex_bounds.tolist())
+        is_valid = False
+
+    #
+    # Sizes of the integer and double data.
+    #
+    n_coarse_voxels = n_voxels // coarse_scale ** 3
+    plates_address = int_base + DSK02_HEADER_SIZE + 1
+    int_size = DSK02_HEADER_SIZE + 3 * n_plates + voxel_pointers + voxel_plates + n_vertices + vertex_plates \
+        + n_coarse_voxels
+    dp_size = DSK02_VERTICES + 3 * n_vertices
+
+    if descriptor['int_size'] < DSK02_HEADER_SIZE + 3 * n_plates \
+            or descriptor['dp_size'] < dp_size:
+        log_error("DSK_SEGMENTS", "Type 2 segment {} of {} vertices and {} plates truncated, {} integers and {} "
+                  "doubles", dsk_path, segment, n_vertices, n_plates, descriptor['int_size'],
+                  descriptor['dp_size'])
+        return False
+
+    if descriptor['int_size'] != int_size or descriptor['dp_size'] != dp_size:
+        log_warn("DSK_SEGMENTS", "Type 2 segment {} of {} integers and {} doubles, expected: {} and {}", dsk_path,
+                 segment, descriptor['int_size'], descriptor['dp_size'], int_size, dp_size)
+
+    #
+    # Plates and vertices, streamed in chunks of plates.
+    #
+    if not check_dsk02_plates(n_vertices, n_plates, plates_address, dp_base + DSK02_VERTICES + 1, segment,
+                              int_views, dp_views, dsk_path, chunk_plates):
+        is_valid = False
+
+    if not check_dsk02_vertices(n_vertices, dp_base + DSK02_VERTICES + 1, vertex_bounds, coord_sys, bounds,
+                                segment, dp_views, dsk_path, chunk_plates):
+        is_valid = False
+
+    log_info("DSK_SEGMENTS", "Type 2 segment {}: {} vertices, {} plates, {} voxels", dsk_path, segment,
+             n_vertices, n_plates, n_voxels)
+
+    return is_valid
+
+
+def check_dsk02_plates(n_vertices, n_plates, plates_address, vertices_address, segment, int_views, dp_views,
+                       dsk_path, chunk_plates=DSK_CHUNK_PLATES):
+
+    out_of_range = []
+    repeated = []
+    zero_area = []
+    counts = [0, 0, 0]
+
+    for first_plate in range(0, n_plates, chunk_plates):
+        n_chunk = min(chunk_plates, n_plates - first_plate)
+        plates = read_das_range(int_views, plates_address + 3 * first_plate, 3 * n_chunk).reshape(-1, 3)
+        plate_numbers = np.arange(first_plate + 1, first_plate + n_chunk + 1)
+
+        wrong = np.any((plates < 1) | (plates > n_vertices), axis=1)
+        counts[0] += int(np.count_nonzero(wrong))
+        out_of_range.extend(plate_numbers[wrong][:DSK_REPORTED_PLATES - len(out_of_range)].tolist())
+
+        degenerate = (plates[:, 0] == plates[:, 1]) | (plates[:, 1] == plates[:, 2]) | (plates[:, 0] == plates[:, 2])
+        counts[1] += int(np.count_nonzero(degenerate & ~wrong))
+        repeated.extend(plate_numbers[degenerate & ~wrong][:DSK_REPORTED_PLATES - len(repeated)].tolist())
+
+        # Area of the plates with valid and distinct vertices
+        valid = ~wrong & ~degenerate
+        indexes = plates[valid].astype(np.int64).ravel() - 1
+        addresses = (vertices_address + 3 * indexes[:, np.newaxis] + np.arange(3)).ravel()
+        vertices = gather_das_values(dp_views, addresses).reshape(-1, 3, 3)
+        normals = np.cross(vertices[:, 1] - vertices[:, 0], vertices[:, 2] - vertices[:, 0])
+        flat = ~np.any(normals, axis=1)
+        counts[2] += int(np.count_nonzero(flat))
+        zero_area.extend(plate_numbers[valid][flat][:DSK_REPORTED_PLATES - len(zero_area)].tolist())
+
+    if counts[0]:
+        log_error("DSK_SEGMENTS", "Type 2 segment {}: {} plates with vertex indices out of 1 to {}, plates: {}",
+                  dsk_path, segment, counts[0], n_vertices, out_of_range)
+    if counts[1]:
+        log_error("DSK_SEGMENTS", "Type 2 segment {}: {} degenerate plates with repeated vertices, plates: {}",
+                  dsk_path, segment, counts[1], repeated)
+    if counts[2]:
+        log_warn("DSK_SEGMENTS", "Type 2 segment {}: {} plates of zero area, plates: {}", dsk_path, segment,
+                 counts[2], zero_area)
+
+    return not counts[0] and not counts[1]
+
+
+def check_dsk02_vertices(n_vertices, vertices_address, vertex_bounds, coord_sys, bounds, segment, dp_views,
+                         dsk_path, chunk_plates=DSK_CHUNK_PLATES):
+
+    tolerance = DSK_BOUNDS_TOLERANCE * max(np.abs(vertex_bounds).max(), 1.0)
+    minimum = np.full(3, np.inf)
+    maximum = np.full(3, -np.inf)
+    radii = [np.inf, -np.inf]
+    non_finite = 0
+
+    chunk_vertices = 3 * chunk_plates
+    for first_vertex in range(0, n_vertices, chunk_vertices):
+        n_chunk = min(chunk_vertices, n_vertices - first_vertex)
+        vertices = read_das_range(dp_views, vertices_address + 3 * first_vertex, 3 * n_chunk).reshape(-1, 3)
+
+        finite = np.all(np.isfinite(vertices), axis=1)
+        non_finite += int(np.count_nonzero(~finite))
+        vertices = vertices[finite]
+        if not len(vertices):
+            continue
+
+        minimum = np.minimum(minimum, vertices.min(axis=0))
+        maximum = np.maximum(maximum, vertices.max(axis=0))
+        norms = np.sqrt(np.einsum('ij,ij->i', vertices, vertices))
+        radii = [min(radii[0], norms.min()), max(radii[1], norms.max())]
+
+    is_valid = True
+
+    if non_finite:
+        log_error("DSK_SEGMENTS", "Type 2 segment {}: {} vertices with non finite coordinates", dsk_path, segment,
+                  non_finite)
+        is_valid = False
+
+    if np.any(minimum < vertex_bounds[:, 0] - tolerance) or np.any(maximum > vertex_bounds[:, 1] + tolerance):
+        log_error("DSK_SEGMENTS", "Type 2 segment {}: vertices from {} to {} out of the vertex bounds: {}", dsk_path,
+                  segment, minimum.tolist(), maximum.tolist(), vertex_bounds.tolist())
+        is_valid = False
+
+    # The third coordinate bounds are the radii of latitudinal segments and
+    # the coordinates of rectangular ones.
+    if coord_sys == 1 and (radii[0] < bounds[2, 0] - tolerance or radii[1] > bounds[2, 1] + tolerance):
+        log_warn("DSK_SEGMENTS", "Type 2 segment {}: vertex radii from {} to {} out of the descriptor radius "
+                 "bounds: {}", dsk_path, segment, radii[0], radii[1], bounds[2].tolist())
+    elif coord_sys == 3 and (np.any(minimum < bounds[:, 0] - tolerance) or np.any(maximum > bounds[:, 1] + tolerance)):
+        log_warn("DSK_SEGMENTS", "Type 2 segment {}: vertices from {} to {} out of the descriptor bounds: {}",
+                 dsk_path, segment, minimum.tolist(), maximum.tolist(), bounds.tolist())
+
+    return is_valid
@@ -1,74 +1,161 @@
-from smtplib import SMTP        # use this for standard SMTP protocol   (port 25, no encryption)
 from email.mime.text import MIMEText
-import socket
+import atexit
 import os
 import json
 import traceback
 
+from spival.classes.mailer import Mailer
+
+SMTP_SERVER = 'smtp.cosmos.esa.int'
+SMTP_PORT = 25
+SENDER = 'esa_spice@esa.int'
+
+#
+# Parsed configuration files by path, with their modification time, and
+# open mailers by (server, port): a run sends all its e-mails through the
+# same connection.
+#
+CONFIGS = {}
+MAILERS = {}
+
+
+def load_config(config):
+
+    mtime = os.stat(config).st_mtime_ns
+    cached = CONFIGS.get(config)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
 
-def send_status_email(config, body_text='', error=False):
     with open(config) as f:
         try:
-            config = json.load(f)
+            parsed = json.load(f)
         except:
             error_message = str(traceback.format_exc())
             print("Error: The SPIVAL JSON configuration file has syntactical errors.")
             print(error_message)
             raise
 
-        SMTPserver = 'smtp.cosmos.esa.int'
-        sender = 'esa_spice@esa.int'
+    CONFIGS[config] = (mtime, parsed)
+
+    return parsed
+
+
+def get_config_flag(config, key, default):
+    """
+    Return a boolean option of the configuration, given as a JSON boolean or
+    as a string such as "false", "no" or "0".
+    """
+    value = config.get(key, default)
+    if isinstance(value, bool):
+        return value
+
+    if isinstance(value, str):
+        if value.strip().lower() in ('true', 'yes', 'on', '1'):
+            return True
+        if value.strip().lower() in ('false', 'no', 'off', '0'):
+            return False
+
+    raise Exception("Wrong value of " + key + ", true or false expected: " + repr(value))
+
+
+def get_mailer(email_config):
+    """
+    Return the mailer of the SMTP server of the configuration, optionally
+    set with "smtp_server" and "smtp_port", e.g. a local SMTP server for
+    testing, that may not support STARTTLS with "smtp_starttls": false.
+    """
+    server = email_config.get('smtp_server', SMTP_SERVER)
+    port = int(email_config.get('smtp_port', SMTP_PORT))
+    starttls = get_config_flag(email_config, 'smtp_starttls', True)
+
+    if (server, port, starttls) not in MAILERS:
+        MAILERS[(server, port, starttls)] = Mailer(server, port, sender=SENDER, starttls=starttls)
 
-        destination = config['email'][0]['developer']
+    return MAILERS[(server, port, starttls)]
 
-        #USERNAME = "esa_spice"
-        #PASSWORD = ""
 
-        # typical values for text_subtype are plain, html, xml
-        text_subtype = 'html'
+def close_mailers():
 
+    for mailer in MAILERS.values():
+        mailer.close()
+    MAILERS.clear()
+
+
+atexit.register(close_mailers)
+
+
+def send_status_email(config, body_text='', error=False):
+
+    config = load_config(config)
+    email_config = config['email'][0]
+
+    destination = email_config['developer']
+
+    # typical values for text_subtype are plain, html, xml
+    text_subtype = 'html'
+
+    try:
+        # Prepare email message
+        msg = MIMEText(body_text, text_subtype)
+        if 'FAIL' in msg.as_string():
+            error = True
+        if error:
+            subject = "[SPIVAL]: {} Tests FAIL".format(email_config['mission'])
+        else:
+            subject = "[SPIVAL]: {} Tests OK".format(email_config['mission'])
+        msg['Subject'] = subject
+        msg['From'] = SENDER  # some SMTP servers will do this automatically, not all
+
+        # The email is sent once to all the emails in destination separated by ';'
         try:
-            # Prepare email message
-            msg = MIMEText(body_text, text_subtype)
-            if 'FAIL' in msg.as_string():
-                error = True
-            if error:
-                subject = "[SPIVAL]: {} Tests FAIL".format(config['email'][0]['mission'])
-            else:
-                subject = "[SPIVAL]: {} Tests OK".format(config['email'][0]['mission'])
-            msg['Subject'] = subject
-            msg['From'] = sender  # some SMTP servers will do this automatically, not all
+            get_mailer(email_config).send(destination.split(';'),
+                                          msg.as_string() + '\n\n' + email_config['report'])
+        except Exception as exc:
+            print("Send mail failed; {}".format(str(exc)))  # give a error message
 
-            # For each email in destination separated by ';' send the email
-            dest_emails = destination.split(';')
+        return msg.as_string()  # Just for testing purposes
 
-            for dest_email in dest_emails:
+    except Exception as exc:
 
-                if "@" not in dest_email:
-                    # Ignore invalid emails
-                    continue
+        print("Mail failed; {}".format(str(exc)))  # give a error message
+        return ""  # Just for testing purposes
 
-                conn = SMTP(SMTPserver)
 
-                conn.starttls()
-                conn.ehlo()
+def send_digest_email(config, reports):
+    """
+    Send a single e-mail with the results of all the ``reports``, a list of
+    (report name, results HTML) tuples, instead of one e-mail per report.
+    """
+    config = load_config(config)
+    email_config = config['email'][0]
 
-                # Pretend the SMTP server supports some forms of authentication.
-                conn.esmtp_features['auth'] = 'LOGIN DIGEST-MD5 PLAIN'
+    destination = email_config['developer']
 
-                conn.set_debuglevel(False)
-                # conn.login(USERNAME, PASSWORD), not needed anymore after sciops to cosmos migration
-                try:
-                    conn.sendmail(sender, dest_email, msg.as_string() + '\n\n' + config['email'][0]['report'])
-                except Exception as exc:
-                    print("Send mail failed; {}".format(str(exc)))  # give a error message
-                finally:
-                    conn.quit()
+    failed = [name for name, results in reports if 'FAIL' in results]
 
-            return msg.as_string()  # Just for testing purposes
+    body_text = ''
+    for name, results in reports:
+        body_text += "<h2>{}</h2>\n{}\n<hr>\n".format(os.path.basename(name), results)
 
+    try:
+        msg = MIMEText(body_text, 'html')
+        if failed:
+            subject = "[SPIVAL]: {} Tests FAIL ({} of {} reports)".format(email_config['mission'],
+                                                                          len(failed), len(reports))
+        else:
+            subject = "[SPIVAL]: {} Tests OK ({} reports)".format(email_config['mission'], len(reports))
+        msg['Subject'] = subject
+        msg['From'] = SENDER
+
+        try:
+            get_mailer(email_config).send(destination.split(';'),
+                                          msg.as_string() + '\n\n' + email_config.get('report', ''))
         except Exception as exc:
+            print("Send mail failed; {}".format(str(exc)))
+
+        return msg.as_string()
 
-            print("Mail failed; {}".format(str(exc)))  # give a error message
-            return ""  # Just for testing purposes
+    except Exception as exc:
 
+        print("Mail failed; {}".format(str(exc)))
+        return ""
@@ -1,23 +1,28 @@
-import hashlib
 import os
 import errno
-import select
 import shutil
 import fileinput
 import glob
 import re
 import logging
-import subprocess
 from datetime import datetime
 
 from shutil import move, copyfile
 from tempfile import mkstemp
 
+from spival.utils.manifest import get_file_digest
+from spival.utils.runner import run_command, run_commands, MAX_CONCURRENT_PROCESSES
 from spival.utils.skd_val_logger import log_error, log_warn
+from spival.utils.utils import render_template, write_atomic
 
 MAX_LINE_LENGTH = 80
 BAD_CHAR_KEYWORDS = ["<<<<<<< ", ">>>>>>> "]
 
+KERNEL_VERSION_REGEX = re.compile(r'_V(\d\d+)')
+
+# Comments of binary kernels already read with commnt, by kernel path
+KERNEL_COMMENTS = {}
+
 
 def mk2list(mk):
     inside_data_section = False
@@ -127,64 +132,13 @@ def fill_template(template,
                   file,
                   replacements,
                   cleanup=False):
-    #
-    # If the temp   late file is equal to the output file then we need to create a temporary template - which will be
-    # a duplicate - in order to write in the file. A situation where we would like to have them be the same is
-    # for example if we call this function several times in a row, replacing keywords in the template in steps
-    #
-    if template == file:
-        with open(file, 'r') as f:
-            with open('fill_template.temp', "w+") as t:
-                for line in f:
-                    t.write(line)
-
-        template = 'fill_template.temp'
-
-    with open(file, "w+") as f:
-        #
-        # Items are replaced as per correspondence in between the replacements dictionary
-        #
-        with open(template, 'r') as t:
-            for line in t:
-                if '{' in line:
-                    for k, v in replacements.items():
-                        if '{' + k + '}' in line:
-                            line = line.replace('{' + k + '}', v)
-                #
-                # We need to manage the lenght of the line and slpit it if need be.
-                #
-                # if 'LSK_FILE_NAME' in line or 'FK_FILE_NAME' in line or 'SCLK_FILE_NAME' in line:
-                #    if len(line.split("'")[1]) > 80:
-                #        line = "'\n      SCLK_FILE_NAME         += '/".join(line.rsplit('/',1))
-
-                f.write(line)
-
-                #
-                # If the option cleanup is set as true, we remove the keyword assignments in the filled templated which
-                # are unfilled (they should be optional)
-                #
-
-    if cleanup:
-
-        with open(file, 'r') as f:
-            with open('fill_template.temp', 'w+') as t:
-                for line in f:
-                    t.write(line)
-
-        with open(file, 'w+') as f:
-            with open('fill_template.temp', 'r') as t:
-                for line in t:
-                    if '{' not in line:
-                        f.write(line)
-
-    # The temporary files are removed
-    if os.path.isfile('fill_template.temp'):
-        os.remove('fill_template.temp')
+    write_atomic(file, render_template(template, replacements, cleanup))
 
 
 def get_latest_kernel(kernel_type, path, pattern, dates=False,
                       excluded_kernels=False,
-                      mkgen=False):
+                      mkgen=False,
+                      inventory=None):
     """
     Returns the name of the latest MK, LSK, FK or SCLK present in the path
 
@@ -194,12 +148,18 @@ def get_latest_kernel(kernel_type, path, pattern, dates=False,
     :type path: str
     :param patterns: Patterns to search for that defines the kernel ``type`` file naming scheme.
     :type patterns: list
+    :param inventory: KernelInventory of ``path``, if provided the kernels are obtained from it instead of globbing.
+    :type inventory: KernelInventory
     :return: Name of the latest kernel of ``type`` that matches the naming scheme defined in ``token`` present in the ``path`` directory.
     :rtype: strÐ
     :raises:
        KernelNotFound if no kernel of ``type`` matching the naming scheme
        defined in ``token is present in the ``path`` directory
     """
+    if inventory is not None:
+        return inventory.get_latest_kernel(kernel_type, pattern, dates=dates,
+                                           excluded_kernels=excluded_kernels, mkgen=mkgen)
+
     kernels = []
     kernel_path = os.path.join(path, kernel_type)
 
@@ -227,10 +187,9 @@ def get_latest_kernel(kernel_type, path, pattern, dates=False,
     # We remove the kernel if it is included in the excluded kernels list
     #
     if excluded_kernels:
-        for excluded_kernel in excluded_kernels:
-            for kernel in kernels:
-                if excluded_kernel.split('*')[0] in kernel:
-                    kernels.remove(kernel)
+        excluded_tokens = [excluded_kernel.split('*')[0] for excluded_kernel in excluded_kernels]
+        kernels = [kernel for kernel in kernels
+                   if not any(token in kernel for token in excluded_tokens)]
 
     if not dates:
         #
@@ -245,20 +204,34 @@ def get_latest_kernel(kernel_type, path, pattern, dates=False,
         #
         # Return all the kernels with a given date
         #
-        previous_kernel = ''
+        previous_base = None
         kernels_date = []
         for kernel in kernels:
-            if previous_kernel \
-                    and re.split('_V\d\d', previous_kernel.upper())[0] == re.split('_V\d\d', kernel.upper())[0]\
-                    or re.split('_V\d\d\d', previous_kernel.upper())[0] == re.split('_V\d\d\d', kernel.upper())[0]:
-                kernels_date.remove(previous_kernel)
+            base = get_kernel_base_name(kernel)[0]
+            if kernels_date and base == previous_base:
+                kernels_date.pop()
 
-            previous_kernel = kernel
+            previous_base = base
             kernels_date.append(kernel)
 
         return kernels_date
 
 
+def get_kernel_base_name(kernel):
+    """
+    Return the base name of a kernel, the upper-cased name up to its
+    ``_Vnn`` version token, and its version number (None if the kernel name
+    has no version), e.g.: em16_tgo_sc_ssm_20190101_v02.bc returns
+    ('EM16_TGO_SC_SSM_20190101', 2).
+    """
+    kernel = kernel.upper()
+    match = KERNEL_VERSION_REGEX.search(kernel)
+    if match is None:
+        return kernel, None
+
+    return kernel[:match.start()], int(match.group(1))
+
+
 def extension2type(kernel):
 
     kernel_type_map = {
@@ -419,7 +392,7 @@ def has_badchars(file_path):
         for i in range(0, len(line), 1):
             e = line[i]
             if (re.sub('[ -~]', '', e)) != "" and e != '\n':
-                log_error("BAD_CHAR", "NON ASCII CHAR: \'" + e + "\' detected at line: " + str(linen), file_path)
+                log_error("BAD_CHAR", "NON ASCII CHAR: '{}' detected at line: {}", file_path, e, linen)
                 badchars_detected = True
 
         for bad_char_keyword in BAD_CHAR_KEYWORDS:
@@ -451,7 +424,7 @@ def exceeds_line_lengths(file, max_length=MAX_LINE_LENGTH, ignore_lines=None):
                     break
 
             if not line_ignored:
-                log_error("EXCEEDS_LINE_LENGTH", f[i] + "\n Line nr: " + str(linen), file)
+                log_error("EXCEEDS_LINE_LENGTH", "{}\n Line nr: {}", file, f[i], linen)
                 has_long_lines = True
 
     return has_long_lines
@@ -466,7 +439,7 @@ def validate_indentation(file, indentation=3):
         line = f[i].replace('\n', '')
         spaces = len(line) - len(line.lstrip())
         if spaces and spaces % indentation != 0:
-            log_warn("WRONG_INDENTATION", "WRONG INDENTATION: Line nr: " + str(linen) + "\n'" + line + "'", file)
+            log_warn("WRONG_INDENTATION", "WRONG INDENTATION: Line nr: {}\n'{}'", file, linen, line)
             has_wrong_indentation = True
 
     return has_wrong_indentation
@@ -481,19 +454,15 @@ def validate_trailing_chars(file):
         line = f[i].replace('\n', '')
         trailing_chars = len(line) - len(line.rstrip())
         if trailing_chars > 0:
-            log_warn("TRAILING_CHARS", "Found " + str(trailing_chars) + " trailing char at Line nr: " +
-                     str(linen) + "\n'" + line + "'", file)
+            log_warn("TRAILING_CHARS", "Found {} trailing char at Line nr: {}\n'{}'", file,
+                     trailing_chars, linen, line)
             has_trailing_chars = True
 
     return has_trailing_chars
 
 
 def md5(fname):
-    hash_md5 = hashlib.md5()
-    with open(fname, "rb") as f:
-        for chunk in iter(lambda: f.read(4096), b""):
-            hash_md5.update(chunk)
-    return hash_md5.hexdigest()
+    return get_file_digest(fname, 'md5')
 
 
 def copy(src, dest):
@@ -571,71 +540,62 @@ def commnt_read(kernel_path, directories=None):
 
     exe_path = directories.executables + '/' if directories is not None else ""
 
-    command_line_process = subprocess.Popen([exe_path + 'commnt', '-r',
-                                             check_spice_path(kernel_path)],
-                                             bufsize=8192, shell=False,
-                                             stdout=subprocess.PIPE,
-                                             stderr=subprocess.PIPE)
-    process_output = ""
-    dataend = False
-    while (command_line_process.returncode is None) or (not dataend):
-        command_line_process.poll()
-        dataend = False
-
-        ready = select.select([command_line_process.stdout, command_line_process.stderr], [], [], 1.0)
-
-        if command_line_process.stderr in ready[0]:
-            data = command_line_process.stderr.read(1024)
-            if len(data) > 0:
-                raise Exception(data)
-
-        if command_line_process.stdout in ready[0]:
-            data = command_line_process.stdout.read(1024)
-            if len(data) == 0:  # Read of zero bytes means EOF
-                dataend = True
-            else:
-                process_output += data.decode('utf-8')
+    if kernel_path in KERNEL_COMMENTS:
+        return KERNEL_COMMENTS[kernel_path]
+
+    result = run_command([exe_path + 'commnt', '-r', check_spice_path(kernel_path)], merge_stderr=False)
+    if len(result["stderr"]) > 0:
+        raise Exception(result["stderr"])
+
+    return result["stdout"].decode('utf-8')
+
+
+def commnt_read_all(kernel_paths, directories=None, max_processes=MAX_CONCURRENT_PROCESSES):
+    """
+    Read the comments of several binary kernels concurrently. The comments
+    are stored in ``KERNEL_COMMENTS`` so that the subsequent calls to
+    ``commnt_read`` for these kernels do not spawn ``commnt`` again.
+
+    :return: dict
+       Comments per kernel path, kernels whose comments could not be read
+       are not included.
+    """
+    exe_path = directories.executables + '/' if directories is not None else ""
+
+    kernel_paths = [kernel_path for kernel_path in kernel_paths if kernel_path not in KERNEL_COMMENTS]
+    results = run_commands([[exe_path + 'commnt', '-r', check_spice_path(kernel_path)]
+                            for kernel_path in kernel_paths],
+                           max_processes=max_processes, merge_stderr=False)
+
+    for kernel_path, result in zip(kernel_paths, results):
+        if result["error"] is None and not len(result["stderr"]):
+            KERNEL_COMMENTS[kernel_path] = result["stdout"].decode('utf-8')
 
-    return process_output
+    return KERNEL_COMMENTS
 
 
 def commnt_add(kernel_path, commnt_path, directories):
-    command_line_process = subprocess.Popen(
-        [directories.executables + '/' + 'commnt', '-a', check_spice_path(kernel_path), check_spice_path(commnt_path)],
-        stdout=subprocess.PIPE,
-        stderr=subprocess.STDOUT)
-    command_line_process.wait()
-    process_output, _ = command_line_process.communicate()
-    return process_output.decode('utf-8')
+    KERNEL_COMMENTS.pop(kernel_path, None)
+    result = run_command([directories.executables + '/' + 'commnt', '-a',
+                          check_spice_path(kernel_path), check_spice_path(commnt_path)])
+    return result["stdout"].decode('utf-8')
 
 
 def commnt_delete(kernel_path, directories):
-    command_line_process = subprocess.Popen(
-        [directories.executables + '/' + 'commnt', '-d', check_spice_path(kernel_path)],
-        stdout=subprocess.PIPE,
-        stderr=subprocess.STDOUT)
-    command_line_process.wait()
-    process_output, _ = command_line_process.communicate()
+    KERNEL_COMMENTS.pop(kernel_path, None)
+    run_command([directories.executables + '/' + 'commnt', '-d', check_spice_path(kernel_path)])
     return
 
 
 def commnt_extract(kernel_path, commnt_path, directories):
-    command_line_process = subprocess.Popen(
-        [directories.executables + '/' + 'commnt', '-e', kernel_path, commnt_path],
-        stdout=subprocess.PIPE,
-        stderr=subprocess.STDOUT)
-    command_line_process.wait()
+    run_command([directories.executables + '/' + 'commnt', '-e', kernel_path, commnt_path])
     return
 
 
 def run_ckbrief(kernel_path, support_kernels, directories):
-    command_line_process = subprocess.Popen([directories.executables + '/' +
-                                             'ckbrief', check_spice_path(kernel_path), support_kernels, '-utc', '-g'],
-                                            stdout=subprocess.PIPE,
-                                            stderr=subprocess.STDOUT)
-    command_line_process.wait()
-    process_output, _ = command_line_process.communicate()
-    coverage_text = process_output.decode("utf-8")
+    result = run_command([directories.executables + '/' + 'ckbrief',
+                          check_spice_path(kernel_path), support_kernels, '-utc', '-g'])
+    coverage_text = result["stdout"].decode("utf-8")
     return coverage_text
 
 
@@ -648,11 +608,8 @@ def dafcat_kernels(merged_kernel, kernels):
 
 
 def run_dafcat(kernel_path, daf_file, directories):
-    cmd = directories.executables + os.sep + 'dafcat < ' + daf_file + ' ' + kernel_path
-    command_line_process = subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
-    command_line_process.wait()
-    process_output = command_line_process.communicate()[0]
-    return process_output.decode('utf-8')
+    result = run_command([directories.executables + os.sep + 'dafcat', kernel_path], stdin_path=daf_file)
+    return result["stdout"].decode('utf-8')
 
 
 def write_daf_file(kernels, daf_file):
@@ -761,6 +718,8 @@ def get_kernel_version(kernel_path):
 
 
 def files_are_equal(file1, file2):
+    if os.path.getsize(file1) != os.path.getsize(file2):
+        return False
     return md5(file1) == md5(file2)
 
 
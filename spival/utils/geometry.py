@@ -0,0 +1,424 @@
+import re
+
+import numpy as np
+
+from spival.utils.kpl import parse_kernel_pool, get_numeric_values, get_string_values
+from spival.utils.skd_val_logger import log_error, log_warn
+
+#
+# Geometry checks of the static TK frames of the FKs and of the FOVs of the
+# IKs of an SKD. The TKFRAME_* and INS*_ variables of all the kernels are
+# gathered with the KPL parser and stacked into NumPy arrays, so that the
+# rotation matrices, quaternions and FOVs of the whole SKD are checked in
+# a single batch, before the kernels are published. The findings are
+# logged with the kernel and line of the variables.
+#
+TKFRAME_VARIABLE_REGEX = re.compile(r'^TKFRAME_(.+)_(SPEC|MATRIX|ANGLES|AXES|UNITS|Q)$')
+INS_VARIABLE_REGEX = re.compile(r'^INS(-?\d+)_(BORESIGHT|FOV_SHAPE|FOV_CLASS_SPEC|FOV_BOUNDARY_CORNERS|'
+                                r'FOV_REF_VECTOR|FOV_REF_ANGLE|FOV_CROSS_ANGLE|FOV_ANGLE_UNITS)$')
+
+# Radians per unit of the TKFRAME_<id>_UNITS and INS<id>_FOV_ANGLE_UNITS
+ANGLE_UNITS = {'RADIANS': 1.0,
+               'DEGREES': np.pi / 180.0,
+               'ARCMINUTES': np.pi / 180.0 / 60.0,
+               'ARCSECONDS': np.pi / 180.0 / 3600.0,
+               'HOURANGLE': np.pi / 12.0,
+               'MINUTEANGLE': np.pi / 12.0 / 60.0,
+               'SECONDANGLE': np.pi / 12.0 / 3600.0}
+
+# Deviation of the determinant and of M^T M from the identity of the
+# rotation matrices, and of the norm of the quaternions from 1: errors
+# beyond the error tolerance, warnings beyond the warning one
+ROTATION_ERROR_TOLERANCE = 1.0e-4
+ROTATION_WARN_TOLERANCE = 1.0e-9
+
+# Number of boundary corners of every FOV shape, None for 3 or more
+FOV_SHAPE_CORNERS = {'CIRCLE': 1, 'ELLIPSE': 2, 'RECTANGLE': 4, 'POLYGON': None}
+
+# Half-angles of the FOVs shall be below 90 degrees
+MAX_FOV_HALF_ANGLE = np.pi / 2.0
+
+
+def get_kernel_geometry(variables):
+    """
+    Gather the TK frame and instrument FOV variables of a text kernel.
+
+    :return: tuple
+       The variables of every TK frame and of every instrument, as dicts of
+       {keyword: variable} by frame and by instrument ID.
+    """
+    frames = {}
+    instruments = {}
+    for name, variable in variables.items():
+        match = TKFRAME_VARIABLE_REGEX.match(name)
+        if match:
+            frames.setdefault(match.group(1), {})[match.group(2)] = variable
+            continue
+        match = INS_VARIABLE_REGEX.match(name)
+        if match:
+            instruments.setdefault(int(match.group(1)), {})[match.group(2)] = variable
+
+    return frames, instruments
+
+
+def get_string_value(variable):
+    values = get_string_values(variable)
+    return values[0].strip().upper() if values else ''
+
+
+def stack_values(entries, size, l_type, invalid):
+    """
+    Stack the numeric values of the (path, name, variable) entries that
+    have ``size`` values, logging the others.
+
+    :return: tuple
+       The indexes of the stacked entries and the (n, size) array.
+    """
+    indexes = []
+    values = []
+    for idx, (path, name, variable) in enumerate(entries):
+        try:
+            variable_values = get_numeric_values(variable)
+        except Exception as ex:
+            log_error(l_type, "{}: {}", path, variable['name'], str(ex))
+            invalid.add(path)
+            continue
+
+        if len(variable_values) != size or not np.all(np.isfinite(variable_values)):
+            log_error(l_type, "{} shall have {} finite values, found: {} on line: {}", path,
+                      variable['name'], size, len(variable_values), variable['line'])
+            invalid.add(path)
+            continue
+
+        indexes.append(idx)
+        values.append(variable_values)
+
+    return indexes, np.array(values, dtype=np.float64).reshape(-1, size)
+
+
+def log_rotation_errors(entries, indexes, errors, message, invalid):
+
+    for idx in np.flatnonzero(errors > ROTATION_WARN_TOLERANCE):
+        path, frame, variable = entries[indexes[idx]]
+        if errors[idx] > ROTATION_ERROR_TOLERANCE:
+            log_error("TKFRAME_GEOMETRY", message + " by {:.3e} on line: {}", path,
+                      variable['name'], errors[idx], variable['line'])
+            invalid.add(path)
+        else:
+            log_warn("TKFRAME_GEOMETRY", message + " by {:.3e} on line: {}", path,
+                     variable['name'], errors[idx], variable['line'])
+
+    return
+
+
+def check_tkframe_matrices(entries, invalid):
+    """
+    Check that the TKFRAME_<id>_MATRIX are rotations: determinant 1 and
+    M^T M the identity, for all the matrices at once.
+    """
+    indexes, values = stack_values(entries, 9, "TKFRAME_GEOMETRY", invalid)
+    matrices = values.reshape(-1, 3, 3)
+
+    determinant_errors = np.abs(np.linalg.det(matrices) - 1.0)
+    log_rotation_errors(entries, indexes, determinant_errors, "{} determinant differs from 1", invalid)
+
+    orthogonality_errors = np.abs(np.matmul(matrices.transpose(0, 2, 1), matrices) - np.eye(3)).max(axis=(1, 2)) \
+        if len(matrices) else np.zeros(0)
+    log_rotation_errors(entries, indexes, orthogonality_errors, "{} is not orthogonal, M^T M differs from I",
+                        invalid)
+
+    return
+
+
+def check_tkframe_quaternions(entries, invalid):
+    """
+    Check that the TKFRAME_<id>_Q are unit quaternions.
+    """
+    indexes, quaternions = stack_values(entries, 4, "TKFRAME_GEOMETRY", invalid)
+    norm_errors = np.abs(np.linalg.norm(quaternions, axis=1) - 1.0)
+    log_rotation_errors(entries, indexes, norm_errors, "{} is not a unit quaternion, its norm differs from 1",
+                        invalid)
+
+    return
+
+
+def check_tkframe_angles(entries, invalid):
+    """
+    Check the TKFRAME_<id>_ANGLES, TKFRAME_<id>_AXES and TKFRAME_<id>_UNITS
+    of the frames defined by Euler angles: three finite angles, in known
+    units, about the axes 1, 2 or 3 with the second axis different from the
+    first and the third.
+    """
+    stack_values([(path, frame, variables['ANGLES']) for path, frame, variables in entries],
+                 3, "TKFRAME_GEOMETRY", invalid)
+
+    axes_entries = [(path, frame, variables['AXES']) for path, frame, variables in entries]
+    indexes, axes = stack_values(axes_entries, 3, "TKFRAME_GEOMETRY", invalid)
+    wrong_axes = np.any((axes != 1) & (axes != 2) & (axes != 3), axis=1) \
+        | (axes[:, 1] == axes[:, 0]) | (axes[:, 1] == axes[:, 2])
+    for idx in np.flatnonzero(wrong_axes):
+        path, frame, variable = axes_entries[indexes[idx]]
+        log_error("TKFRAME_GEOMETRY", "{} = {} are not valid rotation axes on line: {}", path,
+                  variable['name'], axes[idx].astype(int).tolist(), variable['line'])
+        invalid.add(path)
+
+    for path, frame, variables in entries:
+        units = get_string_value(variables['UNITS'])
+        if units not in ANGLE_UNITS:
+            log_error("TKFRAME_GEOMETRY", "{} = '{}' is not any of the angle units: {} on line: {}", path,
+                      variables['UNITS']['name'], units, ", ".join(ANGLE_UNITS), variables['UNITS']['line'])
+            invalid.add(path)
+
+    return
+
+
+def check_tkframes(frames, invalid):
+    """
+    Check the (path, frame, variables) TK frames by their TKFRAME_<id>_SPEC.
+    """
+    required = {'MATRIX': ['MATRIX'], 'ANGLES': ['ANGLES', 'AXES', 'UNITS'], 'QUATERNION': ['Q']}
+    by_spec = {spec: [] for spec in required}
+
+    for path, frame, variables in frames:
+        if 'SPEC' not in variables:
+            continue
+        spec = get_string_value(variables['SPEC'])
+        if spec not in required:
+            log_error("TKFRAME_GEOMETRY", "{} = '{}' is not any of: {} on line: {}", path,
+                      variables['SPEC']['name'], spec, ", ".join(required), variables['SPEC']['line'])
+            invalid.add(path)
+            continue
+
+        missing = ['TKFRAME_' + frame + '_' + keyword for keyword in required[spec] if keyword not in variables]
+        if missing:
+            log_error("TKFRAME_GEOMETRY", "{} not found for the frame with {} = '{}'", path,
+                      ", ".join(missing), variables['SPEC']['name'], spec)
+            invalid.add(path)
+            continue
+
+        by_spec[spec].append((path, frame, variables))
+
+    check_tkframe_matrices([(path, frame, variables['MATRIX']) for path, frame, variables in by_spec['MATRIX']],
+                           invalid)
+    check_tkframe_quaternions([(path, frame, variables['Q']) for path, frame, variables in by_spec['QUATERNION']],
+                              invalid)
+    check_tkframe_angles(by_spec['ANGLES'], invalid)
+
+    return
+
+
+def check_fov_corners(entries, boresights, invalid):
+    """
+    Check the FOVs given by their boundary corners, for all the instruments
+    at once: the half-angle between the boresight and every corner and, for
+    rectangles and polygons, that the boresight is inside the FOV, i.e. on
+    the same side of all the planes of consecutive corners.
+    """
+    kept = []
+    corners = []
+    for entry, boresight in zip(entries, boresights):
+        path, ins_id, variables, shape = entry
+        variable = variables['FOV_BOUNDARY_CORNERS']
+        try:
+            values = get_numeric_values(variable)
+        except Exception as ex:
+            log_error("FOV_GEOMETRY", "{}: {}", path, variable['name'], str(ex))
+            invalid.add(path)
+            continue
+
+        expected = FOV_SHAPE_CORNERS[shape]
+        count = len(values) // 3
+        if len(values) % 3 or not np.all(np.isfinite(values)) \
+                or (count != expected if expected is not None else count < 3):
+            log_error("FOV_GEOMETRY", "{} shall have {} corners of 3 finite values for a {} FOV, found {} values "
+                      "on line: {}", path, variable['name'], expected if expected is not None else '3 or more',
+                      shape, len(values), variable['line'])
+            invalid.add(path)
+            continue
+
+        kept.append((entry, boresight))
+        corners.append(values.reshape(-1, 3))
+
+    if not kept:
+        return
+
+    counts = np.array([len(entry_corners) for entry_corners in corners])
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    owners = np.repeat(np.arange(len(kept)), counts)
+
+    corners = np.concatenate(corners)
+    corner_norms = np.linalg.norm(corners, axis=1)
+    boresights = np.array([boresight for entry, boresight in kept])
+    boresights = boresights / np.linalg.norm(boresights, axis=1)[:, np.newaxis]
+
+    zero_corners = np.logical_or.reduceat(corner_norms == 0.0, starts)
+    corners = corners / np.where(corner_norms == 0.0, 1.0, corner_norms)[:, np.newaxis]
+    corner_boresights = boresights[owners]
+
+    half_angles = np.arctan2(np.linalg.norm(np.cross(corner_boresights, corners), axis=1),
+                             np.einsum('ij,ij->i', corner_boresights, corners))
+    max_half_angles = np.maximum.reduceat(half_angles, starts)
+
+    # Next corner of every corner, the first one after the last
+    next_corners = np.arange(len(corners)) + 1
+    next_corners[starts + counts - 1] = starts
+    sides = np.einsum('ij,ij->i', corner_boresights, np.cross(corners, corners[next_corners]))
+    is_inside = (np.minimum.reduceat(sides, starts) > 0.0) | (np.maximum.reduceat(sides, starts) < 0.0)
+
+    for idx, ((path, ins_id, variables, shape), boresight) in enumerate(kept):
+        variable = variables['FOV_BOUNDARY_CORNERS']
+        if zero_corners[idx]:
+            log_error("FOV_GEOMETRY", "{} has zero corner vectors on line: {}", path, variable['name'],
+                      variable['line'])
+            invalid.add(path)
+            continue
+
+        if max_half_angles[idx] >= MAX_FOV_HALF_ANGLE:
+            log_error("FOV_GEOMETRY", "INS{} FOV half-angle of {:.6f} degrees is not below 90 degrees on line: {}",
+                      path, ins_id, np.degrees(max_half_angles[idx]), variable['line'])
+            invalid.add(path)
+
+        elif shape in ('RECTANGLE', 'POLYGON') and not is_inside[idx]:
+            if shape == 'RECTANGLE':
+                log_error("FOV_GEOMETRY", "INS{} boresight is not inside the FOV of {} on line: {}", path,
+                          ins_id, variable['name'], variable['line'])
+                invalid.add(path)
+            else:
+                log_warn("FOV_GEOMETRY", "INS{} boresight is not inside the FOV of {}, or the FOV is not convex "
+                         "on line: {}", path, ins_id, variable['name'], variable['line'])
+
+    return
+
+
+def check_fov_angles(entries, boresights, invalid):
+    """
+    Check the FOVs given by angles, for all the instruments at once: the
+    reference vector not parallel to the boresight and the reference and
+    cross angles between 0 and 90 degrees.
+    """
+    ref_entries = [(path, ins_id, variables['FOV_REF_VECTOR']) for path, ins_id, variables, shape in entries]
+    indexes, ref_vectors = stack_values(ref_entries, 3, "FOV_GEOMETRY", invalid)
+    ref_boresights = np.array([boresights[idx] for idx in indexes]).reshape(-1, 3)
+    parallel = np.linalg.norm(np.cross(ref_boresights, ref_vectors), axis=1) \
+        <= 1.0e-12 * np.linalg.norm(ref_boresights, axis=1) * np.linalg.norm(ref_vectors, axis=1)
+    for idx in np.flatnonzero(parallel):
+        path, ins_id, variable = ref_entries[indexes[idx]]
+        log_error("FOV_GEOMETRY", "{} is zero or parallel to the boresight on line: {}", path,
+                  variable['name'], variable['line'])
+        invalid.add(path)
+
+    angle_entries = []
+    angle_units = []
+    for path, ins_id, variables, shape in entries:
+        units = get_string_value(variables['FOV_ANGLE_UNITS'])
+        if units not in ANGLE_UNITS:
+            log_error("FOV_GEOMETRY", "{} = '{}' is not any of the angle units: {} on line: {}", path,
+                      variables['FOV_ANGLE_UNITS']['name'], units, ", ".join(ANGLE_UNITS),
+                      variables['FOV_ANGLE_UNITS']['line'])
+            invalid.add(path)
+            continue
+
+        for keyword in ['FOV_REF_ANGLE'] + (['FOV_CROSS_ANGLE'] if shape != 'CIRCLE' else []):
+            angle_entries.append((path, ins_id, variables[keyword]))
+            angle_units.append(ANGLE_UNITS[units])
+
+    indexes, angles = stack_values(angle_entries, 1, "FOV_GEOMETRY", invalid)
+    angles = angles[:, 0] * np.array(angle_units)[indexes] if len(indexes) else np.zeros(0)
+    for idx in np.flatnonzero((angles <= 0.0) | (angles >= MAX_FOV_HALF_ANGLE)):
+        path, ins_id, variable = angle_entries[indexes[idx]]
+        log_error("FOV_GEOMETRY", "{} of {:.6f} degrees is not between 0 and 90 degrees on line: {}", path,
+                  variable['name'], np.degrees(angles[idx]), variable['line'])
+        invalid.add(path)
+
+    return
+
+
+def check_fovs(instruments, invalid):
+    """
+    Check the (path, instrument ID, variables) FOVs by their shape and class.
+    """
+    corners_entries = []
+    angles_entries = []
+
+    for path, ins_id, variables in instruments:
+        if 'FOV_SHAPE' not in variables:
+            continue
+        shape_variable = variables['FOV_SHAPE']
+        shape = get_string_value(shape_variable)
+        if shape not in FOV_SHAPE_CORNERS:
+            log_error("FOV_GEOMETRY", "{} = '{}' is not any of: {} on line: {}", path, shape_variable['name'],
+                      shape, ", ".join(FOV_SHAPE_CORNERS), shape_variable['line'])
+            invalid.add(path)
+            continue
+
+        fov_class = get_string_value(variables['FOV_CLASS_SPEC']) if 'FOV_CLASS_SPEC' in variables else 'CORNERS'
+        if fov_class == 'ANGLES':
+            required = ['BORESIGHT', 'FOV_REF_VECTOR', 'FOV_REF_ANGLE', 'FOV_ANGLE_UNITS'] + \
+                (['FOV_CROSS_ANGLE'] if shape != 'CIRCLE' else [])
+        elif fov_class == 'CORNERS':
+            required = ['BORESIGHT', 'FOV_BOUNDARY_CORNERS']
+        else:
+            log_error("FOV_GEOMETRY", "{} = '{}' is not any of: CORNERS, ANGLES on line: {}", path,
+                      variables['FOV_CLASS_SPEC']['name'], fov_class, variables['FOV_CLASS_SPEC']['line'])
+            invalid.add(path)
+            continue
+
+        missing = ['INS' + str(ins_id) + '_' + keyword for keyword in required if keyword not in variables]
+        if missing:
+            log_error("FOV_GEOMETRY", "{} not found for the FOV of INS{}", path, ", ".join(missing), ins_id)
+            invalid.add(path)
+            continue
+
+        if fov_class == 'ANGLES':
+            angles_entries.append((path, ins_id, variables, shape))
+        else:
+            corners_entries.append((path, ins_id, variables, shape))
+
+    # Boresights of all the FOVs at once, only the FOVs with a valid
+    # boresight are checked further
+    entries = corners_entries + angles_entries
+    boresight_entries = [(path, ins_id, variables['BORESIGHT']) for path, ins_id, variables, shape in entries]
+    indexes, boresights = stack_values(boresight_entries, 3, "FOV_GEOMETRY", invalid)
+    is_zero = np.linalg.norm(boresights, axis=1) == 0.0
+    for idx in np.flatnonzero(is_zero):
+        path, ins_id, variable = boresight_entries[indexes[idx]]
+        log_error("FOV_GEOMETRY", "{} is a zero vector on line: {}", path, variable['name'], variable['line'])
+        invalid.add(path)
+
+    valid_boresights = {indexes[idx]: boresights[idx] for idx in np.flatnonzero(~is_zero)}
+    for fov_entries, offset, check in [(corners_entries, 0, check_fov_corners),
+                                       (angles_entries, len(corners_entries), check_fov_angles)]:
+        kept = [idx for idx in range(len(fov_entries)) if offset + idx in valid_boresights]
+        check([fov_entries[idx] for idx in kept], [valid_boresights[offset + idx] for idx in kept], invalid)
+
+    return
+
+
+def check_geometry(kernel_paths):
+    """
+    Check the static TK frames of the FKs and the FOVs of the IKs of a list
+    of text kernels at once.
+
+    :return: set
+       The kernels with errors.
+    """
+    frames = []
+    instruments = []
+    invalid = set()
+
+    for path in kernel_paths:
+        try:
+            variables = parse_kernel_pool(path)
+        except Exception as ex:
+            log_warn("DATA_AND_COMMENTS", "Geometry not checked, parsing data of: " + path + " , exception: "
+                     + str(ex), path)
+            continue
+
+        kernel_frames, kernel_instruments = get_kernel_geometry(variables)
+        frames.extend((path, frame, frame_variables) for frame, frame_variables in kernel_frames.items())
+        instruments.extend((path, ins_id, ins_variables) for ins_id, ins_variables in kernel_instruments.items())
+
+    check_tkframes(frames, invalid)
+    check_fovs(instruments, invalid)
+
+    return invalid
@@ -0,0 +1,150 @@
+import re
+
+import numpy as np
+
+#
+# Parser of the data sections of SPICE text kernels (Kernel Pool Language).
+# The values of every variable are kept as tokens with the line number they
+# come from, so that the checks can report the line of every value, and the
+# numeric values are converted in bulk into NumPy arrays, without evaluating
+# them one by one.
+#
+#    \begindata
+#
+#       SCLK01_COEFFICIENTS_41 = (  0.0000000000000E+00   -9.3076781592355E+07   1.0000000000000E+00
+#                                   ...                                                              )
+#
+#    \begintext
+#
+BEGIN_DATA = '\\begindata'
+BEGIN_TEXT = '\\begintext'
+
+TOKEN_REGEX = re.compile(r"'(?:[^']|'')*'|\+=|=|\(|\)|@[^\s,()]+|[^\s,()=']+")
+NAME_REGEX = re.compile(r"^[^\s=()',]{1,32}$")
+
+# Fortran double precision exponents
+EXPONENT_TABLE = str.maketrans('Dd', 'Ee')
+
+
+def parse_kernel_pool(kernel_path):
+    """
+    Parse the data sections of a text kernel.
+
+    :return: dict
+       The variables by name, each one a dict with the line of its first
+       assignment, its 'values' as tokens (strings keep their quotes) and
+       the 'lines' of every value. Assignments with '+=' append values, and
+       'append' is True if the first one of the file is a '+=', that appends
+       to the values of the variable loaded by previous kernels.
+    """
+    with open(kernel_path, 'r', errors='replace') as f:
+        return parse_kernel_pool_text(f, kernel_path)
+
+
+def parse_kernel_pool_text(lines, kernel_path=''):
+
+    variables = {}
+
+    inside_data = False
+    name = None
+    variable = None
+    expecting = 'name'
+
+    for line_nr, line in enumerate(lines, 1):
+
+        stripped = line.strip()
+        if stripped == BEGIN_DATA:
+            inside_data = True
+            continue
+        if stripped == BEGIN_TEXT:
+            if expecting != 'name':
+                raise Exception("Assignment of " + str(name) + " not completed before \\begintext at: "
+                                + kernel_path + " on line: " + str(line_nr))
+            inside_data = False
+            continue
+        if not inside_data or not stripped:
+            continue
+
+        tokens = TOKEN_REGEX.findall(line)
+        while tokens:
+
+            if expecting == 'name':
+                name = tokens.pop(0)
+                if not NAME_REGEX.match(name):
+                    raise Exception("Wrong variable name: '" + name + "' at: " + kernel_path
+                                    + " on line: " + str(line_nr))
+                expecting = 'operator'
+
+            elif expecting == 'operator':
+                operator = tokens.pop(0)
+                if operator not in ('=', '+='):
+                    raise Exception("Expected '=' or '+=' after " + name + " at: " + kernel_path
+                                    + " on line: " + str(line_nr))
+                if operator == '=' or name not in variables:
+                    variables[name] = {'name': name, 'line': line_nr, 'values': [], 'lines': [],
+                                       'append': operator == '+='}
+                variable = variables[name]
+                expecting = 'value'
+
+            elif expecting == 'value':
+                if tokens[0] == '(':
+                    tokens.pop(0)
+                    expecting = 'vector'
+                else:
+                    add_values(variable, [tokens.pop(0)], line_nr, kernel_path)
+                    expecting = 'name'
+
+            elif expecting == 'vector':
+                if ')' in tokens:
+                    end = tokens.index(')')
+                    add_values(variable, tokens[:end], line_nr, kernel_path)
+                    tokens = tokens[end + 1:]
+                    expecting = 'name'
+                else:
+                    add_values(variable, tokens, line_nr, kernel_path)
+                    tokens = []
+
+    if expecting != 'name':
+        raise Exception("Assignment of " + str(name) + " not completed at the end of: " + kernel_path)
+
+    return variables
+
+
+def add_values(variable, tokens, line_nr, kernel_path):
+
+    for token in ('=', '+=', '('):
+        if token in tokens:
+            raise Exception("Unexpected '" + token + "' in the values of " + variable['name'] + " at: "
+                            + kernel_path + " on line: " + str(line_nr))
+
+    variable['values'].extend(tokens)
+    variable['lines'].extend([line_nr] * len(tokens))
+
+    return
+
+
+def get_numeric_values(variable):
+    """
+    Return the values of a variable as a float NumPy array, converted in a
+    single call. Raises an Exception naming the line of the first value
+    that is not a number.
+    """
+    values = variable['values']
+    try:
+        return np.array(' '.join(values).translate(EXPONENT_TABLE).split(), dtype=np.float64)
+    except ValueError:
+        for value, line_nr in zip(values, variable['lines']):
+            try:
+                float(value.translate(EXPONENT_TABLE))
+            except ValueError:
+                raise Exception("Value: " + value + " of " + variable['name'] + " is not a number on line: "
+                                + str(line_nr))
+        raise
+
+
+def get_string_values(variable):
+    """
+    Return the string values of a variable without quotes.
+    """
+    return [value[1:-1].replace("''", "'") if value.startswith("'") else value
+            for value in variable['values']]
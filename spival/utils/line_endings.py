@@ -0,0 +1,126 @@
+import os
+import shutil
+
+from concurrent.futures import ProcessPoolExecutor
+from tempfile import mkstemp
+
+import numpy as np
+
+#
+# Normalizer of the line endings of archive products: CRLF for the PDS3
+# labels and LF for the meta-kernels. Files are streamed in chunks, first
+# scanned with NumPy to find out if any line ending has to change, and only
+# the files that differ are rewritten, to a temporary file next to them that
+# then replaces them, so that an interrupted run never leaves partial files.
+#
+LINE_ENDINGS = {'.LBL': b'\r\n', '.TM': b'\n'}
+LINE_ENDING_NAMES = {b'\r\n': 'CRLF', b'\n': 'LF'}
+
+CHUNK_SIZE = 1024 * 1024
+
+
+def get_line_ending(path):
+    """
+    Return the line ending of a file by its extension, None if its line
+    endings are not normalized.
+    """
+    return LINE_ENDINGS.get(os.path.splitext(path)[1].upper())
+
+
+def needs_normalization(path, line_ending, chunk_size=CHUNK_SIZE):
+    """
+    Scan a file for line feeds without (CRLF) or with (LF) a preceding
+    carriage return. Lone carriage returns are left as they are.
+    """
+    previous = 0
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            data = np.frombuffer(chunk, dtype=np.uint8)
+            line_feeds = np.flatnonzero(data == 10)
+            if len(line_feeds):
+                # Byte before every line feed, the last one of the previous
+                # chunk for a line feed at the start of this one
+                preceding = data[np.maximum(line_feeds - 1, 0)]
+                if line_feeds[0] == 0:
+                    preceding[0] = previous
+                has_cr = preceding == 13
+                if line_ending == b'\r\n' and not np.all(has_cr) or line_ending == b'\n' and np.any(has_cr):
+                    return True
+            previous = data[-1]
+
+    return False
+
+
+def normalize_file(path, line_ending, chunk_size=CHUNK_SIZE):
+    """
+    Rewrite the line endings of a file, streaming it into a temporary file
+    that replaces it. A carriage return at the end of a chunk is carried
+    over to the next one, so that CRLF split across chunks is converted.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fh, tmp_path = mkstemp(dir=directory, prefix='.' + os.path.basename(path) + '.', suffix='.tmp')
+    try:
+        with open(path, 'rb') as src, os.fdopen(fh, 'wb') as dst:
+            pending = b''
+            for chunk in iter(lambda: src.read(chunk_size), b''):
+                chunk = pending + chunk
+                pending = b''
+                if chunk.endswith(b'\r'):
+                    chunk, pending = chunk[:-1], b'\r'
+                dst.write(convert_line_endings(chunk, line_ending))
+            dst.write(pending)
+        shutil.copymode(path, tmp_path)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def convert_line_endings(data, line_ending):
+    data = data.replace(b'\r\n', b'\n')
+    if line_ending == b'\r\n':
+        data = data.replace(b'\n', b'\r\n')
+    return data
+
+
+def normalize_task(task):
+    path, line_ending, dry_run = task
+    if not needs_normalization(path, line_ending):
+        return False
+    if not dry_run:
+        normalize_file(path, line_ending)
+    return True
+
+
+def normalize_line_endings(archive_path, dry_run=False, processes=None):
+    """
+    Normalize the line endings of the labels and meta-kernels of an
+    archive. With ``dry_run`` the files are only reported.
+
+    :return: list
+       The files that were (or would be) rewritten.
+    """
+    tasks = []
+    for root, dirs, names in os.walk(archive_path):
+        dirs.sort()
+        for name in sorted(names):
+            line_ending = get_line_ending(name)
+            if line_ending is not None:
+                tasks.append((os.path.join(root, name), line_ending, dry_run))
+
+    if len(tasks) < 2 or processes == 1:
+        results = [normalize_task(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            results = list(executor.map(normalize_task, tasks, chunksize=max(len(tasks) // 64, 1)))
+
+    normalized = []
+    action = "To normalize" if dry_run else "Normalized"
+    for (path, line_ending, task_dry_run), changed in zip(tasks, results):
+        if changed:
+            normalized.append(path)
+            print(action + " (" + LINE_ENDING_NAMES[line_ending] + "): " + path)
+    print("Info: " + action + " " + str(len(normalized)) + " of " + str(len(tasks)) + " files.")
+
+    return normalized
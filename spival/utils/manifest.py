@@ -0,0 +1,172 @@
+import hashlib
+import json
+import mmap
+import os
+
+from concurrent.futures import ThreadPoolExecutor
+
+from spival.utils.utils import write_atomic
+
+#
+# Checksum manifest of the files of an SKD. Files are hashed in a thread
+# pool (hashlib releases the GIL on large buffers) with whole reads for
+# small files and memory mapped reads for large ones. The digests are kept
+# by file with the inode, size and modification time they were computed
+# for, so that unchanged files are not hashed again, neither within a run
+# (files_are_equal, duplicated kernels) nor across runs when a previous
+# manifest is given.
+#
+MANIFEST_VERSION = 1
+MANIFEST_ALGORITHMS = ['md5', 'blake2b']
+MANIFEST_WORKERS = min(os.cpu_count() or 4, 8)
+
+# Files up to this size are read at once, larger ones are memory mapped and
+# hashed in blocks of HASH_BLOCK_SIZE
+READ_SIZE = 8 * 1024 * 1024
+HASH_BLOCK_SIZE = 8 * 1024 * 1024
+
+# Absolute path -> {'inode', 'size', 'mtime', 'digests': {algorithm: digest}}
+FILE_DIGESTS = {}
+
+
+def get_file_stat(path):
+    stat = os.stat(path)
+    return stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+
+def hash_file(path, algorithm='md5'):
+
+    if algorithm not in MANIFEST_ALGORITHMS:
+        raise Exception("Unsupported checksum algorithm: " + str(algorithm) + ", expected one of: "
+                        + str(MANIFEST_ALGORITHMS))
+
+    digest = hashlib.new(algorithm)
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size <= READ_SIZE:
+            digest.update(f.read())
+        else:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                with memoryview(data) as view:
+                    for start in range(0, size, HASH_BLOCK_SIZE):
+                        digest.update(view[start:start + HASH_BLOCK_SIZE])
+
+    return digest.hexdigest()
+
+
+def get_file_digest(path, algorithm='md5'):
+    """
+    Return the digest of a file, hashing it only if it is not known for its
+    current inode, size and modification time.
+    """
+    key = os.path.abspath(path)
+    inode, size, mtime = get_file_stat(key)
+
+    entry = FILE_DIGESTS.get(key)
+    if entry is None or (entry['inode'], entry['size'], entry['mtime']) != (inode, size, mtime):
+        entry = {'inode': inode, 'size': size, 'mtime': mtime, 'digests': {}}
+        FILE_DIGESTS[key] = entry
+
+    if algorithm not in entry['digests']:
+        entry['digests'][algorithm] = hash_file(key, algorithm)
+
+    return entry['digests'][algorithm]
+
+
+def get_file_digests(files, algorithm='md5', workers=MANIFEST_WORKERS):
+    """
+    Return the digests of a list of files by path, hashing the unknown ones
+    concurrently.
+    """
+    with ThreadPoolExecutor(max_workers=max(workers, 1)) as executor:
+        digests = list(executor.map(lambda path: get_file_digest(path, algorithm), files))
+
+    return dict(zip(files, digests))
+
+
+def get_duplicated_files(digests):
+    """
+    Group the files of a {path: digest} dict with the same digest.
+
+    :return: list
+       The sorted lists of paths of the files with more than one copy.
+    """
+    by_digest = {}
+    for path, digest in digests.items():
+        by_digest.setdefault(digest, []).append(path)
+
+    return sorted(sorted(paths) for paths in by_digest.values() if len(paths) > 1)
+
+
+def load_manifest(manifest_file):
+    """
+    Read a manifest and add its digests to the known digests, to be reused
+    for the files that did not change since it was written.
+    """
+    with open(manifest_file, 'r') as f:
+        manifest = json.load(f)
+
+    if manifest.get('version') != MANIFEST_VERSION:
+        raise Exception("Unsupported manifest version: " + str(manifest.get('version')) + " of: " + manifest_file)
+
+    algorithm = manifest['algorithm']
+    for relative_path, entry in manifest['files'].items():
+        key = os.path.abspath(os.path.join(manifest['root'], relative_path))
+        known = FILE_DIGESTS.get(key)
+        if known is None or (known['inode'], known['size'], known['mtime']) \
+                != (entry['inode'], entry['size'], entry['mtime']):
+            known = {'inode': entry['inode'], 'size': entry['size'], 'mtime': entry['mtime'], 'digests': {}}
+            FILE_DIGESTS[key] = known
+        known['digests'].setdefault(algorithm, entry['digest'])
+
+    return manifest
+
+
+def build_manifest(root, algorithm='md5', previous=None, workers=MANIFEST_WORKERS, exclude=None):
+    """
+    Hash all the files below ``root``, skipping hidden directories and the
+    ``exclude`` files, reusing the digests of the ``previous`` manifest file
+    for the files that did not change.
+
+    :return: dict
+       The manifest, with the 'algorithm', the absolute 'root' and the
+       'files' by path relative to the root, each with its 'digest',
+       'inode', 'size' and 'mtime'.
+    """
+    if previous is not None and os.path.exists(previous):
+        load_manifest(previous)
+
+    root = os.path.abspath(root)
+    exclude = [os.path.abspath(path) for path in (exclude or [])]
+
+    files = []
+    for dir_path, dir_names, file_names in os.walk(root):
+        dir_names[:] = sorted(name for name in dir_names if not name.startswith('.'))
+        files.extend(os.path.join(dir_path, name) for name in sorted(file_names)
+                     if os.path.join(dir_path, name) not in exclude)
+
+    digests = get_file_digests(files, algorithm, workers)
+
+    entries = {}
+    for path in files:
+        entry = FILE_DIGESTS[path]
+        entries[os.path.relpath(path, root)] = {'digest': digests[path], 'inode': entry['inode'],
+                                                'size': entry['size'], 'mtime': entry['mtime']}
+
+    return {'version': MANIFEST_VERSION,
+            'algorithm': algorithm,
+            'root': root,
+            'files': entries}
+
+
+def write_manifest(manifest, manifest_file):
+    write_atomic(manifest_file, json.dumps(manifest, indent=1, sort_keys=True))
+
+
+def write_checksums(manifest, checksums_file):
+    """
+    Write the digests in the '<digest>  <relative path>' format of md5sum,
+    as used by the PDS checksum manifests.
+    """
+    lines = [entry['digest'] + '  ' + path for path, entry in sorted(manifest['files'].items())]
+    write_atomic(checksums_file, '\n'.join(lines) + '\n')
@@ -0,0 +1,279 @@
+import datetime
+import json
+import os
+
+import numpy as np
+
+from spival.utils.daf import read_daf_descriptors
+from spival.utils.kpl import parse_kernel_pool
+from spival.utils.pool_snapshot import get_mk_kernels
+from spival.utils.skd_constants import KERNEL_BINARY_EXTENSIONS
+
+#
+# Load cost and shadowed kernels of meta-kernels, from the DAF descriptors
+# of their binary kernels, read without loading them in the kernel pool.
+#
+# SPICE gives priority to the kernels loaded later, so a SPK, CK or binary
+# PCK whose coverage of every object is also covered by kernels loaded after
+# it is never used and could be dropped from the MK. The coverage is the one
+# of the segment descriptors: the interpolation intervals within the
+# segments (e.g. of type 3 CKs) are not read. The descriptors of every
+# kernel are read once per run, and the coverages are merged with NumPy.
+#
+DAF_COVERAGE_KINDS = {'SPK': {'idword': 'DAF/SPK', 'extension': '.bsp', 'object': 0, 'units': 'ET'},
+                      'CK': {'idword': 'DAF/CK', 'extension': '.bc', 'object': 0, 'units': 'SCLK ticks'},
+                      'PCK': {'idword': 'DAF/PCK', 'extension': '.bpc', 'object': 0, 'units': 'ET'}}
+
+# Integer component of the CK descriptors that flags the angular velocity,
+# the segments with it are only shadowed by segments that have it
+CK_RATES = 3
+
+# Estimated cost of loading a kernel (seconds): opening the file, parsing
+# the text kernels by byte and buffering the segment descriptors of the
+# binary ones on their first search
+LOAD_TIME_PER_FILE = 1.0e-4
+LOAD_TIME_PER_TEXT_BYTE = 5.0e-8
+LOAD_TIME_PER_SEGMENT = 2.0e-6
+
+# Gaps shown per object in the text report
+MAX_SHOWN_GAPS = 10
+
+J2000 = datetime.datetime(2000, 1, 1, 12, 0, 0)
+
+# Absolute path -> {'size', 'mtime', 'kind', 'segments', 'objects', 'starts', 'ends'}
+KERNEL_COVERAGES = {}
+
+
+def get_daf_kind(daf, path):
+    for kind, spec in DAF_COVERAGE_KINDS.items():
+        if daf['idword'].startswith(spec['idword']):
+            return kind
+
+    extension = os.path.splitext(path)[1].lower()
+    for kind, spec in DAF_COVERAGE_KINDS.items():
+        if extension == spec['extension']:
+            return kind
+
+    return None
+
+
+def read_kernel_coverage(path):
+    """
+    Return the coverage of a binary kernel by segment, reading its DAF
+    descriptors only if it is not known for its current size and
+    modification time.
+
+    :return: dict
+       The 'kind' of the kernel (SPK, CK, PCK or None), the number of
+       'segments' and the 'objects', 'starts' and 'ends' arrays of the
+       segments. The objects of the CK segments are keyed by instrument
+       and angular velocity, as 2 * instrument ID + 1 if they have it.
+    """
+    key = os.path.abspath(path)
+    stat = os.stat(key)
+
+    coverage = KERNEL_COVERAGES.get(key)
+    if coverage is not None and (coverage['size'], coverage['mtime']) == (stat.st_size, stat.st_mtime_ns):
+        return coverage
+
+    coverage = {'size': stat.st_size, 'mtime': stat.st_mtime_ns, 'kind': None, 'segments': 0,
+                'objects': np.zeros(0, dtype=np.int64), 'starts': np.zeros(0), 'ends': np.zeros(0)}
+
+    if os.path.splitext(key)[1].lower() in KERNEL_BINARY_EXTENSIONS:
+        try:
+            daf = read_daf_descriptors(key)
+        except Exception:
+            daf = None
+
+        if daf is not None:
+            kind = get_daf_kind(daf, key)
+            coverage['segments'] = len(daf['doubles'])
+            if kind is not None and daf['nd'] >= 2 and len(daf['doubles']):
+                objects = daf['integers'][:, DAF_COVERAGE_KINDS[kind]['object']].astype(np.int64)
+                if kind == 'CK':
+                    objects = objects * 2 + (daf['integers'][:, CK_RATES] != 0)
+                coverage.update({'kind': kind, 'objects': objects,
+                                 'starts': daf['doubles'][:, 0].copy(), 'ends': daf['doubles'][:, 1].copy()})
+
+    KERNEL_COVERAGES[key] = coverage
+
+    return coverage
+
+
+def merge_intervals(starts, ends):
+    """
+    Return the union of intervals as the sorted starts and ends arrays of
+    the disjoint intervals.
+    """
+    if not len(starts):
+        return starts, ends
+
+    order = np.argsort(starts, kind='stable')
+    starts, ends = starts[order], ends[order]
+    max_ends = np.maximum.accumulate(ends)
+
+    # A new interval starts where the start is after all the previous ends
+    breaks = np.flatnonzero(starts[1:] > max_ends[:-1]) + 1
+    first = np.concatenate([[0], breaks])
+    last = np.concatenate([breaks - 1, [len(starts) - 1]])
+
+    return starts[first], max_ends[last]
+
+
+def are_covered(starts, ends, union_starts, union_ends):
+    """
+    Return whether every (start, end) interval is within the union.
+    """
+    if not len(union_starts):
+        return np.zeros(len(starts), dtype=bool)
+
+    idx = np.searchsorted(union_starts, starts, side='right') - 1
+    return (idx >= 0) & (union_ends[np.maximum(idx, 0)] >= ends)
+
+
+def get_ck_object(key):
+    """
+    Return the instrument ID of a CK coverage key and if it has angular velocity.
+    """
+    return key // 2, bool(key % 2)
+
+
+def analyze_mk(mk_path):
+    """
+    Analyze the kernels of a meta-kernel. The paths of the kernels are
+    relative to the directory of the MK, as when the MK is loaded from it.
+
+    :return: dict
+       The 'mk', its 'kernels' in load order (dicts with 'path', 'exists',
+       'kind', 'size', 'segments', estimated 'load_time' and 'shadowed'),
+       the total 'bytes', 'segments' and 'load_time', the 'missing' and
+       'shadowed' kernels, and the coverage 'gaps' of the MK by kind and
+       object, as (start, end) tuples.
+    """
+    mk_dir = os.path.dirname(os.path.abspath(mk_path))
+    kernels = [os.path.normpath(kernel) for kernel in get_mk_kernels(parse_kernel_pool(mk_path))]
+
+    analysis_kernels = []
+    coverages = []
+    for kernel in kernels:
+        path = os.path.join(mk_dir, kernel)
+        exists = os.path.isfile(path)
+        coverage = read_kernel_coverage(path) if exists else None
+        size = coverage['size'] if exists else 0
+        segments = coverage['segments'] if exists else 0
+
+        load_time = 0.0
+        if exists:
+            load_time = LOAD_TIME_PER_FILE + LOAD_TIME_PER_SEGMENT * segments
+            if os.path.splitext(path)[1].lower() not in KERNEL_BINARY_EXTENSIONS:
+                load_time += LOAD_TIME_PER_TEXT_BYTE * size
+
+        analysis_kernels.append({'path': kernel, 'exists': exists, 'kind': coverage['kind'] if exists else None,
+                                 'size': size, 'segments': segments, 'load_time': load_time, 'shadowed': False})
+        coverages.append(coverage)
+
+    # Coverage of the kernels loaded after every kernel, walking them
+    # backwards from the highest priority one
+    unions = {}
+    for idx in range(len(kernels) - 1, -1, -1):
+        coverage = coverages[idx]
+        if coverage is None or coverage['kind'] is None:
+            continue
+
+        kind = coverage['kind']
+        objects, starts, ends = coverage['objects'], coverage['starts'], coverage['ends']
+        is_shadowed = len(objects) > 0
+        for key in np.unique(objects):
+            selected = objects == key
+
+            # Segments without angular velocity are also covered by the
+            # ones with it
+            covering_keys = [(key, kind)] + ([(key + 1, kind)] if kind == 'CK' and not key % 2 else [])
+            covering = [unions[covering_key] for covering_key in covering_keys if covering_key in unions]
+            if not covering:
+                is_shadowed = False
+                break
+
+            union_starts, union_ends = merge_intervals(np.concatenate([union[0] for union in covering]),
+                                                       np.concatenate([union[1] for union in covering]))
+            if not np.all(are_covered(starts[selected], ends[selected], union_starts, union_ends)):
+                is_shadowed = False
+                break
+
+        analysis_kernels[idx]['shadowed'] = is_shadowed
+
+        for key in np.unique(objects):
+            selected = objects == key
+            union_starts, union_ends = unions.get((key, kind), (np.zeros(0), np.zeros(0)))
+            unions[(key, kind)] = merge_intervals(np.concatenate([union_starts, starts[selected]]),
+                                                  np.concatenate([union_ends, ends[selected]]))
+
+    # Gaps of the coverage of the whole MK by object, the CK coverage with
+    # and without angular velocity together
+    merged = {}
+    for (key, kind), (union_starts, union_ends) in unions.items():
+        object_id = get_ck_object(key)[0] if kind == 'CK' else key
+        starts, ends = merged.get((kind, object_id), (np.zeros(0), np.zeros(0)))
+        merged[(kind, object_id)] = merge_intervals(np.concatenate([starts, union_starts]),
+                                                    np.concatenate([ends, union_ends]))
+
+    gaps = {}
+    for (kind, object_id), (union_starts, union_ends) in sorted(merged.items()):
+        if len(union_starts) > 1:
+            gaps.setdefault(kind, {})[int(object_id)] = list(zip(union_ends[:-1].tolist(),
+                                                                 union_starts[1:].tolist()))
+
+    return {'mk': mk_path,
+            'kernels': analysis_kernels,
+            'bytes': sum(kernel['size'] for kernel in analysis_kernels),
+            'segments': sum(kernel['segments'] for kernel in analysis_kernels),
+            'load_time': sum(kernel['load_time'] for kernel in analysis_kernels),
+            'missing': [kernel['path'] for kernel in analysis_kernels if not kernel['exists']],
+            'shadowed': [kernel['path'] for kernel in analysis_kernels if kernel['shadowed']],
+            'gaps': gaps}
+
+
+def format_time(value, kind):
+    if DAF_COVERAGE_KINDS[kind]['units'] == 'ET':
+        try:
+            return (J2000 + datetime.timedelta(seconds=value)).strftime('%Y-%m-%dT%H:%M:%S') + ' TDB'
+        except OverflowError:
+            return str(value) + ' ET'
+    return '{:.0f}'.format(value)
+
+
+def write_mk_analysis(analysis, output_format='text'):
+
+    if output_format == 'json':
+        print(json.dumps(dict(analysis, gaps={kind: {str(object_id): object_gaps
+                                                     for object_id, object_gaps in kind_gaps.items()}
+                                              for kind, kind_gaps in analysis['gaps'].items()}), indent=2))
+        return
+
+    print("Meta-kernel: " + analysis['mk'])
+    print("")
+    print("   Kernels: " + str(len(analysis['kernels'])) + ", bytes: " + str(analysis['bytes']) +
+          ", segments: " + str(analysis['segments']) + ", estimated load time: " +
+          "{:.3f}".format(analysis['load_time']) + " s")
+
+    for path in analysis['missing']:
+        print("   Missing kernel: " + path)
+
+    if analysis['shadowed']:
+        print("")
+        print("   Kernels shadowed by the kernels loaded after them, that could be dropped:")
+        for path in analysis['shadowed']:
+            print("      " + path)
+
+    for kind, kind_gaps in sorted(analysis['gaps'].items()):
+        print("")
+        print("   " + kind + " coverage gaps (" + DAF_COVERAGE_KINDS[kind]['units'] + "):")
+        for object_id, object_gaps in sorted(kind_gaps.items()):
+            print("      " + str(object_id) + ": " + str(len(object_gaps)) + " gaps")
+            for start, end in object_gaps[:MAX_SHOWN_GAPS]:
+                print("         " + format_time(start, kind) + " - " + format_time(end, kind))
+            if len(object_gaps) > MAX_SHOWN_GAPS:
+                print("         ...")
+    print("")
+
+    return
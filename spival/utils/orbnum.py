@@ -0,0 +1,359 @@
+import os
+
+import numpy as np
+
+from spival.utils.skd_val_logger import log_error, log_info, log_warn
+
+#
+# Validation of the orbit number files generated by the NAIF ORBNUM utility.
+# The files are fixed-width tables of tens of MB: they are streamed and the
+# orbit numbers and event times of every chunk of rows are parsed into NumPy
+# arrays, so that the memory used does not depend on the size of the file.
+#
+#     No.     Event UTC PERI       Event SCLK PERI     OP-Event UTC APO  ...
+#    ===== ==================== ================ ====================  ...
+#        1  2003 DEC 25 04:55:44    1/0061880044 2003 DEC 26 02:26:51  ...
+#
+ORBNUM_CHUNK_SIZE = 50000
+
+UNDETERMINED_EVENT = 'Unable to determine'
+
+MONTHS = {'JAN': '01', 'FEB': '02', 'MAR': '03', 'APR': '04', 'MAY': '05', 'JUN': '06',
+          'JUL': '07', 'AUG': '08', 'SEP': '09', 'OCT': '10', 'NOV': '11', 'DEC': '12'}
+
+# Orbits whose event time is further than this from the SPK coverage
+# (in orbital periods) are reported.
+COVERAGE_TOLERANCE_PERIODS = 2.0
+
+# Kernel inventories of the SKDs of the orbit number files, by SKD path
+INVENTORIES = {}
+
+
+def is_valid_orbnum_file(orbnum_path, chunk_size=ORBNUM_CHUNK_SIZE):
+
+    try:
+        stats = check_orbnum_table(orbnum_path, chunk_size)
+    except Exception as ex:
+        log_error("ORBNUM_FORMAT", "Reading orbit number file: " + orbnum_path + " , exception: " + str(ex),
+                  orbnum_path)
+        return False
+
+    if stats is None:
+        return False
+
+    is_valid = stats['valid']
+
+    if stats['rows']:
+        if not check_orbnum_coverage(orbnum_path, stats):
+            is_valid = False
+
+    return is_valid
+
+
+def get_column_spans(separator_line):
+    """
+    Return the (start, end) character spans of the columns of the table,
+    given by the runs of '=' or '-' of the separator line below the header.
+    """
+    spans = []
+    start = None
+    for idx, char in enumerate(separator_line):
+        if char in '=-' and start is None:
+            start = idx
+        elif char not in '=-' and start is not None:
+            spans.append((start, idx))
+            start = None
+    if start is not None:
+        spans.append((start, len(separator_line)))
+
+    return spans
+
+
+def is_separator_line(line):
+    stripped = line.strip()
+    return len(stripped) > 0 and not stripped.strip('=- ')
+
+
+def to_iso_time(utc):
+    # ORBNUM default UTC format is 'YYYY MON DD HR:MN:SC', ISO formats are kept
+    utc = utc.strip()
+    if len(utc) > 8 and utc[5:8].upper() in MONTHS:
+        return utc[0:4] + '-' + MONTHS[utc[5:8].upper()] + '-' + utc[9:11] + 'T' + utc[12:]
+    return utc.replace(' ', 'T')
+
+
+def parse_chunk(line_nrs, orbits, times, orbnum_path):
+    """
+    Parse the orbit number and event time columns of a chunk of rows.
+    Returns the line numbers, orbit numbers and event times (datetime64[ms])
+    of the rows that could be parsed, the others are reported, and if all
+    the rows could be parsed.
+    """
+    line_nrs = np.array(line_nrs, dtype=np.int64)
+
+    try:
+        orbit_array = np.array(orbits).astype(np.int64)
+        orbit_valid = np.ones(len(orbits), dtype=bool)
+    except ValueError:
+        orbit_array = np.zeros(len(orbits), dtype=np.int64)
+        orbit_valid = np.zeros(len(orbits), dtype=bool)
+        for idx, orbit in enumerate(orbits):
+            try:
+                orbit_array[idx] = int(orbit)
+                orbit_valid[idx] = True
+            except ValueError:
+                log_error("ORBNUM_FORMAT", "Wrong orbit number: '{}' at line: {}", orbnum_path,
+                          orbit.strip(), line_nrs[idx])
+
+    iso_times = [to_iso_time(time) for time in times]
+    try:
+        time_array = np.array(iso_times, dtype='datetime64[ms]')
+        time_valid = np.ones(len(times), dtype=bool)
+    except ValueError:
+        time_array = np.zeros(len(times), dtype='datetime64[ms]')
+        time_valid = np.zeros(len(times), dtype=bool)
+        for idx, time in enumerate(iso_times):
+            try:
+                time_array[idx] = np.datetime64(time, 'ms')
+                time_valid[idx] = True
+            except ValueError:
+                log_error("ORBNUM_FORMAT", "Wrong event time: '{}' at line: {}", orbnum_path,
+                          times[idx].strip(), line_nrs[idx])
+
+    valid = orbit_valid & time_valid
+
+    return line_nrs[valid], orbit_array[valid], time_array[valid], bool(np.all(valid))
+
+
+def check_rows(line_nrs, orbits, times, stats, orbnum_path):
+
+    line_nrs, orbit_array, time_array, is_parsed = parse_chunk(line_nrs, orbits, times, orbnum_path)
+    if not is_parsed:
+        stats['valid'] = False
+
+    check_chunk(line_nrs, orbit_array, time_array, stats, orbnum_path)
+
+    return
+
+
+def check_chunk(line_nrs, orbit_array, time_array, stats, orbnum_path):
+    """
+    Check the orbit numbers and event times of a chunk against each other
+    and against the last row of the previous chunk, and update ``stats``.
+    """
+    if not len(orbit_array):
+        return
+
+    if stats['last_orbit'] is not None:
+        orbit_diffs = np.diff(np.concatenate(([stats['last_orbit']], orbit_array)))
+        time_diffs = np.diff(np.concatenate(([stats['last_time']], time_array)))
+        previous_orbits = np.concatenate(([stats['last_orbit']], orbit_array[:-1]))
+    else:
+        orbit_diffs = np.concatenate(([1], np.diff(orbit_array)))
+        time_diffs = np.concatenate(([np.timedelta64(1, 'ms')], np.diff(time_array)))
+        previous_orbits = np.concatenate(([orbit_array[0] - 1], orbit_array[:-1]))
+        stats['first_orbit'] = int(orbit_array[0])
+        stats['first_time'] = time_array[0]
+
+    for idx in np.flatnonzero(orbit_diffs == 0):
+        log_error("ORBNUM_ORBITS", "Duplicated orbit number: {} at line: {}", orbnum_path,
+                  orbit_array[idx], line_nrs[idx])
+        stats['valid'] = False
+
+    for idx in np.flatnonzero(orbit_diffs < 0):
+        log_error("ORBNUM_ORBITS", "Orbit number: {} at line: {} is lower than previous orbit: {}", orbnum_path,
+                  orbit_array[idx], line_nrs[idx], previous_orbits[idx])
+        stats['valid'] = False
+
+    for idx in np.flatnonzero(orbit_diffs > 1):
+        log_error("ORBNUM_ORBITS", "Missing orbits: {} to {} before line: {}", orbnum_path,
+                  previous_orbits[idx] + 1, orbit_array[idx] - 1, line_nrs[idx])
+        stats['valid'] = False
+
+    for idx in np.flatnonzero(time_diffs <= np.timedelta64(0, 'ms')):
+        log_error("ORBNUM_TIMES", "Event time: {} of orbit: {} at line: {} is not after the previous event",
+                  orbnum_path, time_array[idx], orbit_array[idx], line_nrs[idx])
+        stats['valid'] = False
+
+    stats['rows'] += len(orbit_array)
+    stats['last_orbit'] = int(orbit_array[-1])
+    stats['last_time'] = time_array[-1]
+
+    return
+
+
+def check_orbnum_table(orbnum_path, chunk_size=ORBNUM_CHUNK_SIZE):
+    """
+    Stream the table of an orbit number file in chunks of ``chunk_size``
+    rows and check that the orbit numbers are consecutive and the event
+    times increasing.
+
+    :return: dict
+       The number of rows, first and last orbit numbers and event times
+       and if the table is valid, None if the table has no header.
+    """
+    stats = {'valid': True, 'rows': 0,
+             'first_orbit': None, 'first_time': None,
+             'last_orbit': None, 'last_time': None}
+
+    spans = None
+    line_nrs, orbits, times = [], [], []
+
+    with open(orbnum_path, 'r', errors='replace') as f:
+        previous_line = ''
+        for line_nr, line in enumerate(f, 1):
+
+            if spans is None:
+                if is_separator_line(line) and previous_line.strip():
+                    spans = get_column_spans(line.rstrip('\n'))
+                    if len(spans) < 2:
+                        log_error("ORBNUM_FORMAT", "Orbit number table without event time column at line: {}",
+                                  orbnum_path, line_nr)
+                        return None
+                    orbit_span, time_span = spans[0], spans[1]
+                previous_line = line
+                continue
+
+            if not line.strip():
+                continue
+
+            # ORBNUM writes this when an event is not found, e.g. for the last orbit
+            if UNDETERMINED_EVENT in line[time_span[0]:]:
+                log_warn("ORBNUM_TIMES", "Event of orbit: {} could not be determined at line: {}", orbnum_path,
+                         line[orbit_span[0]:orbit_span[1]].strip(), line_nr)
+                continue
+
+            line_nrs.append(line_nr)
+            orbits.append(line[orbit_span[0]:orbit_span[1]])
+            times.append(line[time_span[0]:time_span[1]])
+
+            if len(line_nrs) >= chunk_size:
+                check_rows(line_nrs, orbits, times, stats, orbnum_path)
+                line_nrs, orbits, times = [], [], []
+
+    if spans is None:
+        log_error("ORBNUM_FORMAT", "Orbit number table header not found", orbnum_path)
+        return None
+
+    if line_nrs:
+        check_rows(line_nrs, orbits, times, stats, orbnum_path)
+
+    if not stats['rows']:
+        log_error("ORBNUM_FORMAT", "Orbit number table without orbits", orbnum_path)
+        stats['valid'] = False
+
+    return stats
+
+
+def get_matching_spk(orbnum_path):
+    """
+    Return the SPK of the SKD the orbit number file was generated from: the
+    SPK with the same name, from the kernel inventory of the SKD holding the
+    misc/orbnum directory of the file, built once per SKD. Returns
+    (None, None) if not found.
+    """
+    from spival.classes.inventory import KernelInventory
+
+    orbnum_dir = os.path.dirname(os.path.abspath(orbnum_path))
+    skd_path = os.path.dirname(os.path.dirname(orbnum_dir))
+    if os.path.basename(orbnum_dir).lower() != 'orbnum':
+        return None, None
+
+    inventory = INVENTORIES.get(skd_path)
+    if inventory is None:
+        inventory = KernelInventory(skd_path)
+        INVENTORIES[skd_path] = inventory
+    name = os.path.splitext(os.path.basename(orbnum_path))[0]
+    for spk_name in [name + '.bsp', name + '.BSP']:
+        spk_path = inventory.get_path('spk', spk_name)
+        if spk_path is not None:
+            return spk_path, inventory
+
+    return None, inventory
+
+
+def get_spk_coverage(spk_path):
+    """
+    Return the coverage, as UTC datetime64, of the spacecraft (negative
+    NAIF IDs) of the SPK, or of all its objects if there is none.
+    """
+    import spiceypy
+
+    ids = [obj for obj in spiceypy.spkobj(spk_path)]
+    sc_ids = [obj for obj in ids if obj < 0]
+
+    start, end = None, None
+    for obj in (sc_ids if sc_ids else ids):
+        cover = spiceypy.spkcov(spk_path, obj)
+        for idx in range(spiceypy.wncard(cover)):
+            interval = spiceypy.wnfetd(cover, idx)
+            start = interval[0] if start is None else min(start, interval[0])
+            end = interval[1] if end is None else max(end, interval[1])
+
+    if start is None:
+        return None
+
+    return (np.datetime64(spiceypy.et2utc(start, 'ISOC', 3), 'ms'),
+            np.datetime64(spiceypy.et2utc(end, 'ISOC', 3), 'ms'))
+
+
+def check_orbnum_coverage(orbnum_path, stats):
+    """
+    Check that the events of the orbit number file are within the coverage
+    of the matching SPK, and that they cover it.
+    """
+    spk_path, inventory = get_matching_spk(orbnum_path)
+    if spk_path is None:
+        log_info("ORBNUM_COVERAGE", "Coverage not checked, matching SPK not found", orbnum_path)
+        return True
+
+    import spiceypy
+
+    lsk = inventory.get_latest_kernel('lsk', '*.tls')
+    if not lsk:
+        log_info("ORBNUM_COVERAGE", "Coverage not checked, LSK not found", orbnum_path)
+        return True
+    lsk_path = inventory.get_path('lsk', lsk)
+
+    spiceypy.furnsh(lsk_path)
+    try:
+        coverage = get_spk_coverage(spk_path)
+    except Exception as ex:
+        log_error("ORBNUM_COVERAGE", "Obtaining coverage of SPK: " + spk_path + " , exception: " + str(ex),
+                  orbnum_path)
+        return False
+    finally:
+        spiceypy.unload(lsk_path)
+
+    if coverage is None:
+        log_error("ORBNUM_COVERAGE", "Matching SPK without coverage: " + spk_path, orbnum_path)
+        return False
+
+    coverage_start, coverage_end = coverage
+    spk_name = os.path.basename(spk_path)
+
+    is_valid = True
+    if stats['first_time'] < coverage_start:
+        log_error("ORBNUM_COVERAGE", "First event: {} of orbit: {} is before the start of the coverage of {}: {}",
+                  orbnum_path, stats['first_time'], stats['first_orbit'], spk_name, coverage_start)
+        is_valid = False
+
+    if stats['last_time'] > coverage_end:
+        log_error("ORBNUM_COVERAGE", "Last event: {} of orbit: {} is after the end of the coverage of {}: {}",
+                  orbnum_path, stats['last_time'], stats['last_orbit'], spk_name, coverage_end)
+        is_valid = False
+
+    # Mean orbital period, the events are one period apart
+    if stats['last_orbit'] > stats['first_orbit']:
+        period = (stats['last_time'] - stats['first_time']) / (stats['last_orbit'] - stats['first_orbit'])
+        tolerance = period * COVERAGE_TOLERANCE_PERIODS
+
+        if stats['first_time'] - coverage_start > tolerance:
+            log_warn("ORBNUM_COVERAGE", "Orbits not reported from the start of the coverage of {}: {} "
+                     "to the first event: {}", orbnum_path, spk_name, coverage_start, stats['first_time'])
+
+        if coverage_end - stats['last_time'] > tolerance:
+            log_warn("ORBNUM_COVERAGE", "Orbits not reported from the last event: {} to the end of the "
+                     "coverage of {}: {}", orbnum_path, stats['last_time'], spk_name, coverage_end)
+
+    return is_valid
@@ -0,0 +1,237 @@
+import re
+
+import numpy as np
+
+from spival.utils.daf import read_daf_summaries, get_intervals_union
+from spival.utils.kpl import parse_kernel_pool, get_numeric_values
+from spival.utils.skd_val_logger import log_error, log_info, log_warn
+
+#
+# Validation of the contents of text and binary PCKs.
+#
+# The body constants of text PCKs are gathered by kind for all the bodies
+# and checked at once with NumPy. The segments of binary PCKs are checked
+# from their DAF summaries, without loading the kernel in the kernel pool.
+#
+BODY_VARIABLE_REGEX = re.compile(r'^BODY(-?\d+)_(\w+)$')
+
+# Expected number of values (None for any) and range of the first value
+BODY_CONSTANTS = {'RADII': (3, (0.0, None)),
+                  'POLE_RA': ((1, 3), (0.0, 360.0)),
+                  'POLE_DEC': ((1, 3), (-90.0, 90.0)),
+                  'PM': ((1, 3), (-360.0, 360.0)),
+                  'GM': (1, (0.0, None)),
+                  'NUT_PREC_RA': (None, None),
+                  'NUT_PREC_DEC': (None, None),
+                  'NUT_PREC_PM': (None, None),
+                  'NUT_PREC_ANGLES': (None, None)}
+
+# Binary PCK segments: ND = 2 (start and end ET), NI = 5 (body frame class
+# ID, reference frame ID, data type, start and end addresses)
+BPC_ND = 2
+BPC_NI = 5
+BPC_DATA_TYPES = [2, 3, 20]
+
+
+def get_body_constants(variables):
+    """
+    Gather the BODY<id>_<constant> variables of a text PCK by constant.
+
+    :return: dict
+       For every constant, the list of (body ID, variable) tuples.
+    """
+    constants = {}
+    for name, variable in variables.items():
+        match = BODY_VARIABLE_REGEX.match(name)
+        if match:
+            constants.setdefault(match.group(2), []).append((int(match.group(1)), variable))
+
+    return constants
+
+
+def is_valid_text_pck_kernel(pck_path):
+
+    from spival.utils.skd_utils import is_naif_id
+
+    try:
+        variables = parse_kernel_pool(pck_path)
+    except Exception as ex:
+        log_error("DATA_AND_COMMENTS", "Parsing data of: " + pck_path + " , exception: " + str(ex), pck_path)
+        return False
+
+    constants = get_body_constants(variables)
+    if not constants:
+        log_warn("PCK_CONSTANTS", "No BODY<id>_<constant> definitions found", pck_path)
+        return True
+
+    is_valid = True
+
+    bodies = set()
+    for constant in constants:
+        bodies.update(body for body, variable in constants[constant])
+
+    for body in sorted(bodies):
+        if not is_naif_id(body):
+            log_warn("PCK_CONSTANTS", "BODY{} is not any of the defined NAIF IDs or the SPICE built-in body IDs",
+                     pck_path, body)
+
+    for constant, (sizes, value_range) in BODY_CONSTANTS.items():
+        if constant not in constants:
+            continue
+        if not check_body_constant(constant, constants[constant], sizes, value_range, pck_path):
+            is_valid = False
+
+    if not check_nutation_precession(constants, pck_path):
+        is_valid = False
+
+    return is_valid
+
+
+def check_body_constant(constant, body_variables, sizes, value_range, pck_path):
+    """
+    Check the number of values of a constant for all the bodies, and the
+    range of their first values at once.
+    """
+    is_valid = True
+
+    first_values = []
+    for body, variable in body_variables:
+        try:
+            values = get_numeric_values(variable)
+        except Exception as ex:
+            log_error("PCK_CONSTANTS", "BODY{}_{}: {}", pck_path, body, constant, str(ex))
+            is_valid = False
+            continue
+
+        if isinstance(sizes, int) and len(values) != sizes \
+                or isinstance(sizes, tuple) and not sizes[0] <= len(values) <= sizes[1] \
+                or not len(values):
+            log_error("PCK_CONSTANTS", "BODY{}_{} has {} values, expected: {} on line: {}", pck_path,
+                      body, constant, len(values), sizes, variable['line'])
+            is_valid = False
+            continue
+
+        if constant == 'RADII':
+            first_values.extend((body, value, variable['line']) for value in values)
+        else:
+            first_values.append((body, values[0], variable['line']))
+
+    if value_range is None or not first_values:
+        return is_valid
+
+    values = np.array([value for body, value, line in first_values])
+    out_of_range = np.zeros(len(values), dtype=bool)
+    if value_range[0] is not None:
+        out_of_range |= values <= value_range[0] if constant in ('RADII', 'GM') else values < value_range[0]
+    if value_range[1] is not None:
+        out_of_range |= values > value_range[1]
+
+    for idx in np.flatnonzero(out_of_range):
+        body, value, line = first_values[idx]
+        log_error("PCK_CONSTANTS", "BODY{}_{} value: {} out of the range: {} on line: {}", pck_path,
+                  body, constant, value, value_range, line)
+        is_valid = False
+
+    return is_valid
+
+
+def check_nutation_precession(constants, pck_path):
+    """
+    The nutation precession terms of a body are coefficients of the angles
+    of its system barycenter (or of the body itself), of which there has to
+    be at least as many (each angle has a constant and a rate).
+    """
+    is_valid = True
+
+    angles = {}
+    for body, variable in constants.get('NUT_PREC_ANGLES', []):
+        n_values = len(variable['values'])
+        if n_values % 2:
+            log_error("PCK_CONSTANTS", "BODY{}_NUT_PREC_ANGLES has an odd number of values: {} on line: {}",
+                      pck_path, body, n_values, variable['line'])
+            is_valid = False
+        angles[body] = n_values // 2
+
+    for constant in ['NUT_PREC_RA', 'NUT_PREC_DEC', 'NUT_PREC_PM']:
+        for body, variable in constants.get(constant, []):
+            barycenter = body // 100 if 100 < body < 1000 else body
+            n_angles = angles.get(body, angles.get(barycenter))
+            if n_angles is None:
+                log_error("PCK_CONSTANTS", "BODY{}_{} defined without BODY{}_NUT_PREC_ANGLES on line: {}",
+                          pck_path, body, constant, barycenter, variable['line'])
+                is_valid = False
+            elif len(variable['values']) > n_angles:
+                log_error("PCK_CONSTANTS", "BODY{}_{} has {} terms, more than the {} nutation precession angles "
+                          "on line: {}", pck_path, body, constant, len(variable['values']), n_angles,
+                          variable['line'])
+                is_valid = False
+
+    return is_valid
+
+
+def is_valid_binary_pck_kernel(bpc_path):
+
+    try:
+        daf = read_daf_summaries(bpc_path)
+    except Exception as ex:
+        log_error("PCK_SEGMENTS", "Reading DAF summaries of: " + bpc_path + " , exception: " + str(ex), bpc_path)
+        return False
+
+    if not daf['idword'].startswith('DAF/PCK') or daf['nd'] != BPC_ND or daf['ni'] != BPC_NI:
+        log_error("PCK_SEGMENTS", "Not a binary PCK DAF, ID word: '{}' ND: {} NI: {}", bpc_path,
+                  daf['idword'].strip(), daf['nd'], daf['ni'])
+        return False
+
+    if not daf['summaries']:
+        log_error("PCK_SEGMENTS", "Binary PCK without segments", bpc_path)
+        return False
+
+    return check_pck_segments(daf, bpc_path)
+
+
+def check_pck_segments(daf, bpc_path):
+
+    import spiceypy
+
+    is_valid = True
+
+    coverages = {}
+    for idx, (times, integers) in enumerate(daf['summaries']):
+        start, end = times
+        body_frame, reference_frame, data_type, start_address, end_address = integers
+
+        if end < start:
+            log_error("PCK_SEGMENTS", "Segment {} of frame {} ends before it starts", bpc_path, idx + 1, body_frame)
+            is_valid = False
+
+        if data_type not in BPC_DATA_TYPES:
+            log_error("PCK_SEGMENTS", "Segment {} of frame {} has unsupported data type: {}", bpc_path,
+                      idx + 1, body_frame, data_type)
+            is_valid = False
+
+        if not 0 < start_address <= end_address <= daf['words']:
+            log_error("PCK_SEGMENTS", "Segment {} of frame {} with data addresses: {} to {} out of the file",
+                      bpc_path, idx + 1, body_frame, start_address, end_address)
+            is_valid = False
+
+        coverages.setdefault((body_frame, reference_frame), []).append((start, end))
+
+    for (body_frame, reference_frame), intervals in sorted(coverages.items()):
+
+        reference_name = spiceypy.frmnam(reference_frame)
+        if not reference_name:
+            log_error("PCK_SEGMENTS", "Reference frame ID: {} of frame {} is not a built-in frame", bpc_path,
+                      reference_frame, body_frame)
+            is_valid = False
+            reference_name = str(reference_frame)
+
+        union = get_intervals_union(intervals)
+        log_info("PCK_SEGMENTS", "Frame {} relative to {}, {} segments covering: {} to {} TDB", bpc_path,
+                 body_frame, reference_name, len(intervals), spiceypy.etcal(union[0][0]),
+                 spiceypy.etcal(union[-1][1]))
+
+        for previous, following in zip(union[:-1], union[1:]):
+            log_warn("PCK_SEGMENTS", "Frame {} coverage gap from {} to {} TDB", bpc_path,
+                     body_frame, spiceypy.etcal(previous[1]), spiceypy.etcal(following[0]))
+
+    return is_valid
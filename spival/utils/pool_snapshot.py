@@ -0,0 +1,281 @@
+import hashlib
+import os
+
+import numpy as np
+
+from spival.utils.kpl import parse_kernel_pool, get_numeric_values, get_string_values
+from spival.utils.manifest import get_file_digests
+from spival.utils.skd_constants import KERNEL_BINARY_EXTENSIONS
+
+#
+# Snapshot of the kernel pool of a meta-kernel: the kernels it loads, with
+# their sizes and MD5, and every variable of the pool with all its values,
+# as loaded in order from the MK and its text kernels with the KPL parser,
+# without SPICE and without loading the binary kernels.
+#
+# The snapshots are written as NumPy .npz files of columns: the numeric
+# values of all the variables are a single float array and the strings a
+# single string array, indexed by the offsets and counts of the variables.
+# Each variable has a digest of its values so that two snapshots are
+# compared by digest, looking up the variables by name.
+#
+POOL_SNAPSHOT_VERSION = 1
+
+# Values shown for every changed variable in the differences
+DIFF_SHOWN_VALUES = 5
+
+
+def join_continued_strings(values, marker='+'):
+    """
+    Join the strings of a meta-kernel variable continued with a trailing
+    '+' on the next string.
+    """
+    joined = []
+    pending = ''
+    for value in values:
+        if value.endswith(marker):
+            pending += value[:-1]
+        else:
+            joined.append(pending + value)
+            pending = ''
+    if pending:
+        joined.append(pending)
+
+    return joined
+
+
+def get_mk_kernels(mk_variables):
+    """
+    Return the kernels of a meta-kernel, with the path symbols replaced.
+    """
+    symbols = join_continued_strings(get_string_values(mk_variables['PATH_SYMBOLS'])) \
+        if 'PATH_SYMBOLS' in mk_variables else []
+    values = join_continued_strings(get_string_values(mk_variables['PATH_VALUES'])) \
+        if 'PATH_VALUES' in mk_variables else []
+    if len(symbols) != len(values):
+        raise Exception("PATH_SYMBOLS and PATH_VALUES have a different number of values")
+
+    kernels = join_continued_strings(get_string_values(mk_variables['KERNELS_TO_LOAD'])) \
+        if 'KERNELS_TO_LOAD' in mk_variables else []
+
+    # Longer symbols first, e.g. $KERNELS_2 before $KERNELS
+    replacements = sorted(zip(symbols, values), key=lambda symbol_value: -len(symbol_value[0]))
+    for idx, kernel in enumerate(kernels):
+        for symbol, value in replacements:
+            kernel = kernel.replace('$' + symbol, value)
+        kernels[idx] = kernel
+
+    return kernels
+
+
+def get_pool_values(variable):
+    """
+    :return: tuple
+       The type of the values, 'N' (numeric), 'C' (strings) or 'T' (times
+       given with @, kept as strings), and the values.
+    """
+    if all(value.startswith("'") for value in variable['values']):
+        return 'C', get_string_values(variable)
+    if any(value.startswith('@') for value in variable['values']):
+        return 'T', list(variable['values'])
+
+    return 'N', get_numeric_values(variable)
+
+
+def get_values_digest(value_type, values):
+    digest = hashlib.blake2b(value_type.encode('ascii'), digest_size=16)
+    if value_type == 'N':
+        digest.update(np.ascontiguousarray(values, dtype='<f8').tobytes())
+    else:
+        digest.update('\0'.join(values).encode('utf-8'))
+
+    return digest.hexdigest()
+
+
+def build_pool_snapshot(mk_path):
+    """
+    Build the pool snapshot of a meta-kernel. The paths of the kernels are
+    relative to the directory of the MK, as when the MK is loaded from it.
+
+    :return: dict
+       The 'mk', the 'kernels' (list of dicts with 'path', 'size' and
+       'digest', -1 and '' if the kernel does not exist) and the pool
+       'variables' by name, in order of loading, with their 'type', 'values'
+       and the index of the 'kernel' that last assigned them, -1 for the MK.
+    """
+    mk_dir = os.path.dirname(os.path.abspath(mk_path))
+    mk_variables = parse_kernel_pool(mk_path)
+
+    kernels = [os.path.normpath(kernel) for kernel in get_mk_kernels(mk_variables)]
+    kernel_paths = [os.path.join(mk_dir, kernel) for kernel in kernels]
+    existing = [path for path in kernel_paths if os.path.isfile(path)]
+    digests = get_file_digests(existing)
+
+    snapshot_kernels = []
+    for kernel, path in zip(kernels, kernel_paths):
+        exists = path in digests
+        snapshot_kernels.append({'path': kernel,
+                                 'size': os.path.getsize(path) if exists else -1,
+                                 'digest': digests[path] if exists else ''})
+
+    pool = {}
+    sources = [(-1, mk_variables)]
+    for idx, path in enumerate(kernel_paths):
+        if path in digests and os.path.splitext(path)[1].lower() not in KERNEL_BINARY_EXTENSIONS:
+            sources.append((idx, parse_kernel_pool(path)))
+
+    for kernel_idx, variables in sources:
+        for name, variable in variables.items():
+            value_type, values = get_pool_values(variable)
+            if variable.get('append') and name in pool and pool[name]['type'] == value_type:
+                if value_type == 'N':
+                    values = np.concatenate([pool[name]['values'], values])
+                else:
+                    values = pool[name]['values'] + values
+            pool[name] = {'type': value_type, 'values': values, 'kernel': kernel_idx}
+
+    return {'mk': os.path.basename(mk_path),
+            'kernels': snapshot_kernels,
+            'variables': pool}
+
+
+def get_snapshot_columns(snapshot):
+    """
+    :return: dict
+       The columns of a snapshot, as written to the snapshot files.
+    """
+    names = list(snapshot['variables'])
+    variables = [snapshot['variables'][name] for name in names]
+
+    numeric = [variable['values'] for variable in variables if variable['type'] == 'N']
+    strings = [value for variable in variables if variable['type'] != 'N' for value in variable['values']]
+
+    offsets = []
+    numeric_offset, string_offset = 0, 0
+    for variable in variables:
+        if variable['type'] == 'N':
+            offsets.append(numeric_offset)
+            numeric_offset += len(variable['values'])
+        else:
+            offsets.append(string_offset)
+            string_offset += len(variable['values'])
+
+    kernels = snapshot['kernels']
+
+    return {'version': np.array([POOL_SNAPSHOT_VERSION]),
+            'mk': np.array([snapshot['mk']]),
+            'kernel_paths': np.array([kernel['path'] for kernel in kernels], dtype=str),
+            'kernel_sizes': np.array([kernel['size'] for kernel in kernels], dtype=np.int64),
+            'kernel_digests': np.array([kernel['digest'] for kernel in kernels], dtype=str),
+            'var_names': np.array(names, dtype=str),
+            'var_types': np.array([variable['type'] for variable in variables], dtype=str),
+            'var_kernels': np.array([variable['kernel'] for variable in variables], dtype=np.int32),
+            'var_offsets': np.array(offsets, dtype=np.int64),
+            'var_counts': np.array([len(variable['values']) for variable in variables], dtype=np.int64),
+            'var_digests': np.array([get_values_digest(variable['type'], variable['values'])
+                                     for variable in variables], dtype=str),
+            'numeric_values': np.concatenate(numeric) if numeric else np.zeros(0),
+            'string_values': np.array(strings, dtype=str)}
+
+
+def write_pool_snapshot(snapshot, snapshot_file):
+
+    with open(snapshot_file, 'wb') as f:
+        np.savez_compressed(f, **get_snapshot_columns(snapshot))
+
+
+def load_pool_snapshot(path):
+    """
+    Load a snapshot file, or build the snapshot of a meta-kernel.
+
+    :return: dict
+       The columns of the snapshot.
+    """
+    if os.path.splitext(path)[1].lower() == '.tm':
+        return get_snapshot_columns(build_pool_snapshot(path))
+
+    with np.load(path, allow_pickle=False) as data:
+        snapshot = {key: data[key] for key in data.files}
+
+    if int(snapshot['version'][0]) != POOL_SNAPSHOT_VERSION:
+        raise Exception("Unsupported pool snapshot version: " + str(snapshot['version'][0]) + " of: " + path)
+
+    return snapshot
+
+
+def get_snapshot_values(snapshot, idx):
+    start = int(snapshot['var_offsets'][idx])
+    count = int(snapshot['var_counts'][idx])
+    if snapshot['var_types'][idx] == 'N':
+        return snapshot['numeric_values'][start:start + count]
+    return snapshot['string_values'][start:start + count]
+
+
+def diff_pool_snapshots(snapshot_a, snapshot_b):
+    """
+    Compare two snapshots: kernels by path and digest, and variables by name
+    and digest of their values.
+
+    :return: dict
+       The 'kernels_added', 'kernels_removed', 'kernels_changed',
+       'variables_added', 'variables_removed' and 'variables_changed', with
+       the variables as (name, index in A, index in B) tuples.
+    """
+    kernels_a = {path: idx for idx, path in enumerate(snapshot_a['kernel_paths'].tolist())}
+    kernels_b = {path: idx for idx, path in enumerate(snapshot_b['kernel_paths'].tolist())}
+    digests_a, digests_b = snapshot_a['kernel_digests'], snapshot_b['kernel_digests']
+
+    variables_a = {name: idx for idx, name in enumerate(snapshot_a['var_names'].tolist())}
+    variables_b = {name: idx for idx, name in enumerate(snapshot_b['var_names'].tolist())}
+    var_digests_a, var_digests_b = snapshot_a['var_digests'], snapshot_b['var_digests']
+
+    return {'kernels_added': [path for path in kernels_b if path not in kernels_a],
+            'kernels_removed': [path for path in kernels_a if path not in kernels_b],
+            'kernels_changed': [path for path, idx in kernels_a.items()
+                                if path in kernels_b and digests_a[idx] != digests_b[kernels_b[path]]],
+            'variables_added': [(name, None, idx) for name, idx in variables_b.items() if name not in variables_a],
+            'variables_removed': [(name, idx, None) for name, idx in variables_a.items() if name not in variables_b],
+            'variables_changed': [(name, idx, variables_b[name]) for name, idx in variables_a.items()
+                                  if name in variables_b and var_digests_a[idx] != var_digests_b[variables_b[name]]]}
+
+
+def format_values(values):
+    shown = ', '.join(str(value) for value in values[:DIFF_SHOWN_VALUES])
+    if len(values) > DIFF_SHOWN_VALUES:
+        shown += ', ... (' + str(len(values)) + ' values)'
+    return '(' + shown + ')'
+
+
+def write_pool_diff(diff, snapshot_a, snapshot_b):
+
+    print("Pool differences from: " + str(snapshot_a['mk'][0]) + " to: " + str(snapshot_b['mk'][0]))
+    print("")
+
+    for key, sign in [('kernels_removed', '-'), ('kernels_added', '+'), ('kernels_changed', '~')]:
+        for path in diff[key]:
+            print("   " + sign + " kernel " + path)
+
+    for key, sign in [('variables_removed', '-'), ('variables_added', '+')]:
+        for name, idx_a, idx_b in diff[key]:
+            snapshot, idx = (snapshot_a, idx_a) if idx_a is not None else (snapshot_b, idx_b)
+            print("   " + sign + " " + name + " = " + format_values(get_snapshot_values(snapshot, idx)))
+
+    for name, idx_a, idx_b in diff['variables_changed']:
+        values_a = get_snapshot_values(snapshot_a, idx_a)
+        values_b = get_snapshot_values(snapshot_b, idx_b)
+        line = "   ~ " + name + ": "
+        if len(values_a) == len(values_b) and snapshot_a['var_types'][idx_a] == snapshot_b['var_types'][idx_b]:
+            first = int(np.flatnonzero(values_a != values_b)[0])
+            line += "value " + str(first + 1) + " of " + str(len(values_a)) + ": " + str(values_a[first]) + \
+                " -> " + str(values_b[first])
+        else:
+            line += format_values(values_a) + " -> " + format_values(values_b)
+        print(line)
+
+    print("")
+    print("Kernels: " + str(len(diff['kernels_added'])) + " added, " + str(len(diff['kernels_removed'])) +
+          " removed, " + str(len(diff['kernels_changed'])) + " changed. Variables: " +
+          str(len(diff['variables_added'])) + " added, " + str(len(diff['variables_removed'])) + " removed, " +
+          str(len(diff['variables_changed'])) + " changed.")
+
+    return
@@ -0,0 +1,278 @@
+import glob
+import mmap
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from tempfile import mkstemp
+
+#
+# Post-processing of the notebooks exported to HTML. The exported files
+# embed the plots in base64 and can be tens of MB, so instead of building a
+# DOM the files are tokenized in place (memory mapped) to find the byte
+# offsets of the elements involved, and the output is written as a copy of
+# the original byte ranges.
+#
+RESULTS_ID = b'validation_results'
+COPY_CHUNK_SIZE = 1024 * 1024
+
+TAG_NAME_REGEX = re.compile(rb'[A-Za-z][A-Za-z0-9:-]*')
+TAG_END_REGEX = re.compile(rb'(?:[^>"\']|"[^"]*"|\'[^\']*\')*>')
+RESULTS_ID_REGEX = re.compile(rb'\bid\s*=\s*(["\']?)' + RESULTS_ID + rb'\1(?![\w-])', re.IGNORECASE)
+RAW_TEXT_CLOSE_REGEX = {b'script': re.compile(rb'</script', re.IGNORECASE),
+                        b'style': re.compile(rb'</style', re.IGNORECASE)}
+
+
+def iter_tags(data, start=0, end=None):
+    """
+    Incremental HTML tokenizer over a bytes-like object (bytes or mmap).
+    Yields (name, closing, self_closing, start, end, attributes) for every
+    tag, with the offsets of the tag itself. Comments, declarations and the
+    content of <script> and <style> elements are skipped, as an HTML parser
+    does.
+    """
+    if end is None:
+        end = len(data)
+
+    pos = start
+    while pos < end:
+        lt = data.find(b'<', pos, end)
+        if lt < 0:
+            return
+
+        if data[lt:lt + 4] == b'<!--':
+            close = data.find(b'-->', lt + 4, end)
+            if close < 0:
+                return
+            pos = close + 3
+            continue
+
+        if data[lt + 1:lt + 2] in (b'!', b'?'):
+            close = data.find(b'>', lt, end)
+            if close < 0:
+                return
+            pos = close + 1
+            continue
+
+        closing = data[lt + 1:lt + 2] == b'/'
+        name_match = TAG_NAME_REGEX.match(data, lt + 2 if closing else lt + 1, end)
+        if not name_match:
+            pos = lt + 1
+            continue
+
+        end_match = TAG_END_REGEX.match(data, name_match.end(), end)
+        if not end_match:
+            return
+
+        name = name_match.group(0).lower()
+        tag_end = end_match.end()
+        attributes = data[name_match.end():tag_end - 1]
+        self_closing = attributes.endswith(b'/')
+
+        yield name, closing, self_closing, lt, tag_end, attributes
+
+        pos = tag_end
+        if not closing and name in RAW_TEXT_CLOSE_REGEX:
+            raw_close = RAW_TEXT_CLOSE_REGEX[name].search(data, pos, end)
+            if not raw_close:
+                return
+            pos = raw_close.start()
+
+    return
+
+
+def find_elements(data):
+    """
+    Find the byte ranges needed by the post-processing in a single pass:
+
+       results   (start, end) of the element with id='validation_results'
+       p         (start, content_end, end) of the first <p> outside of it
+       h1        (start, end) of the first <h1> outside of it
+       h1_inner  (start, end) of the first <h1> inside of it
+    """
+    found = {'results': None, 'p': None, 'h1': None, 'h1_inner': None}
+
+    open_elements = {}
+    results_name = None
+    results_start = None
+    results_depth = 0
+
+    for name, closing, self_closing, start, end, attributes in iter_tags(data):
+
+        inside = results_start is not None and found['results'] is None
+
+        # Element holding the validation results, nested elements of the same name are counted
+        if results_name is None and not closing and RESULTS_ID_REGEX.search(attributes):
+            results_name = name
+            results_start = start
+            results_depth = 1
+            if self_closing:
+                found['results'] = (start, end)
+            continue
+
+        if inside and name == results_name and not self_closing:
+            results_depth += -1 if closing else 1
+            if results_depth == 0:
+                found['results'] = (results_start, end)
+                continue
+
+        if name not in (b'p', b'h1') or self_closing:
+            continue
+
+        if inside:
+            if name == b'p':
+                continue
+            key = 'h1_inner'
+        else:
+            key = name.decode()
+
+        if not closing:
+            if found[key] is None and key not in open_elements:
+                open_elements[key] = [start, 0]
+            if key in open_elements:
+                open_elements[key][1] += 1
+        elif key in open_elements:
+            open_elements[key][1] -= 1
+            if open_elements[key][1] == 0:
+                element_start = open_elements.pop(key)[0]
+                if key == 'p':
+                    found[key] = (element_start, start, end)
+                else:
+                    found[key] = (element_start, end)
+
+        if found['results'] is not None and found['p'] is not None \
+                and found['h1'] is not None and found['h1_inner'] is not None:
+            break
+
+    return found
+
+
+def clear_first_anchor(html):
+    """
+    Remove the content of the first <a> element of a (small) HTML fragment.
+    """
+    anchor_start = None
+    depth = 0
+    for name, closing, self_closing, start, end, attributes in iter_tags(html):
+        if name != b'a' or self_closing:
+            continue
+        if not closing:
+            if anchor_start is None:
+                anchor_start = end
+            depth += 1
+        elif anchor_start is not None:
+            depth -= 1
+            if depth == 0:
+                return html[:anchor_start] + html[start:]
+
+    return html
+
+
+def post_process_html(html_file):
+    """
+    Move the validation results div of an exported notebook to the end of
+    its first paragraph, and write a <name>_results.html file with the
+    first header (its anchor cleared) and that paragraph.
+
+    :return: str
+       The content of the <name>_results.html file, None if the file could
+       not be processed.
+    """
+    if not os.path.isfile(html_file):
+        print("Invalid file: " + html_file)
+        return
+
+    print("Post-processing file: " + html_file)
+
+    with open(html_file, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            print("Div with id='validation_results' not found!")
+            return
+
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            found = find_elements(data)
+
+            if not found['results']:
+                print("Div with id='validation_results' not found!")
+                return
+
+            if not found['p']:
+                print("Cannot find the first 'p' to use for insertAfter!")
+                return
+
+            results_start, results_end = found['results']
+            p_start, p_content_end, p_end = found['p']
+
+            #
+            # Byte ranges of the output: the results element is removed from
+            # its place and inserted before the closing tag of the paragraph.
+            #
+            if results_start >= p_content_end:
+                segments = [(0, p_content_end),
+                            (results_start, results_end),
+                            (p_content_end, results_start),
+                            (results_end, len(data))]
+            else:
+                segments = [(0, results_start),
+                            (results_end, p_content_end),
+                            (results_start, results_end),
+                            (p_content_end, len(data))]
+
+            write_ranges(html_file, data, segments)
+
+            #
+            # Results file: the first header of the processed document (the
+            # one of the results if it comes before the others) and the
+            # first paragraph, now holding the results.
+            #
+            paragraph = data[p_start:p_content_end] + data[results_start:results_end] + data[p_content_end:p_end]
+
+            header = b''
+            if found['h1'] is not None and (found['h1_inner'] is None or found['h1'][0] < p_content_end):
+                header = data[found['h1'][0]:found['h1'][1]]
+            elif found['h1_inner'] is not None:
+                header = data[found['h1_inner'][0]:found['h1_inner'][1]]
+
+    results = clear_first_anchor(header + paragraph)
+
+    results_file = html_file.replace(".html", "_results.html")
+    write_ranges(results_file, results, [(0, len(results))])
+
+    return results.decode('utf-8', errors='replace')
+
+
+def write_ranges(file, data, segments):
+    """
+    Write the ``segments`` (start, end) byte ranges of ``data`` to ``file``
+    in chunks, through a temporary file renamed at the end.
+    """
+    directory = os.path.dirname(os.path.abspath(file))
+    fh, tmp_path = mkstemp(dir=directory, prefix='.' + os.path.basename(file) + '.', suffix='.tmp')
+    try:
+        with os.fdopen(fh, 'wb') as f:
+            for start, end in segments:
+                for chunk_start in range(start, end, COPY_CHUNK_SIZE):
+                    f.write(data[chunk_start:min(end, chunk_start + COPY_CHUNK_SIZE)])
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, file)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    return
+
+
+def post_process_html_files(pattern, processes=None):
+    """
+    Post-process all the HTML files matching the glob ``pattern`` across a
+    process pool. Returns the results of ``post_process_html`` for each file,
+    in the order of the files.
+    """
+    html_files = [html_file for html_file in sorted(glob.glob(pattern))
+                  if not html_file.endswith('_results.html')]
+
+    if len(html_files) < 2 or processes == 1:
+        return [(html_file, post_process_html(html_file)) for html_file in html_files]
+
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        return list(zip(html_files, executor.map(post_process_html, html_files)))
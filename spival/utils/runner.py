@@ -0,0 +1,186 @@
+import asyncio
+import os
+import subprocess
+import threading
+import time
+
+#
+# Runner for the NAIF utilities (commnt, ckbrief, dafcat, frmdiff, ...).
+# Commands are always given as argument lists, never through a shell, and
+# are executed on an asyncio event loop so that batches of kernels can be
+# processed concurrently with a bounded number of child processes.
+#
+MAX_CONCURRENT_PROCESSES = os.cpu_count() or 4
+DEFAULT_TIMEOUT = None
+READ_CHUNK_SIZE = 65536
+
+RUNNER_METRICS = {}
+
+
+def run_command(args, timeout=DEFAULT_TIMEOUT, stdin_path=None, merge_stderr=True, cwd=None):
+    """
+    Run a single command and return its result once it finishes.
+
+    :param args: list
+       Executable and arguments, e.g. ['commnt', '-r', 'kernel.bc'].
+    :param timeout: float
+       Seconds after which the process is killed, None to wait forever.
+    :param stdin_path: str
+       File to be redirected to the standard input of the process.
+    :param merge_stderr: bool
+       If True the standard error is captured together with the standard
+       output, otherwise it is returned separately in ``stderr``.
+    :param cwd: str
+       Working directory of the process.
+    :return: dict
+       With keys ``args``, ``returncode``, ``stdout``, ``stderr``,
+       ``spawn_time`` and ``elapsed``.
+    :raises:
+       Exception if the process could not be spawned or timed out.
+    """
+    result = run_commands([args], max_processes=1, timeout=timeout, stdin_path=stdin_path,
+                          merge_stderr=merge_stderr, cwd=cwd)[0]
+    if result["error"] is not None:
+        raise result["error"]
+
+    return result
+
+
+def run_commands(commands, max_processes=MAX_CONCURRENT_PROCESSES, timeout=DEFAULT_TIMEOUT,
+                 stdin_path=None, merge_stderr=True, cwd=None):
+    """
+    Run a batch of commands with at most ``max_processes`` of them alive at
+    the same time. Results are returned in the same order as ``commands``;
+    a command that could not be spawned or that timed out has its exception
+    stored in the ``error`` key of its result instead of raising.
+    """
+    return _run_sync(_run_batch(commands, max_processes, timeout, stdin_path, merge_stderr, cwd))
+
+
+def get_runner_metrics():
+    """
+    Return a copy of the per-executable metrics: number of runs, failures,
+    timeouts, and accumulated/maximum spawn and run latencies in seconds.
+    """
+    return {executable: dict(metrics) for executable, metrics in RUNNER_METRICS.items()}
+
+
+def reset_runner_metrics():
+    RUNNER_METRICS.clear()
+
+
+def _run_sync(coroutine):
+    #
+    # Notebooks already run an event loop in the main thread, in such case
+    # the batch is executed in its own loop in a helper thread.
+    #
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coroutine)
+
+    outcome = {}
+
+    def target():
+        try:
+            outcome["result"] = asyncio.run(coroutine)
+        except BaseException as ex:
+            outcome["error"] = ex
+
+    thread = threading.Thread(target=target)
+    thread.start()
+    thread.join()
+
+    if "error" in outcome:
+        raise outcome["error"]
+
+    return outcome["result"]
+
+
+async def _run_batch(commands, max_processes, timeout, stdin_path, merge_stderr, cwd):
+    semaphore = asyncio.Semaphore(max(1, int(max_processes)))
+    tasks = [_run_one(list(args), semaphore, timeout, stdin_path, merge_stderr, cwd) for args in commands]
+    return await asyncio.gather(*tasks)
+
+
+async def _drain(stream, chunks):
+    while True:
+        data = await stream.read(READ_CHUNK_SIZE)
+        if not data:
+            break
+        chunks.append(data)
+
+
+async def _run_one(args, semaphore, timeout, stdin_path, merge_stderr, cwd):
+
+    result = {"args": args,
+              "returncode": None,
+              "stdout": b"",
+              "stderr": b"",
+              "spawn_time": 0.0,
+              "elapsed": 0.0,
+              "error": None}
+
+    async with semaphore:
+        start = time.perf_counter()
+        stdin_file = open(stdin_path, 'rb') if stdin_path else subprocess.DEVNULL
+        try:
+            try:
+                process = await asyncio.create_subprocess_exec(
+                    *args, cwd=cwd, stdin=stdin_file,
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.STDOUT if merge_stderr else subprocess.PIPE)
+            except OSError as ex:
+                result["error"] = Exception("Could not run command: " + " ".join(args) + " , ex: " + str(ex))
+                _add_metrics(result)
+                return result
+
+            result["spawn_time"] = time.perf_counter() - start
+
+            stdout_chunks = []
+            stderr_chunks = []
+            readers = [_drain(process.stdout, stdout_chunks)]
+            if not merge_stderr:
+                readers.append(_drain(process.stderr, stderr_chunks))
+
+            try:
+                await asyncio.wait_for(asyncio.gather(*readers, process.wait()), timeout)
+            except asyncio.TimeoutError:
+                process.kill()
+                await process.wait()
+                result["error"] = Exception("Command timed out after " + str(timeout) + " s: " + " ".join(args))
+
+            result["returncode"] = process.returncode
+            result["stdout"] = b"".join(stdout_chunks)
+            result["stderr"] = b"".join(stderr_chunks)
+
+        finally:
+            if stdin_path:
+                stdin_file.close()
+
+        result["elapsed"] = time.perf_counter() - start
+
+    _add_metrics(result)
+    return result
+
+
+def _add_metrics(result):
+    executable = os.path.basename(result["args"][0]) if len(result["args"]) else ""
+    metrics = RUNNER_METRICS.setdefault(executable, {"runs": 0,
+                                                     "failures": 0,
+                                                     "timeouts": 0,
+                                                     "spawn_time": 0.0,
+                                                     "max_spawn_time": 0.0,
+                                                     "run_time": 0.0,
+                                                     "max_run_time": 0.0})
+    metrics["runs"] += 1
+    if result["error"] is not None:
+        if "timed out" in str(result["error"]):
+            metrics["timeouts"] += 1
+        else:
+            metrics["failures"] += 1
+
+    metrics["spawn_time"] += result["spawn_time"]
+    metrics["max_spawn_time"] = max(metrics["max_spawn_time"], result["spawn_time"])
+    metrics["run_time"] += result["elapsed"]
+    metrics["max_run_time"] = max(metrics["max_run_time"], result["elapsed"])
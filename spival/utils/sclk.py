@@ -0,0 +1,223 @@
+import re
+
+import numpy as np
+
+from spival.utils.kpl import parse_kernel_pool, get_numeric_values
+from spival.utils.skd_val_logger import log_error, log_info, log_warn
+
+#
+# Validation of the contents of type 1 SCLK kernels. The coefficients of a
+# clock are (encoded SCLK, parallel time, rate) triplets, with the encoded
+# SCLK in ticks since the start of the first partition and the rate in
+# parallel time seconds per most significant clock count. All the records
+# are checked at once with NumPy.
+#
+SCLK_DATA_TYPE_REGEX = re.compile(r'^SCLK_DATA_TYPE_(\d+)$')
+
+SCLK01_REQUIRED_VARIABLES = ['SCLK01_N_FIELDS_{}', 'SCLK01_MODULI_{}', 'SCLK01_OFFSETS_{}',
+                             'SCLK01_OUTPUT_DELIM_{}', 'SCLK_PARTITION_START_{}', 'SCLK_PARTITION_END_{}',
+                             'SCLK01_COEFFICIENTS_{}']
+
+# Difference between the parallel time of a record and the one predicted
+# by the previous record (seconds)
+DISCONTINUITY_TOLERANCE = 1.0e-3
+
+# Relative change of the rate between consecutive records
+RATE_JUMP_TOLERANCE = 1.0e-5
+
+# Rates further than this number of (scaled) median absolute deviations
+# from the median rate, and at least MIN_DRIFT_OUTLIER relative to it
+DRIFT_OUTLIER_FACTOR = 10.0
+MIN_DRIFT_OUTLIER = 1.0e-6
+
+
+def is_valid_sclk_kernel(sclk_path):
+
+    try:
+        variables = parse_kernel_pool(sclk_path)
+    except Exception as ex:
+        log_error("DATA_AND_COMMENTS", "Parsing data of: " + sclk_path + " , exception: " + str(ex), sclk_path)
+        return False
+
+    clock_ids = [SCLK_DATA_TYPE_REGEX.match(name).group(1) for name in variables
+                 if SCLK_DATA_TYPE_REGEX.match(name)]
+    if not clock_ids:
+        log_error("SCLK_DEFINITIONS", "No SCLK_DATA_TYPE_<id> definition found", sclk_path)
+        return False
+
+    is_valid = True
+    for clock_id in clock_ids:
+        try:
+            if not check_sclk(variables, clock_id, sclk_path):
+                is_valid = False
+        except Exception as ex:
+            log_error("SCLK_DEFINITIONS", "Checking clock " + clock_id + " , exception: " + str(ex), sclk_path)
+            is_valid = False
+
+    return is_valid
+
+
+def check_sclk(variables, clock_id, sclk_path):
+
+    data_type = variables['SCLK_DATA_TYPE_' + clock_id]
+    if data_type['values'] != ['1']:
+        log_info("SCLK_DEFINITIONS", "Contents of clock {} of type {} not checked, only type 1 is supported",
+                 sclk_path, clock_id, ' '.join(data_type['values']))
+        return True
+
+    missing = [name.format(clock_id) for name in SCLK01_REQUIRED_VARIABLES if name.format(clock_id) not in variables]
+    for name in missing:
+        log_error("SCLK_DEFINITIONS", "Required variable not found: " + name, sclk_path)
+    if missing:
+        return False
+
+    is_valid = True
+
+    n_fields = get_numeric_values(variables['SCLK01_N_FIELDS_' + clock_id])
+    moduli = get_numeric_values(variables['SCLK01_MODULI_' + clock_id])
+    offsets = get_numeric_values(variables['SCLK01_OFFSETS_' + clock_id])
+
+    if len(n_fields) != 1 or not 1 <= n_fields[0] <= 10:
+        log_error("SCLK_DEFINITIONS", "Wrong number of fields: {} of clock {} on line: {}", sclk_path,
+                  ' '.join(variables['SCLK01_N_FIELDS_' + clock_id]['values']), clock_id,
+                  variables['SCLK01_N_FIELDS_' + clock_id]['line'])
+        return False
+
+    for name, values in [('SCLK01_MODULI_', moduli), ('SCLK01_OFFSETS_', offsets)]:
+        if len(values) != n_fields[0]:
+            log_error("SCLK_DEFINITIONS", "{}{} has {} values, expected one per field: {} on line: {}", sclk_path,
+                      name, clock_id, len(values), int(n_fields[0]), variables[name + clock_id]['line'])
+            is_valid = False
+
+    if np.any(moduli < 1) or np.any(moduli != np.floor(moduli)):
+        log_error("SCLK_DEFINITIONS", "Moduli of clock {} shall be positive integers on line: {}", sclk_path,
+                  clock_id, variables['SCLK01_MODULI_' + clock_id]['line'])
+        is_valid = False
+
+    if not is_valid:
+        return False
+
+    # Ticks per most significant count and maximum count of a partition
+    ticks_per_count = np.prod(moduli[1:])
+    max_ticks = np.prod(moduli)
+
+    total_ticks = check_partitions(variables, clock_id, max_ticks, sclk_path)
+    if total_ticks is None:
+        return False
+
+    if not check_coefficients(variables['SCLK01_COEFFICIENTS_' + clock_id], clock_id, ticks_per_count,
+                              total_ticks, sclk_path):
+        is_valid = False
+
+    return is_valid
+
+
+def check_partitions(variables, clock_id, max_ticks, sclk_path):
+    """
+    Check the partition start and end counts of a clock.
+
+    :return: float
+       The number of ticks of all the partitions, None if they are not valid.
+    """
+    start_variable = variables['SCLK_PARTITION_START_' + clock_id]
+    end_variable = variables['SCLK_PARTITION_END_' + clock_id]
+    starts = get_numeric_values(start_variable)
+    ends = get_numeric_values(end_variable)
+
+    if len(starts) != len(ends) or not len(starts):
+        log_error("SCLK_PARTITIONS", "Clock {} has {} partition starts and {} partition ends", sclk_path,
+                  clock_id, len(starts), len(ends))
+        return None
+
+    is_valid = True
+    start_lines = np.array(start_variable['lines'])
+    end_lines = np.array(end_variable['lines'])
+
+    for idx in np.flatnonzero(ends <= starts):
+        log_error("SCLK_PARTITIONS", "Partition {} of clock {} ends: {} on line: {} before it starts: {} on line: {}",
+                  sclk_path, idx + 1, clock_id, ends[idx], end_lines[idx], starts[idx],
+                  start_lines[idx])
+        is_valid = False
+
+    for idx in np.flatnonzero((starts < 0) | (ends > max_ticks)):
+        log_error("SCLK_PARTITIONS", "Partition {} of clock {} out of the clock range [0, {}] on line: {}",
+                  sclk_path, idx + 1, clock_id, max_ticks, start_lines[idx])
+        is_valid = False
+
+    for idx in np.flatnonzero((starts != np.floor(starts)) | (ends != np.floor(ends))):
+        log_error("SCLK_PARTITIONS", "Partition {} of clock {} is not given in integer ticks on line: {}",
+                  sclk_path, idx + 1, clock_id, start_lines[idx])
+        is_valid = False
+
+    if not is_valid:
+        return None
+
+    return float(np.sum(ends - starts))
+
+
+def check_coefficients(variable, clock_id, ticks_per_count, total_ticks, sclk_path):
+    """
+    Check the coefficient records of a clock: increasing encoded SCLK and
+    parallel times, positive rates within the partitions, and report the
+    discontinuities of parallel time, the rate jumps and the outlier drifts.
+    """
+    values = get_numeric_values(variable)
+    if not len(values) or len(values) % 3:
+        log_error("SCLK_COEFFICIENTS", "Clock {} has {} coefficients, expected a multiple of 3 on line: {}",
+                  sclk_path, clock_id, len(values), variable['line'])
+        return False
+
+    records = values.reshape(-1, 3)
+    sclk, par_time, rate = records[:, 0], records[:, 1], records[:, 2]
+    lines = np.array(variable['lines'][0::3])
+
+    is_valid = True
+
+    for idx in np.flatnonzero(np.diff(sclk) <= 0) + 1:
+        log_error("SCLK_COEFFICIENTS", "Record {} of clock {} on line: {}: encoded SCLK {} is not after the "
+                  "previous one {}", sclk_path, idx + 1, clock_id, lines[idx], sclk[idx], sclk[idx - 1])
+        is_valid = False
+
+    for idx in np.flatnonzero(np.diff(par_time) <= 0) + 1:
+        log_error("SCLK_COEFFICIENTS", "Record {} of clock {} on line: {}: parallel time {} is not after the "
+                  "previous one {}", sclk_path, idx + 1, clock_id, lines[idx], par_time[idx],
+                  par_time[idx - 1])
+        is_valid = False
+
+    for idx in np.flatnonzero(rate <= 0):
+        log_error("SCLK_COEFFICIENTS", "Record {} of clock {} on line: {}: rate {} is not positive",
+                  sclk_path, idx + 1, clock_id, lines[idx], rate[idx])
+        is_valid = False
+
+    for idx in np.flatnonzero((sclk < 0) | (sclk > total_ticks)):
+        log_error("SCLK_COEFFICIENTS", "Record {} of clock {} on line: {}: encoded SCLK {} out of the "
+                  "partitions, with {} ticks", sclk_path, idx + 1, clock_id, lines[idx], sclk[idx],
+                  total_ticks)
+        is_valid = False
+
+    if not is_valid or len(records) < 2:
+        return is_valid
+
+    # Parallel time predicted for every record by the previous one
+    predicted = par_time[:-1] + np.diff(sclk) * rate[:-1] / ticks_per_count
+    discontinuities = par_time[1:] - predicted
+    for idx in np.flatnonzero(np.abs(discontinuities) > DISCONTINUITY_TOLERANCE) + 1:
+        log_warn("SCLK_COEFFICIENTS", "Record {} of clock {} on line: {}: parallel time discontinuity of {:.6f} s",
+                 sclk_path, idx + 1, clock_id, lines[idx], discontinuities[idx - 1])
+
+    rate_jumps = np.abs(rate[1:] / rate[:-1] - 1.0)
+    for idx in np.flatnonzero(rate_jumps > RATE_JUMP_TOLERANCE) + 1:
+        log_warn("SCLK_COEFFICIENTS", "Record {} of clock {} on line: {}: rate jump of {:.3e} from {} to {}",
+                 sclk_path, idx + 1, clock_id, lines[idx], rate_jumps[idx - 1], rate[idx - 1], rate[idx])
+
+    # Drift of the clock with respect to its median rate, the outliers are
+    # found with the median absolute deviation, not biased by them.
+    median_rate = np.median(rate)
+    drift = rate / median_rate - 1.0
+    deviation = 1.4826 * np.median(np.abs(drift))
+    threshold = max(DRIFT_OUTLIER_FACTOR * deviation, MIN_DRIFT_OUTLIER)
+    for idx in np.flatnonzero(np.abs(drift) > threshold):
+        log_warn("SCLK_COEFFICIENTS", "Record {} of clock {} on line: {}: drift outlier of {:.3e} with respect "
+                 "to the median rate {}", sclk_path, idx + 1, clock_id, lines[idx], drift[idx], median_rate)
+
+    return is_valid
@@ -0,0 +1,143 @@
+import numpy as np
+
+from spival.utils.daf import read_daf_descriptors
+from spival.utils.skd_val_logger import log_error, log_info, log_warn
+
+#
+# Structural validation of the segments of binary SPKs and CKs from their
+# DAF descriptors, read without loading the kernel in the kernel pool. The
+# descriptors of all the segments are checked at once with NumPy, so that
+# measured CKs of several GB with thousands of segments are checked in
+# seconds.
+#
+# Descriptor components (ND = 2, NI = 6):
+#
+#    SPK: start ET, end ET; target, center, frame, type, begin, end address
+#    CK:  start SCLK, end SCLK; instrument, frame, type, rates, begin, end
+#
+DAF_SEGMENT_KINDS = {'SPK': {'idword': 'DAF/SPK',
+                             'object': 0, 'center': 1, 'frame': 2, 'type': 3,
+                             'types': [1, 2, 3, 5, 8, 9, 10, 12, 13, 14, 15, 17, 18, 19, 20, 21]},
+                     'CK': {'idword': 'DAF/CK',
+                            'object': 0, 'center': None, 'frame': 1, 'type': 2,
+                            'types': [1, 2, 3, 4, 5, 6]}}
+
+DAF_SEGMENT_ND = 2
+DAF_SEGMENT_NI = 6
+
+
+def check_spk_segments(spk_path):
+    return check_daf_segments(spk_path, 'SPK')
+
+
+def check_ck_segments(ck_path):
+    return check_daf_segments(ck_path, 'CK')
+
+
+def check_daf_segments(kernel_path, kind):
+    """
+    Check the segment descriptors of a SPK or CK: segment times, data
+    types, data addresses within the file, duplicated segments, and the
+    order and overlaps of the segments of every object; the IDs of the
+    objects and frames are resolved with the registries of the validated
+    kernels or the SPICE built-in IDs.
+    """
+    from spival.utils.skd_utils import is_naif_id, is_frame_id, is_ck_id
+
+    spec = DAF_SEGMENT_KINDS[kind]
+
+    try:
+        daf = read_daf_descriptors(kernel_path)
+    except Exception as ex:
+        log_error("DAF_SEGMENTS", "Reading DAF descriptors of: " + kernel_path + " , exception: " + str(ex), kernel_path)
+        return False
+
+    if not daf['idword'].startswith(spec['idword']) and not daf['idword'].startswith('NAIF/DAF') \
+            or daf['nd'] != DAF_SEGMENT_ND or daf['ni'] != DAF_SEGMENT_NI:
+        log_error("DAF_SEGMENTS", "Not a {} DAF, ID word: '{}' ND: {} NI: {}", kernel_path,
+                  kind, daf['idword'].strip(), daf['nd'], daf['ni'])
+        return False
+
+    n_segments = len(daf['doubles'])
+    if not n_segments:
+        log_error("DAF_SEGMENTS", "{} without segments", kernel_path, kind)
+        return False
+
+    start, end = daf['doubles'][:, 0], daf['doubles'][:, 1]
+    integers = daf['integers']
+    objects = integers[:, spec['object']]
+    frames = integers[:, spec['frame']]
+    data_types = integers[:, spec['type']]
+    begin_addresses, end_addresses = integers[:, 4], integers[:, 5]
+
+    is_valid = True
+
+    for idx in np.flatnonzero(end < start):
+        log_error("DAF_SEGMENTS", "Segment {} '{}' of object {} ends before it starts", kernel_path,
+                  idx + 1, get_name(daf, idx), objects[idx])
+        is_valid = False
+
+    for idx in np.flatnonzero(~np.isin(data_types, spec['types'])):
+        log_error("DAF_SEGMENTS", "Segment {} '{}' of object {} has unsupported data type: {}", kernel_path,
+                  idx + 1, get_name(daf, idx), objects[idx], data_types[idx])
+        is_valid = False
+
+    for idx in np.flatnonzero((begin_addresses < 1) | (end_addresses < begin_addresses)):
+        log_error("DAF_SEGMENTS", "Segment {} '{}' of object {} has wrong data addresses: {} to {}", kernel_path,
+                  idx + 1, get_name(daf, idx), objects[idx], begin_addresses[idx], end_addresses[idx])
+        is_valid = False
+
+    for idx in np.flatnonzero(end_addresses > daf['words']):
+        log_error("DAF_SEGMENTS", "Segment {} '{}' of object {} is truncated, data ends at address: {} beyond the end "
+                  "of the file: {}", kernel_path, idx + 1, get_name(daf, idx), objects[idx], end_addresses[idx],
+                  daf['words'])
+        is_valid = False
+
+    #
+    # Duplicated segments: same object, frame and time interval.
+    #
+    keys = np.rec.fromarrays([objects, frames, start, end])
+    unique_keys, first_indexes, counts = np.unique(keys, return_index=True, return_counts=True)
+    for idx in first_indexes[counts > 1]:
+        log_error("DAF_SEGMENTS", "Segment {} '{}' of object {} is duplicated", kernel_path,
+                  idx + 1, get_name(daf, idx), objects[idx])
+        is_valid = False
+
+    #
+    # Order and overlaps of the segments of every object: in file order,
+    # and sorted by start time.
+    #
+    file_order = np.lexsort((np.arange(n_segments), objects))
+    same_object = objects[file_order][1:] == objects[file_order][:-1]
+    for position in np.flatnonzero(same_object & (np.diff(start[file_order]) < 0)) + 1:
+        idx = file_order[position]
+        log_warn("DAF_SEGMENTS", "Segment {} '{}' of object {} starts before the previous segment of the object",
+                 kernel_path, idx + 1, get_name(daf, idx), objects[idx])
+
+    time_order = np.lexsort((start, objects))
+    same_object = objects[time_order][1:] == objects[time_order][:-1]
+    overlaps = same_object & (start[time_order][1:] < end[time_order][:-1])
+    for position in np.flatnonzero(overlaps) + 1:
+        idx, previous = time_order[position], time_order[position - 1]
+        log_warn("DAF_SEGMENTS", "Segment {} '{}' of object {} overlaps segment {} '{}'", kernel_path,
+                 idx + 1, get_name(daf, idx), objects[idx], previous + 1, get_name(daf, previous))
+
+    #
+    # The IDs are resolved once each.
+    #
+    resolvers = [('object', objects, is_naif_id if kind == 'SPK' else is_ck_id), ('frame', frames, is_frame_id)]
+    if spec['center'] is not None:
+        resolvers.append(('center', integers[:, spec['center']], is_naif_id))
+
+    for id_kind, ids, resolver in resolvers:
+        for unknown_id in [int(value) for value in np.unique(ids) if not resolver(int(value))]:
+            log_warn("DAF_SEGMENTS", "Unknown {} ID: {} of {} segments, not defined at the validated kernels nor a "
+                     "SPICE built-in ID", kernel_path, id_kind, unknown_id, int(np.count_nonzero(ids == unknown_id)))
+
+    log_info("DAF_SEGMENTS", "{} segments of {} objects", kernel_path, n_segments, len(np.unique(objects)))
+
+    return is_valid
+
+
+def get_name(daf, idx):
+    return daf['names'][idx] if idx < len(daf['names']) else ''
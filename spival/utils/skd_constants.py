@@ -24,8 +24,10 @@ KERNEL_EXTENSIONS = KERNEL_TEXT_EXTENSIONS + KERNEL_BINARY_EXTENSIONS
 DOC_EXTENSIONS = [".txt", ".csv", ".xml", ".html"]
 LONG_LINE_EXTENSIONS = [".csv", ".xml", ".html"]
 
-IGNORE_EXTENSIONS = [".tar", ".obj", ".3ds", ".mtl", ".json", ".jpg", ".png", ".orb", ".gap"]
-CHECK_EXTENSIONS = DOC_EXTENSIONS + KERNEL_EXTENSIONS
+ORBNUM_EXTENSIONS = [".orb"]
+
+IGNORE_EXTENSIONS = [".tar", ".obj", ".3ds", ".mtl", ".json", ".jpg", ".png", ".gap"]
+CHECK_EXTENSIONS = DOC_EXTENSIONS + KERNEL_EXTENSIONS + ORBNUM_EXTENSIONS
 
 KERNEL_TEXT_HEADERS = {".tf": "KPL/FK",
                        ".ti": "KPL/IK",
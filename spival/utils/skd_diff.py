@@ -0,0 +1,224 @@
+import difflib
+import json
+import os
+import re
+
+from spival.utils.kpl import parse_kernel_pool_text
+from spival.utils.pool_snapshot import get_mk_kernels
+from spival.utils.skd_constants import KERNEL_TEXT_EXTENSIONS
+from spival.utils.skd_utils import is_versioned_mk
+
+#
+# Changes between two versions of an SKD, computed from the git trees of
+# the versions: git compares the blob IDs of the trees, so only the changed
+# files are read (the MKs to compare the kernels they load and the text
+# kernels to count the changed lines), without a checkout.
+#
+SKD_KERNELS_DIR = 'kernels'
+SKD_MK_DIR = 'mk'
+FORMER_VERSIONS_DIR = 'former_versions'
+
+# Version suffix of the kernels, a kernel with the same name and another
+# version supersedes it
+KERNEL_VERSION_REGEX = re.compile(r'_v\d+$', re.IGNORECASE)
+
+
+def resolve_version(repo, version):
+    """
+    Return the commit of an SKD version: any git reference (tag, branch or
+    commit) or the latest tag that starts with the version, e.g. v420 for
+    v420_20240101_001.
+    """
+    try:
+        return repo.commit(version)
+    except Exception:
+        pass
+
+    tags = [tag for tag in repo.tags if tag.name.lower().startswith(version.lower() + '_')]
+    if not tags:
+        raise Exception("No git reference or tag found for SKD version: " + str(version))
+
+    return max(tags, key=lambda tag: tag.commit.committed_date).commit
+
+
+def get_kernel_family(path):
+    stem, extension = os.path.splitext(os.path.basename(path))
+    return KERNEL_VERSION_REGEX.sub('', stem).lower() + extension.lower()
+
+
+def read_blob_text(blob):
+    return blob.data_stream.read().decode('utf-8', errors='replace')
+
+
+def get_mk_kernel_names(blob):
+    variables = parse_kernel_pool_text(read_blob_text(blob).splitlines(), blob.path)
+    return [os.path.basename(kernel) for kernel in get_mk_kernels(variables)]
+
+
+def diff_mk_kernels(kernels_a, kernels_b):
+    """
+    Compare the kernels loaded by two versions of an MK.
+
+    :return: dict
+       The 'added' and 'removed' kernels and the 'superseded' ones, as
+       (old, new) tuples of kernels that only differ in their version.
+    """
+    added = [kernel for kernel in kernels_b if kernel not in kernels_a]
+    removed = [kernel for kernel in kernels_a if kernel not in kernels_b]
+
+    removed_by_family = {}
+    for kernel in removed:
+        removed_by_family.setdefault(get_kernel_family(kernel), []).append(kernel)
+
+    superseded = []
+    for kernel in list(added):
+        candidates = removed_by_family.get(get_kernel_family(kernel))
+        if candidates:
+            old_kernel = candidates.pop(0)
+            superseded.append((old_kernel, kernel))
+            added.remove(kernel)
+            removed.remove(old_kernel)
+
+    return {'added': added, 'removed': removed, 'superseded': superseded}
+
+
+def get_changed_lines(blob_a, blob_b):
+    lines_a = read_blob_text(blob_a).splitlines()
+    lines_b = read_blob_text(blob_b).splitlines()
+    added, removed = 0, 0
+    for line in difflib.unified_diff(lines_a, lines_b, lineterm='', n=0):
+        if line.startswith('+') and not line.startswith('+++'):
+            added += 1
+        elif line.startswith('-') and not line.startswith('---'):
+            removed += 1
+
+    return added, removed
+
+
+def build_skd_diff(repo_path, from_version, to_version):
+    """
+    Compute the changes of an SKD between two versions.
+
+    :return: dict
+       The resolved 'from' and 'to' versions and commits, the kernels
+       'added', 'removed' and 'modified', the 'text_kernels' changed with
+       their added and removed lines, the kernels moved or added to
+       'former_versions', the 'versioned_mks' added, the changes of the
+       kernels loaded by every other MK in 'mks', and the 'other_files'
+       changed.
+    """
+    import git
+
+    repo = git.Repo(repo_path, search_parent_directories=True)
+    commit_a = resolve_version(repo, from_version)
+    commit_b = resolve_version(repo, to_version)
+
+    root = SKD_KERNELS_DIR if any(item.path == SKD_KERNELS_DIR for item in commit_b.tree.trees) else ''
+    prefix = root + '/' if root else ''
+
+    skd_diff = {'from': {'version': read_tree_version(commit_a, prefix) or from_version,
+                         'commit': commit_a.hexsha},
+                'to': {'version': read_tree_version(commit_b, prefix) or to_version, 'commit': commit_b.hexsha},
+                'added': [], 'removed': [], 'modified': [], 'text_kernels': [], 'former_versions': [],
+                'versioned_mks': [], 'mks': {}, 'other_files': []}
+
+    changes = commit_a.diff(commit_b, paths=[root] if root else None)
+    for change in changes:
+        change_type = change.change_type
+        path = (change.b_path if change_type != 'D' else change.a_path)[len(prefix):]
+        parts = path.split('/')
+        extension = os.path.splitext(path)[1].lower()
+
+        if len(parts) < 2:
+            skd_diff['other_files'].append({'path': path, 'change': change_type})
+
+        elif FORMER_VERSIONS_DIR in parts[:-1]:
+            if change_type in ('A', 'R'):
+                skd_diff['former_versions'].append(path)
+            else:
+                skd_diff['other_files'].append({'path': path, 'change': change_type})
+
+        elif parts[0] == SKD_MK_DIR and extension == '.tm':
+            if is_versioned_mk(path):
+                if change_type == 'A':
+                    skd_diff['versioned_mks'].append(path)
+                continue
+            kernels_a = get_mk_kernel_names(change.a_blob) if change_type != 'A' else []
+            kernels_b = get_mk_kernel_names(change.b_blob) if change_type != 'D' else []
+            mk_diff = diff_mk_kernels(kernels_a, kernels_b)
+            if any(mk_diff.values()):
+                skd_diff['mks'][path] = mk_diff
+
+        elif change_type in ('A', 'D') or change_type == 'R' and change.a_path != change.b_path:
+            if change_type != 'A':
+                skd_diff['removed'].append(change.a_path[len(prefix):])
+            if change_type != 'D':
+                skd_diff['added'].append(path)
+
+        else:
+            skd_diff['modified'].append(path)
+            if extension in KERNEL_TEXT_EXTENSIONS:
+                added, removed = get_changed_lines(change.a_blob, change.b_blob)
+                skd_diff['text_kernels'].append({'path': path, 'added_lines': added, 'removed_lines': removed})
+
+    for key in ['added', 'removed', 'modified', 'former_versions', 'versioned_mks']:
+        skd_diff[key].sort()
+
+    return skd_diff
+
+
+def read_tree_version(commit, prefix=''):
+    try:
+        return read_blob_text(commit.tree / (prefix + 'version')).strip()
+    except KeyError:
+        return None
+
+
+def write_skd_diff(skd_diff, output_format='text', output=None):
+
+    if output_format == 'json':
+        text = json.dumps(skd_diff, indent=2)
+    else:
+        text = get_skd_diff_text(skd_diff)
+
+    if output is None:
+        print(text)
+    else:
+        with open(output, 'w') as f:
+            f.write(text + '\n')
+
+    return
+
+
+def get_skd_diff_text(skd_diff):
+
+    lines = ['SKD changes from ' + skd_diff['from']['version'] + ' (' + skd_diff['from']['commit'][:10] +
+             ') to ' + skd_diff['to']['version'] + ' (' + skd_diff['to']['commit'][:10] + ')', '']
+
+    for key, title in [('added', 'Kernels added'), ('removed', 'Kernels removed'),
+                       ('modified', 'Kernels modified'), ('former_versions', 'Kernels moved to former_versions'),
+                       ('versioned_mks', 'Versioned meta-kernels added')]:
+        if skd_diff[key]:
+            lines.append('   ' + title + ':')
+            lines.extend('      ' + path for path in skd_diff[key])
+            lines.append('')
+
+    if skd_diff['text_kernels']:
+        lines.append('   Text kernels changed:')
+        lines.extend('      {} (+{} -{} lines)'.format(kernel['path'], kernel['added_lines'], kernel['removed_lines'])
+                     for kernel in skd_diff['text_kernels'])
+        lines.append('')
+
+    for mk_path, mk_diff in sorted(skd_diff['mks'].items()):
+        lines.append('   Meta-kernel ' + mk_path + ':')
+        lines.extend('      Added:      ' + kernel for kernel in mk_diff['added'])
+        lines.extend('      Removed:    ' + kernel for kernel in mk_diff['removed'])
+        lines.extend('      Superseded: ' + old + ' by ' + new for old, new in mk_diff['superseded'])
+        lines.append('')
+
+    if skd_diff['other_files']:
+        lines.append('   Other files:')
+        lines.extend('      ' + change['change'] + ' ' + change['path'] for change in skd_diff['other_files'])
+        lines.append('')
+
+    return '\n'.join(lines).rstrip()
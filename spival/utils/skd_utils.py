@@ -15,6 +15,11 @@ from spival.utils.files import is_empty_file, \
     validate_trailing_chars, read_all_text, get_text_and_data_from_kernel, get_sections_map_from_kernel_comments, \
     get_section_from_sections_map, get_naif_ids_from_text, \
     get_frames_definitions_from_text, get_instruments_definitions_from_text, get_sites_definitions_from_text
+from spival.utils.pck import is_valid_text_pck_kernel, is_valid_binary_pck_kernel
+from spival.utils.sclk import is_valid_sclk_kernel
+from spival.utils.segments import check_spk_segments, check_ck_segments
+from spival.utils.dsk import is_valid_dsk_kernel
+from spival.classes.release_history import get_release_notes_record
 
 # Modification of:
 # https://spiceypy.readthedocs.io/en/main/other_stuff.html#lesson-1-kernel-management-with-the-kernel-subsystem
@@ -23,6 +28,7 @@ from spival.utils.skd_val_logger import log_error, log_info, log_warn
 FOUND_NAIF_IDS = []
 FOUND_FRAME_IDS = []
 FOUND_FRAME_NAMES = []
+FOUND_CK_IDS = []
 
 
 def write_mk_kernels_report(mk_path, out_report_file):
@@ -78,7 +84,7 @@ def write_mk_kernels_report(mk_path, out_report_file):
                 # spiceypy.gdpool retrieves doubles from the
                 # kernel pool.
                 #
-                dvars = spiceypy.gdpool(cval, 0, 10)
+                dvars = spiceypy.gdpool(cval, 0, dim)
                 for dvar in dvars:
                     out_file.write('  Numeric value: {0:20.6f}\n'.format(dvar))
 
@@ -89,7 +95,7 @@ def write_mk_kernels_report(mk_path, out_report_file):
                 # spiceypy.gcpool retrieves string values from the
                 # kernel pool.
                 #
-                cvars = spiceypy.gcpool(cval, 0, 10)
+                cvars = spiceypy.gcpool(cval, 0, dim)
 
                 for cvar in cvars:
                     out_file.write('  String value: {0}\n'.format(cvar))
@@ -170,7 +176,15 @@ def is_valid_text_kernel(filename, check_line_length=True, check_indentation=Tru
             log_error("INVALID_INSTRUMENTS_KERNEL", "Invalid instruments kernel.", filename)
             is_valid = False
 
-    # TODO: Do specific checks for text PCKs and SCLKs
+    elif is_sclk_file(filename):
+        if not is_valid_sclk_kernel(filename):
+            log_error("INVALID_SCLK_KERNEL", "Invalid SCLK kernel.", filename)
+            is_valid = False
+
+    elif is_pck_file(filename):
+        if not is_valid_text_pck_kernel(filename):
+            log_error("INVALID_PCK_KERNEL", "Invalid PCK kernel.", filename)
+            is_valid = False
 
     return is_valid
 
@@ -229,12 +243,28 @@ def is_valid_binary_kernel(filename, check_line_length=True, check_indentation=T
             log_error("INVALID_SPK_KERNEL", "Invalid SPK kernel.", filename)
             is_valid = False
 
+        if not check_spk_segments(filename):
+            log_error("INVALID_SPK_KERNEL", "Invalid SPK segments.", filename)
+            is_valid = False
+
     elif is_ck_file(filename):
         if not is_valid_ck_kernel(filename):
             log_error("INVALID_CK_KERNEL", "Invalid CK kernel.", filename)
             is_valid = False
 
-    # TODO: Do specific checks for Binary PCKs
+        if not check_ck_segments(filename):
+            log_error("INVALID_CK_KERNEL", "Invalid CK segments.", filename)
+            is_valid = False
+
+    elif is_bpc_file(filename):
+        if not is_valid_binary_pck_kernel(filename):
+            log_error("INVALID_PCK_KERNEL", "Invalid binary PCK kernel.", filename)
+            is_valid = False
+
+    elif is_dsk_file(filename):
+        if not is_valid_dsk_kernel(filename):
+            log_error("INVALID_DSK_KERNEL", "Invalid DSK kernel.", filename)
+            is_valid = False
 
     return is_valid
 
@@ -297,7 +327,7 @@ def is_valid_metakernel(mk_path):
                 # spiceypy.gdpool retrieves doubles from the
                 # kernel pool.
                 #
-                dvars = spiceypy.gdpool(cval, 0, 10)
+                dvars = spiceypy.gdpool(cval, 0, dim)
 
             elif type == 'C':
 
@@ -306,7 +336,7 @@ def is_valid_metakernel(mk_path):
                 # spiceypy.gcpool retrieves string values from the
                 # kernel pool.
                 #
-                cvars = spiceypy.gcpool(cval, 0, 10)
+                cvars = spiceypy.gcpool(cval, 0, dim)
 
                 if cval == "SKD_VERSION":
                     # Check filename aligned with SKD_VERSION for MKs with version
@@ -501,6 +531,22 @@ def is_ck_file(path):
     return has_extension(path, ".bc")
 
 
+def is_pck_file(path):
+    return has_extension(path, ".tpc")
+
+
+def is_bpc_file(path):
+    return has_extension(path, ".bpc")
+
+
+def is_dsk_file(path):
+    return has_extension(path, ".bds")
+
+
+def is_sclk_file(path):
+    return has_extension(path, ".tsc")
+
+
 def is_versioned_mk(mk_path):
     mk_filename = os.path.basename(mk_path)
     if not is_mk_file(mk_path):
@@ -518,31 +564,13 @@ def is_local_mk(mk_path):
 
 def get_versions_history_from_release_notes_file(rel_notes_file):
 
-    text = get_section_text_from_kernel_comments(rel_notes_file, "Appendix: Release History")
-    if not len(text):
-
-        text = get_section_text_from_kernel_comments(rel_notes_file, "Release History")
-        if not len(text):
-            log_error("WRONG_RELEASE_NOTES",
-                      "No 'Release History' section found in kernel: " + rel_notes_file, rel_notes_file)
-            return None
-
-    versions = []
-    # Check that all defined versions in section are properly declared
-    indentation = -1
-    for line in text.splitlines():
-        if indentation < 0:
-            if len(line.strip()) > 0:
-                indentation = len(line) - len(line.lstrip())
-
-        if indentation >= 0:
-            if len(line) - len(line.lstrip()) == indentation:
-                tokens = line.strip().split(" ")
-                if len(tokens) == 4:
-                    if tokens[3].startswith("v") and len(tokens[3].split(".")) == 3:
-                        versions.append(tokens[3])
+    history = get_release_notes_record(rel_notes_file)['history']
+    if history is None:
+        log_error("WRONG_RELEASE_NOTES",
+                  "No 'Release History' section found in kernel: " + rel_notes_file, rel_notes_file)
+        return None
 
-    return versions
+    return [entry['version'] for entry in history]
 
 
 def check_release_notes_version(rel_notes_file):
@@ -550,9 +578,9 @@ def check_release_notes_version(rel_notes_file):
     basename = os.path.basename(rel_notes_file)
     filename, extension = os.path.splitext(basename)
 
-    text = read_all_text(rel_notes_file)
-    first_line = text.splitlines()[0]
-    version = first_line.split()[-1]
+    record = get_release_notes_record(rel_notes_file)
+    first_line = record['first_line']
+    version = record['version']
 
     is_valid = True
     if not filename.endswith("skd_current"):
@@ -563,12 +591,12 @@ def check_release_notes_version(rel_notes_file):
             is_valid = False
 
     # First paragraph shall contain "(version)"
-    ver_text = "(" + version.replace("v", "") + ")"
-    if ver_text not in text:
+    if not record['has_version_text']:
+        ver_text = "(" + version.replace("v", "") + ")"
         log_error("WRONG_RELEASE_NOTES", "Text : " + ver_text + " not found in first paragraph.", rel_notes_file)
         is_valid = False
 
-    notes = get_section_text_from_kernel_comments(rel_notes_file, "Notes")
+    notes = record['notes']
     if not len(notes):
         log_error("WRONG_RELEASE_NOTES", "No 'Notes' section found in kernel.", rel_notes_file)
 
@@ -911,14 +939,24 @@ def check_naif_id_in_section_text(naif_id, synonyms, section_name, section_text,
     return naif_id_is_valid
 
 
+def register_frames(frames):
+
+    for frame_id in frames:
+        FOUND_FRAME_IDS.append(frame_id)
+        if "frame_name" in frames[frame_id]:
+            FOUND_FRAME_NAMES.append(frames[frame_id]["frame_name"])
+
+        # The class ID of CK frames is the ID of the CK structure
+        if frames[frame_id].get("frame_class") == "3":
+            class_id = frames[frame_id]["keywords"].get("FRAME_{used_id}_CLASS_ID")
+            if class_id is not None and is_number(class_id["value"]):
+                FOUND_CK_IDS.append(int(class_id["value"]))
+
+
 def check_frame_definitions(data_text, sections_map, fk_path):
     try:
         frames = get_frames_definitions_from_text(data_text)
-
-        for frame_id in frames:
-            FOUND_FRAME_IDS.append(frame_id)
-            if "frame_name" in frames[frame_id]:
-                FOUND_FRAME_NAMES.append(frames[frame_id]["frame_name"])
+        register_frames(frames)
 
     except Exception as ex:
         log_error("WRONG_DEFINITIONS",
@@ -1004,15 +1042,15 @@ def check_keywords_indentation(keywords, keyword_indent, path):
 
             if keyword_data["keyword_indent"] != keyword_indent:
                 log_warn("WRONG_INDENTATION",
-                          "WRONG INDENTATION OF KEYWORD: '" + keyword_data["var"] + "' at line: '" +
-                          keyword_data["line"] + "' at " + path, path)
+                         "WRONG INDENTATION OF KEYWORD: '{}' at line: '{}' at {}",
+                         path, keyword_data["var"], keyword_data["line"], path)
             elif keyword_data["equal_indent"] != equal_indent:
                 log_warn("WRONG_INDENTATION",
-                         "WRONG INDENTATION OF '=' at line: '" + keyword_data["line"] + "' at " + path, path)
+                         "WRONG INDENTATION OF '=' at line: '{}' at {}", path, keyword_data["line"], path)
             elif tmp_value_indent != value_indent:
                 log_warn("WRONG_INDENTATION",
-                         "WRONG INDENTATION OF '" + keyword_data["value"] + "' at line: '" +
-                         keyword_data["line"] + "' at " + path, path)
+                         "WRONG INDENTATION OF '{}' at line: '{}' at {}",
+                         path, keyword_data["value"], keyword_data["line"], path)
 
     return keyword_indent
 
@@ -1033,8 +1071,8 @@ def check_kernel_keywords(def_obj, keywords_ref_key, keywords_ref_map, path):
                     continue  # Ignore this keyword in this case
 
             log_error("WRONG_KEYWORD",
-                      "MISSING KEYWORD AT DEFINITION: " + keyword_ref + " not found at: \n" + def_obj["definition"],
-                      path)
+                      "MISSING KEYWORD AT DEFINITION: {} not found at: \n{}",
+                      path, keyword_ref, def_obj["definition"])
             keywords_valid = False
             continue
 
@@ -1112,11 +1150,10 @@ def check_kernel_keywords(def_obj, keywords_ref_key, keywords_ref_map, path):
 
                 if not is_naif_id(value):
                     log_warn("WRONG_KEYWORD",
-                              "WARNING: WRONG VALUE FOUND AT LINE: '" + keyword_data["line"] + "' " +
-                              "found: '" + str(value) + "' expected any of defined NAIF IDs " +
-                              "at the validated kernels or any of the SPICE BUILT-IN BODY IDs.\n" +
-                              "Check if this BODY ID has been defined in other kernel.\n" +
-                              "Warning raised at " + path, path)
+                             "WARNING: WRONG VALUE FOUND AT LINE: '{}' found: '{}' expected any of defined NAIF IDs "
+                             "at the validated kernels or any of the SPICE BUILT-IN BODY IDs.\n"
+                             "Check if this BODY ID has been defined in other kernel.\n"
+                             "Warning raised at {}", path, keyword_data["line"], value, path)
 
             elif value_ref == "FRAME_NAME" \
                     or value_ref == "FRAME_NAME_LIST":
@@ -1136,11 +1173,10 @@ def check_kernel_keywords(def_obj, keywords_ref_key, keywords_ref_map, path):
                 for frm_name in frame_names:
                     if not is_frame_name(frm_name):
                         log_warn("WRONG_KEYWORD",
-                                  "WARNING: WRONG FRAME NAME FOUND AT LINE: '" + keyword_data["line"] + "' " +
-                                  "found: '" + str(frm_name) + "' expected any of defined FRAME NAMES " +
-                                  "at the validated FKs or any of the SPICE BUILT-IN FRAMES.\n" +
-                                  "Check if this FRAME NAME has been defined in other kernel.\n" +
-                                  "Warning raised at " + path, path)
+                                 "WARNING: WRONG FRAME NAME FOUND AT LINE: '{}' found: '{}' expected any of defined "
+                                 "FRAME NAMES at the validated FKs or any of the SPICE BUILT-IN FRAMES.\n"
+                                 "Check if this FRAME NAME has been defined in other kernel.\n"
+                                 "Warning raised at {}", path, keyword_data["line"], frm_name, path)
 
             else:
                 raise NotImplementedError("Reference value not supported: " + value_ref)
@@ -1211,6 +1247,26 @@ def is_frame_id(frame_id):
     return True
 
 
+def is_ck_id(ck_id):
+    try:
+        if not isinstance(ck_id, int):
+            ck_id = int(ck_id)
+    except:
+        return False
+
+    if ck_id not in FOUND_CK_IDS:
+        try:
+            frame_code, frame_name, center = spiceypy.ccifrm(3, ck_id)
+        except NotFoundError:
+            return False
+        except SpiceyError:
+            return False
+        if not frame_code:
+            return False
+
+    return True
+
+
 def is_frame_name(frame_name):
     if not isinstance(frame_name, str):
         return False
@@ -1,6 +1,28 @@
+import json
+import numbers
+
+#
+# The logs are kept for the whole validation run, which on large archives
+# means many records: a record only holds the codes of its level and type
+# and the template and arguments of its message, which is formatted when
+# needed. The paths are stored once in a path table and the logs of every
+# file are kept by path index, with the counters by level and type.
+#
+# With a maximum number of logs per file, the records beyond it are not
+# kept but still counted. The string arguments of the records are bounded,
+# so that the logs embedding whole lines or definition blocks do not keep
+# them for the whole run, and the messages are only formatted when they are
+# echoed or reported.
+#
+PATHS = []
+PATH_IDS = {}
+LOGS = {}
 
+MAX_LOGS_PER_FILE = None
+MAX_LOG_ARG_LENGTH = 512
+ECHO_LOGS = True
 
-LOGS = {}
+PARTIAL_REPORT_VERSION = 2
 
 LOG_LEVEL_INFO = "Info"
 LOG_LEVEL_WARN = "Warning"
@@ -14,68 +36,183 @@ LOG_TYPES = ["EMPTY_FILE", "HAS_BAD_CHARS", "BAD_CHAR", "HAS_LONG_LINES", "EXCEE
              "HAS_WRONG_INDENTATION", "HAS_TRAILING_CHARS", "TRAILING_CHARS", "INVALID_CK_KERNEL", "INVALID_SPK_KERNEL",
              "WRONG_MK", "WRONG_KERNEL_HEADER", "WRONG_VERSION_SECTION", "WRONG_RELEASE_NOTES", "DATA_AND_COMMENTS",
              "MISSING_SECTION", "NAIF_IDS", "WRONG_DEFINITIONS", "MISALIGNED_SECTION", "WRONG_INDENTATION",
-             "WRONG_KEYWORD", "WRONG_KEYWORD_ORDER"]
+             "WRONG_KEYWORD", "WRONG_KEYWORD_ORDER", "INVALID_ORBNUM_FILE", "ORBNUM_FORMAT", "ORBNUM_ORBITS",
+             "ORBNUM_TIMES", "ORBNUM_COVERAGE", "INVALID_SCLK_KERNEL", "SCLK_DEFINITIONS", "SCLK_PARTITIONS",
+             "SCLK_COEFFICIENTS", "INVALID_PCK_KERNEL", "PCK_CONSTANTS", "PCK_SEGMENTS",
+             "DAF_SEGMENTS", "INVALID_DSK_KERNEL", "DSK_SEGMENTS", "DUPLICATED_FILE",
+             "LABEL_KEYWORDS", "TKFRAME_GEOMETRY", "FOV_GEOMETRY",
+             "MK_ANALYSIS"]
 
+LOG_LEVEL_CODES = {log_level: code for code, log_level in enumerate(LOG_LEVELS)}
+LOG_TYPE_CODES = {log_type: code for code, log_type in enumerate(LOG_TYPES)}
 
-def add_log(level, l_type, message, path):
 
-    if path not in LOGS:
-        LOGS[path] = []
+class LogRecord:
 
-    LOGS[path].append({"level": level,
-                       "type": l_type,
-                       "message": message})
+    __slots__ = ("level_code", "type_code", "template", "args")
 
-    print(level + " - " + l_type + " -> " + message + " - " + path)
+    def __init__(self, level_code, type_code, template, args):
 
+        self.level_code = level_code
+        self.type_code = type_code
+        self.template = template
+        self.args = args
 
-def log_info(l_type, message, path):
-    add_log(LOG_LEVEL_INFO, l_type, message, path)
+    @property
+    def level(self):
+        return LOG_LEVELS[self.level_code]
 
+    @property
+    def type(self):
+        return LOG_TYPES[self.type_code]
 
-def log_warn(l_type, message, path):
-    add_log(LOG_LEVEL_WARN, l_type, message, path)
+    @property
+    def message(self):
+        return format_message(self.template, self.args)
 
 
-def log_error(l_type, message, path):
-    add_log(LOG_LEVEL_ERROR, l_type, message, path)
+class FileLogs:
 
+    __slots__ = ("records", "level_counts", "type_counts")
 
-def write_file_report(path):
+    def __init__(self):
 
-    if path in LOGS:
+        self.records = []
+        self.level_counts = [0] * len(LOG_LEVELS)
+        self.type_counts = [0] * len(LOG_TYPES)
 
-        level_counts = {}
-        for log_level in LOG_LEVELS:
-            level_counts[log_level] = 0
+    @property
+    def dropped(self):
+        return sum(self.level_counts) - len(self.records)
 
-        log_type_counts = {}
-        for log_type in LOG_TYPES:
-            log_type_counts[log_type] = 0
 
-        for log in LOGS[path]:
-            level_counts[log["level"]] += 1
-            log_type_counts[log["type"]] += 1
+def format_message(template, args):
+
+    if not args:
+        return template
+
+    return template.format(*args)
+
+
+def bound_log_arg(arg):
+    """
+    Return the argument of a log record to keep: numbers as they are, as
+    they can be formatted with a format spec, and anything else as a string
+    of at most ``MAX_LOG_ARG_LENGTH`` characters.
+    """
+    if isinstance(arg, numbers.Number):
+        return arg
+
+    arg = str(arg)
+    if len(arg) > MAX_LOG_ARG_LENGTH:
+        arg = arg[:MAX_LOG_ARG_LENGTH] + "... (" + str(len(arg)) + " chars)"
+
+    return arg
+
+
+def set_echo_logs(echo):
+    """
+    Print every log when it is added, or only keep it for the reports.
+    """
+    global ECHO_LOGS
+    ECHO_LOGS = echo
+
+
+def set_max_logs_per_file(max_logs):
+    """
+    Keep at most ``max_logs`` records per file, None to keep all of them.
+    """
+    global MAX_LOGS_PER_FILE
+    MAX_LOGS_PER_FILE = max_logs
+
+
+def get_path_id(path):
+
+    path_id = PATH_IDS.get(path)
+    if path_id is None:
+        path_id = len(PATHS)
+        PATHS.append(path)
+        PATH_IDS[path] = path_id
+        LOGS[path_id] = FileLogs()
+
+    return path_id
+
+
+def get_logs(path):
+    """
+    Return the logs kept for ``path`` as (level, type, message) tuples.
+    """
+    path_id = PATH_IDS.get(path)
+    if path_id is None:
+        return []
+
+    return [(log.level, log.type, log.message) for log in LOGS[path_id].records]
+
+
+def add_log(level, l_type, message, path, args=()):
+
+    level_code = LOG_LEVEL_CODES[level]
+    type_code = LOG_TYPE_CODES[l_type]
+
+    file_logs = LOGS[get_path_id(path)]
+    file_logs.level_counts[level_code] += 1
+    file_logs.type_counts[type_code] += 1
+
+    if MAX_LOGS_PER_FILE is None or len(file_logs.records) < MAX_LOGS_PER_FILE:
+        file_logs.records.append(LogRecord(level_code, type_code, message,
+                                           tuple(bound_log_arg(arg) for arg in args)))
+
+    if ECHO_LOGS:
+        print(level + " - " + l_type + " -> " + format_message(message, args) + " - " + path)
+
+
+#
+# The message can be a template to be formatted with str.format() and the
+# arguments given after the path, e.g.:
+#
+#    log_error("EXCEEDS_LINE_LENGTH", "{}\n Line nr: {}", path, line, line_nr)
+#
+def log_info(l_type, message, path, *args):
+    add_log(LOG_LEVEL_INFO, l_type, message, path, args)
+
+
+def log_warn(l_type, message, path, *args):
+    add_log(LOG_LEVEL_WARN, l_type, message, path, args)
+
+
+def log_error(l_type, message, path, *args):
+    add_log(LOG_LEVEL_ERROR, l_type, message, path, args)
+
+
+def write_file_report(path):
+
+    if path in PATH_IDS:
+
+        file_logs = LOGS[PATH_IDS[path]]
 
         print("--------------------------------------------------------")
         print(" ===> " + path)
         print("")
 
         for log_level in LOG_LEVELS:
-            print("        " + log_level + ": " + str(level_counts[log_level]))
+            print("        " + log_level + ": " + str(file_logs.level_counts[LOG_LEVEL_CODES[log_level]]))
         print("")
 
         for log_type in LOG_TYPES:
-            counts = log_type_counts[log_type]
+            counts = file_logs.type_counts[LOG_TYPE_CODES[log_type]]
             if counts > 0:
                 print("        " + log_type + ": " + str(counts))
         print("")
 
+        if file_logs.dropped:
+            print("        Logs not kept (over " + str(MAX_LOGS_PER_FILE) + " per file): " + str(file_logs.dropped))
+            print("")
+
         print("--------------------------------------------------------")
         print("")
 
 
-def write_final_report(path_arr, num_files):
+def get_log_counts():
 
     level_counts = {}
     for log_level in LOG_LEVELS:
@@ -85,10 +222,18 @@ def write_final_report(path_arr, num_files):
     for log_type in LOG_TYPES:
         log_type_counts[log_type] = 0
 
-    for path in LOGS:
-        for log in LOGS[path]:
-            level_counts[log["level"]] += 1
-            log_type_counts[log["type"]] += 1
+    for file_logs in LOGS.values():
+        for log_level in LOG_LEVELS:
+            level_counts[log_level] += file_logs.level_counts[LOG_LEVEL_CODES[log_level]]
+        for log_type in LOG_TYPES:
+            log_type_counts[log_type] += file_logs.type_counts[LOG_TYPE_CODES[log_type]]
+
+    return level_counts, log_type_counts
+
+
+def write_final_report(path_arr, num_files):
+
+    level_counts, log_type_counts = get_log_counts()
 
     print("--------------------------------------------------------")
     print("    SKD VALIDATION REPORT:")
@@ -110,3 +255,127 @@ def write_final_report(path_arr, num_files):
 
     print("--------------------------------------------------------")
     print("")
+
+
+def get_serialized_logs():
+    """
+    Return the logs by path, with the kept records as [level, type, message]
+    and the counters by level and type, including the records not kept.
+    """
+    logs = {}
+    for path_id, file_logs in LOGS.items():
+        logs[PATHS[path_id]] = {"records": [[log.level, log.type, log.message] for log in file_logs.records],
+                                "level_counts": {log_level: file_logs.level_counts[code]
+                                                 for log_level, code in LOG_LEVEL_CODES.items()
+                                                 if file_logs.level_counts[code]},
+                                "type_counts": {log_type: file_logs.type_counts[code]
+                                                for log_type, code in LOG_TYPE_CODES.items()
+                                                if file_logs.type_counts[code]}}
+
+    return logs
+
+
+def add_serialized_logs(path, logs):
+
+    file_logs = LOGS[get_path_id(path)]
+
+    for level, l_type, message in logs["records"]:
+        if MAX_LOGS_PER_FILE is None or len(file_logs.records) < MAX_LOGS_PER_FILE:
+            file_logs.records.append(LogRecord(LOG_LEVEL_CODES[level], LOG_TYPE_CODES[l_type], message, ()))
+
+    for log_level, counts in logs["level_counts"].items():
+        file_logs.level_counts[LOG_LEVEL_CODES[log_level]] += counts
+    for log_type, counts in logs["type_counts"].items():
+        file_logs.type_counts[LOG_TYPE_CODES[log_type]] += counts
+
+
+def write_partial_report(report_file, path_arr, num_files, shard, shards, valid):
+    """
+    Write the logs and counters of a validation shard to ``report_file``,
+    to be combined with the ones of the other shards by
+    ``merge_partial_reports``.
+    """
+    level_counts, log_type_counts = get_log_counts()
+
+    report = {"version": PARTIAL_REPORT_VERSION,
+              "paths": path_arr,
+              "shard": shard,
+              "shards": shards,
+              "num_files": num_files,
+              "valid": valid,
+              "level_counts": level_counts,
+              "type_counts": log_type_counts,
+              "logs": get_serialized_logs()}
+
+    with open(report_file, "w") as f:
+        json.dump(report, f)
+
+    print("Partial report of shard " + str(shard) + "/" + str(shards) + " written to: " + report_file)
+
+
+def merge_partial_reports(report_files, summary_file=None):
+    """
+    Combine the partial reports of the shards of a validation into
+    ``LOGS``, write the final report and, optionally, a JSON summary to
+    ``summary_file``.
+
+    :return: dict
+       The summary: paths, number of files, shards found and missing, if
+       all the files are valid and the counters by level and type.
+    """
+    path_arr = []
+    num_files = 0
+    shards = None
+    found_shards = []
+    valid = True
+
+    for report_file in report_files:
+        with open(report_file, "r") as f:
+            report = json.load(f)
+
+        if report.get("version") != PARTIAL_REPORT_VERSION:
+            raise Exception("Unsupported partial report version at: " + report_file)
+
+        if shards is None:
+            shards = report["shards"]
+        elif report["shards"] != shards:
+            raise Exception("Partial report of a different number of shards: " + report_file)
+
+        if report["shard"] in found_shards:
+            raise Exception("Duplicated partial report of shard " + str(report["shard"]) + ": " + report_file)
+        found_shards.append(report["shard"])
+
+        for path in report["paths"]:
+            if path not in path_arr:
+                path_arr.append(path)
+
+        num_files += report["num_files"]
+        valid = valid and report["valid"]
+
+        for path, logs in report["logs"].items():
+            add_serialized_logs(path, logs)
+
+    missing_shards = [shard for shard in range(1, (shards or 0) + 1) if shard not in found_shards]
+    if missing_shards:
+        print("Warning: Missing partial reports of shards: " + str(missing_shards))
+
+    write_final_report(path_arr, num_files)
+
+    level_counts, log_type_counts = get_log_counts()
+    summary = {"paths": path_arr,
+               "num_files": num_files,
+               "shards": shards,
+               "found_shards": sorted(found_shards),
+               "missing_shards": missing_shards,
+               "valid": valid and not missing_shards,
+               "invalid_files": sorted(PATHS[path_id] for path_id, file_logs in LOGS.items()
+                                       if file_logs.level_counts[LOG_LEVEL_CODES[LOG_LEVEL_ERROR]]),
+               "level_counts": level_counts,
+               "type_counts": {log_type: counts for log_type, counts in log_type_counts.items() if counts}}
+
+    if summary_file is not None:
+        with open(summary_file, "w") as f:
+            json.dump(summary, f, indent=2)
+        print("Summary written to: " + summary_file)
+
+    return summary
@@ -0,0 +1,309 @@
+import hashlib
+import json
+import os
+import shutil
+
+#
+# Incremental generation of the SPIVAL status index in ``index_path``. A
+# manifest keeps the published reports and the hashes of the copied assets,
+# so that a run only copies the assets that changed and only rewrites the
+# index pages affected by new or removed reports.
+#
+# Existing files are rewritten in place, which does not change the
+# modification time of the directory: that time tells if reports were
+# added or removed since the last update.
+#
+MANIFEST_FILE = '.spival_index.json'
+MANIFEST_VERSION = 1
+
+STATUS_URL = 'http://spice.esac.esa.int/status/'
+PAGE_SIZE = 100
+
+#
+# Report name prefix, placeholder of the summary page and summary page of
+# every mission.
+#
+MISSIONS = {'ExoMars2016': ('ExoMars2016_', '{ExoMars2016}', 'index_former.html'),
+            'BepiColombo': ('BEPICOLOMBO_', '{BepiColombo}', 'index_former.html'),
+            'JUICE': ('JUICE_', '{JUICE}', 'index_former.html'),
+            'Mars-Express': ('MARS-EXPRESS_', '{Mars-Express}', 'index_former.html'),
+            'Solar-Orbiter': ('SOLO_', '{Solar-Orbiter}', 'index_former.html'),
+            'adcsng': ('adcsng_v', '{adcsng}', 'index_adcsng_former.html')}
+
+SUMMARY_TEMPLATES = {'index_former.html': 'templates/index_former.html',
+                     'index_adcsng_former.html': 'templates/index_adcsng_former.html'}
+PAGE_TEMPLATE = 'templates/index_former_page.html'
+
+
+def update_status_index(index_path, root_dir, page_size=PAGE_SIZE):
+    """
+    Update the status index: copy the changed assets, register the new
+    reports and rewrite the affected pages. The summary pages list the
+    latest ``page_size`` reports of each mission and link to the paginated
+    pages of the mission, numbered from the oldest reports, so that new
+    reports only change the last page.
+    """
+    manifest = load_manifest(index_path, page_size)
+
+    templates_changed = copy_assets(index_path, root_dir, manifest)
+
+    #
+    # The reports are only listed again when the directory changed since
+    # the last update.
+    #
+    directory_mtime = os.stat(index_path).st_mtime_ns
+    first_changed_pages = {}
+    if directory_mtime != manifest['directory_mtime'] or templates_changed:
+        first_changed_pages = register_reports(index_path, manifest)
+
+    if templates_changed:
+        first_changed_pages = {mission: 0 for mission in MISSIONS}
+
+    if not first_changed_pages and not manifest['changed'] \
+            and directory_mtime == manifest['directory_mtime']:
+        return
+
+    for mission, first_page in first_changed_pages.items():
+        write_mission_pages(index_path, root_dir, manifest, mission, first_page)
+
+    summaries = set(MISSIONS[mission][2] for mission in first_changed_pages)
+    for summary in sorted(summaries):
+        write_summary(index_path, root_dir, manifest, summary)
+
+    manifest['directory_mtime'] = directory_mtime
+    save_manifest(index_path, manifest)
+
+    return
+
+
+def load_manifest(index_path, page_size):
+
+    manifest = {'version': MANIFEST_VERSION,
+                'page_size': page_size,
+                'directory_mtime': None,
+                'assets': {},
+                'reports': {mission: [] for mission in MISSIONS},
+                'entries': {},
+                'changed': True}
+
+    try:
+        with open(os.path.join(index_path, MANIFEST_FILE), 'r') as f:
+            cached = json.load(f)
+    except (OSError, ValueError):
+        return manifest
+
+    if cached.get('version') == MANIFEST_VERSION and cached.get('page_size') == page_size:
+        manifest.update(cached)
+        for mission in MISSIONS:
+            manifest['reports'].setdefault(mission, [])
+        manifest['changed'] = False
+
+    return manifest
+
+
+def save_manifest(index_path, manifest):
+
+    manifest = dict(manifest)
+    manifest.pop('changed')
+
+    write_file(os.path.join(index_path, MANIFEST_FILE), json.dumps(manifest))
+
+    return
+
+
+def write_file(file, text):
+
+    with open(file, 'w') as f:
+        f.write(text)
+
+    return
+
+
+def get_file_hash(file):
+
+    md5 = hashlib.md5()
+    with open(file, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            md5.update(chunk)
+
+    return md5.hexdigest()
+
+
+def copy_assets(index_path, root_dir, manifest):
+    """
+    Copy the images and the index/spival pages whose hash differs from the
+    one of the last copy. Returns True if a page template changed, in which
+    case all the index pages have to be written again.
+    """
+    assets = []
+    with os.scandir(os.path.join(root_dir, 'images')) as it:
+        for dir_entry in it:
+            if dir_entry.is_file():
+                assets.append((dir_entry.path, dir_entry.name))
+    assets.append((os.path.join(root_dir, 'templates/index.html'), 'index.html'))
+    assets.append((os.path.join(root_dir, 'templates/spival.html'), 'spival.html'))
+
+    for source, name in assets:
+        file_hash = get_file_hash(source)
+        if manifest['assets'].get(name) != file_hash or not os.path.isfile(os.path.join(index_path, name)):
+            shutil.copy(source, os.path.join(index_path, name))
+            manifest['assets'][name] = file_hash
+            manifest['changed'] = True
+
+    templates_changed = False
+    for template in list(SUMMARY_TEMPLATES.values()) + [PAGE_TEMPLATE]:
+        file_hash = get_file_hash(os.path.join(root_dir, template))
+        if manifest['assets'].get(template) != file_hash:
+            manifest['assets'][template] = file_hash
+            templates_changed = True
+
+    for summary in SUMMARY_TEMPLATES:
+        if not os.path.isfile(os.path.join(index_path, summary)):
+            templates_changed = True
+
+    return templates_changed
+
+
+def register_reports(index_path, manifest):
+    """
+    List the reports of ``index_path`` in a single pass and update the
+    manifest. Returns, for every mission with new or removed reports, the
+    first page affected by the change.
+    """
+    current = {mission: {} for mission in MISSIONS}
+    with os.scandir(index_path) as it:
+        for dir_entry in it:
+            name = dir_entry.name
+            if not name.endswith('.html'):
+                continue
+            for mission, (prefix, placeholder, summary) in MISSIONS.items():
+                if name.startswith(prefix):
+                    current[mission][name] = dir_entry
+                    break
+
+    page_size = manifest['page_size']
+    first_changed_pages = {}
+    for mission in MISSIONS:
+        reports = manifest['reports'][mission]
+        known = set(reports)
+        new = [name for name in current[mission] if name not in known]
+        removed = [name for name in reports if name not in current[mission]]
+        if not new and not removed:
+            continue
+
+        #
+        # New reports are normally the latest ones and are appended, only
+        # the pages from the first position that changed are rewritten.
+        #
+        changed = sorted(new + removed)[0]
+        if removed:
+            removed_set = set(removed)
+            reports = [name for name in reports if name not in removed_set]
+            for name in removed:
+                manifest['entries'].pop(name, None)
+        reports = sorted(reports + new)
+        manifest['reports'][mission] = reports
+
+        for name in new:
+            manifest['entries'][name] = {'mission': mission,
+                                         'version': name[len(MISSIONS[mission][0]):-len('.html')],
+                                         'mtime': current[mission][name].stat().st_mtime_ns}
+
+        position = 0
+        while position < len(reports) and reports[position] < changed:
+            position += 1
+        first_changed_pages[mission] = position // page_size
+
+    return first_changed_pages
+
+
+def get_page_name(mission, page):
+
+    return 'index_former_' + mission + '_' + str(page + 1) + '.html'
+
+
+def get_report_links(reports):
+
+    # Latest reports first
+    return ''.join('<p><a href="{}{}">{}</a></p>'.format(STATUS_URL, html, html.split('.')[0])
+                   for html in reversed(reports))
+
+
+def get_page_links(mission, pages, current=None):
+
+    links = []
+    for page in range(pages):
+        if page == current:
+            links.append('<b>{}</b>'.format(page + 1))
+        else:
+            links.append('<a href="{}">{}</a>'.format(get_page_name(mission, page), page + 1))
+
+    return '<p>' + ' '.join(links) + '</p>' if pages > 1 or current is None else ''
+
+
+def fill_lines(template, replacements):
+    #
+    # As for the original index pages, a template line with a placeholder
+    # is replaced by the corresponding content.
+    #
+    lines = []
+    with open(template, 'r') as f:
+        for line in f:
+            for placeholder, content in replacements.items():
+                if placeholder in line:
+                    line = content
+                    break
+            lines.append(line)
+
+    return ''.join(lines)
+
+
+def write_mission_pages(index_path, root_dir, manifest, mission, first_page):
+
+    reports = manifest['reports'][mission]
+    page_size = manifest['page_size']
+    pages = (len(reports) + page_size - 1) // page_size
+
+    #
+    # The page links of all the pages change when the number of pages does.
+    #
+    if pages != manifest.get('pages', {}).get(mission):
+        first_page = 0
+    manifest.setdefault('pages', {})[mission] = pages
+
+    for page in range(first_page, pages):
+        page_reports = reports[page * page_size:(page + 1) * page_size]
+        title = 'Former Versions of {} Reports ({}/{})'.format(mission, page + 1, pages)
+        write_file(os.path.join(index_path, get_page_name(mission, page)),
+                     fill_lines(os.path.join(root_dir, PAGE_TEMPLATE),
+                                {'{title}': title + '\n',
+                                 '{pages}': get_page_links(mission, pages, page) + '\n',
+                                 '{reports}': get_report_links(page_reports) + '\n'}))
+
+    # Pages left over by removed reports
+    page = pages
+    while os.path.isfile(os.path.join(index_path, get_page_name(mission, page))):
+        os.remove(os.path.join(index_path, get_page_name(mission, page)))
+        page += 1
+
+    return
+
+
+def write_summary(index_path, root_dir, manifest, summary):
+
+    page_size = manifest['page_size']
+    replacements = {}
+    for mission, (prefix, placeholder, mission_summary) in MISSIONS.items():
+        if mission_summary != summary:
+            continue
+
+        reports = manifest['reports'][mission]
+        content = get_report_links(reports[-page_size:])
+        if len(reports) > page_size:
+            content += get_page_links(mission, manifest['pages'][mission])
+        replacements[placeholder] = content
+
+    write_file(os.path.join(index_path, summary),
+                 fill_lines(os.path.join(root_dir, SUMMARY_TEMPLATES[summary]), replacements))
+
+    return
@@ -1,5 +1,9 @@
-from os import remove, path
-import bs4
+import os
+import re
+import shutil
+from tempfile import mkstemp
+
+from spival.utils.post_processing import post_process_html
 
 
 def kernel_extension2type(kernel_extension):
@@ -37,96 +41,103 @@ def kernel_type(kernel):
     return kernel_type
 
 
-def fill_template(template,
-                  file,
-                  replacements,
-                  cleanup=False):
-    #
-    # If the temp   late file is equal to the output file then we need to create a temporary template - which will be
-    # a duplicate - in order to write in the file. A situation where we would like to have them be the same is
-    # for example if we call this function several times in a row, replacing keywords in the template in steps
-    #
-    if template == file:
-        with open(file, 'r') as f:
-            with open('fill_template.temp', "w+") as t:
-                for line in f:
-                    t.write(line)
-
-        template = 'fill_template.temp'
-
-    with open(file, "w+") as f:
-        #
-        # Items are replaced as per correspondence in between the replacements dictionary
-        #
-        with open(template, 'r') as t:
-            for line in t:
-                if '{' in line:
-                    for k, v in replacements.items():
-                        if '{' + k + '}' in line: line = line.replace('{' + k + '}', v)
-                f.write(line)
+#
+# Compiled templates by path: ((modification time, size), segments). The segments
+# alternate literal text (even indexes) and placeholder names (odd indexes).
+#
+COMPILED_TEMPLATES = {}
+PLACEHOLDER_REGEX = re.compile(r'\{([^{}\s]+)\}')
+
+
+def compile_template(template):
+    """
+    Parse a template once into literal and placeholder segments. The result
+    is cached by path and modification time, so a template used to render
+    several outputs is read and parsed only once.
+    """
+    stat = os.stat(template)
+    mtime = (stat.st_mtime_ns, stat.st_size)
+    cached = COMPILED_TEMPLATES.get(template)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+
+    with open(template, 'r') as t:
+        text = t.read()
+
+    segments = []
+    position = 0
+    for match in PLACEHOLDER_REGEX.finditer(text):
+        segments.append(text[position:match.start()])
+        segments.append(match.group(1))
+        position = match.end()
+    segments.append(text[position:])
+
+    COMPILED_TEMPLATES[template] = (mtime, segments)
+
+    return segments
+
+
+def render_template(template, replacements, cleanup=False):
+    """
+    Return the text of the template with every {KEYWORD} placeholder that
+    exists in ``replacements`` replaced by its value; unknown placeholders
+    are kept. If ``cleanup`` is set, the lines that still contain a
+    placeholder (they should be optional) are removed.
+    """
+    segments = compile_template(template)
+
+    parts = list(segments)
+    for idx in range(1, len(parts), 2):
+        name = parts[idx]
+        if name in replacements:
+            parts[idx] = str(replacements[name])
+        else:
+            parts[idx] = '{' + name + '}'
+    text = ''.join(parts)
 
-    #
-    # If the option cleanup is set as true, we remove the keyword assignments in the filled templated which are
-    # unfilled (they should be optional)
-    #
     if cleanup:
+        text = ''.join(line for line in text.splitlines(keepends=True) if '{' not in line)
 
-        with open(file, 'r') as f:
-            with open('fill_template.temp', 'w+') as t:
-                for line in f:
-                    t.write(line)
-
-        template = 'fill_template.temp'
-
-        with open(file, 'w+') as f:
-            with open('fill_template.temp', 'r') as t:
-                for line in t:
-                    if '{' not in line:
-                        f.write(line)
-
-    #
-    # The temporary files are removed
-    #
-    if path.isfile('fill_template.temp'):
-        remove('fill_template.temp')
-
-
-def post_process_html(html_file):
-
-    if not path.isfile(html_file):
-        print("Invalid file: " + html_file)
-        return
+    return text
 
-    print("Post-processing file: " + html_file)
 
-    # load the file
-    with open(html_file) as inf:
-        txt = inf.read()
-        soup = bs4.BeautifulSoup(txt, "html.parser")
+def get_umask():
+    umask = os.umask(0)
+    os.umask(umask)
+    return umask
 
-    # Move validation results to top of the page
-    val_res_div = soup.find(id="validation_results""")
-    if not val_res_div:
-        print("Div with id='validation_results' not found!")
-        return
 
-    first_p = soup.find("p")
-    if not first_p:
-        print("Cannot find the first 'p' to use for insertAfter!")
-        return
-
-    first_p.append(val_res_div)
-
-    # save the file again
-    with open(html_file, "w") as outf:
-        outf.write(str(soup))
+def write_atomic(file, text):
+    """
+    Write ``text`` to a unique temporary file next to ``file`` and then
+    rename it, so that readers and concurrent runs never see partial files.
+    The mode of an existing ``file`` is kept, new files get the default mode
+    of the umask.
+    """
+    directory = os.path.dirname(os.path.abspath(file))
+    fh, tmp_path = mkstemp(dir=directory, prefix='.' + os.path.basename(file) + '.', suffix='.tmp')
+    try:
+        with os.fdopen(fh, 'w') as f:
+            f.write(text)
+        if os.path.exists(file):
+            shutil.copymode(file, tmp_path)
+        else:
+            os.chmod(tmp_path, 0o666 & ~get_umask())
+        os.replace(tmp_path, file)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
 
-    # Generate a new html file with only the validation results
-    soup2 = bs4.BeautifulSoup("", "html.parser")
-    soup2.append(soup.find("h1"))
-    soup2.append(soup.find("p"))
-    soup2.find("a").clear()
-    with open(html_file.replace(".html", "_results.html"), "w") as outf:
-        outf.write(str(soup2))
-    return soup2
 
+def fill_template(template,
+                  file,
+                  replacements,
+                  cleanup=False):
+    #
+    # The template is compiled (or taken from the cache) before the output
+    # is written, so the template file and the output file can be the same,
+    # e.g. when keywords are replaced in steps calling this function several
+    # times in a row.
+    #
+    write_atomic(file, render_template(template, replacements, cleanup))